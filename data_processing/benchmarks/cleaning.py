@@ -0,0 +1,75 @@
+"""
+Compares clean_data.full_clense against the previous row-by-row implementation: wall-clock time,
+peak memory allocated during cleaning (tracemalloc), and whether the outputs match.
+
+Run from the data_processing folder after load_and_clean_data.py has stacked the raw CSVs:
+    python benchmarks/cleaning.py
+    python benchmarks/cleaning.py --csv data/nba/2023_nba_shot.csv
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_cleaning_library import clean_data
+
+def legacy_clense(df):
+    """
+    the cleaning steps as they were before vectorization, kept here as the baseline
+    """
+    def extract_date(match_id):
+        return f"{match_id[4:6]}/{match_id[6:8]}/{match_id[:4]}"
+
+    df['date'] = df['match_id'].apply(extract_date)
+    df['year'] = df['match_id'].apply(lambda id: int(id[:4]))
+    df = df[['date','year','match_id','shotX','shotY','quarter','player','team','made','distance','shot_type']]
+    df = df.copy()
+    df.loc[:, 'game_location'] = df['match_id'].str.replace('[^a-zA-Z]', '', regex=True)
+    df = df[['date','year','game_location','shotX','shotY','quarter','player','team','made','distance','shot_type']]
+    df = df.copy()
+    df.loc[:, 'quarter'] = df['quarter'].str.replace('[^0-9]', '', regex=True)
+    df = df.copy()
+    df.loc[:, 'shot_type'] = df['shot_type'].str.replace('[^0-9]', '', regex=True)
+    return clean_data.assign_zone(clean_data.__new__(clean_data), df)
+
+def vectorized_clense(df):
+    cleaner = clean_data.__new__(clean_data)
+    cleaner.df = df
+    return cleaner.full_clense()
+
+def measure(clense, raw_df):
+    df = raw_df.copy()
+    start_time = time.perf_counter()
+    result = clense(df)
+    elapsed = time.perf_counter() - start_time
+
+    df = raw_df.copy()
+    tracemalloc.start()
+    clense(df)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--csv', default='data/combined_dataset.csv')
+    args = parser.parse_args()
+
+    raw_df = pd.read_csv(args.csv)
+    print(f'{len(raw_df):,} rows from {args.csv}')
+
+    legacy_df, legacy_time, legacy_peak = measure(legacy_clense, raw_df)
+    new_df, new_time, new_peak = measure(vectorized_clense, raw_df)
+
+    print(f'{"":>10}  {"time":>10}  {"peak memory":>14}')
+    print(f'{"legacy":>10}  {legacy_time:>8.2f} s  {legacy_peak / 1e6:>11.1f} MB')
+    print(f'{"vectorized":>10}  {new_time:>8.2f} s  {new_peak / 1e6:>11.1f} MB')
+
+    # quarter and shot_type used to stay strings until the CSV round trip, so compare as text
+    matches = legacy_df.reset_index(drop=True).astype(str).equals(new_df.reset_index(drop=True).astype(str))
+    print(f'Outputs match: {matches}')
+    if not matches:
+        sys.exit(1)
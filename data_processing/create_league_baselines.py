@@ -0,0 +1,72 @@
+import argparse
+import sqlite3
+import time
+
+# League shooting per season for the web app's "vs. league average" shot map, so a request only has to
+# look up the league's FG% for each of the selected shots instead of aggregating every shot in the league.
+# Cells are the finest grid of webapp/shot_binning.py: 5 tenths of a foot square, counted from the corner
+# of the court, with shots on the far edges counted in the last cell.
+CELL_SIZE = 5
+COURT_WIDTH_TENTHS = 500
+COURT_LENGTH_TENTHS = 470
+
+def create_league_baseline_tables(cursor):
+    last_x = COURT_WIDTH_TENTHS // CELL_SIZE - 1
+    last_y = COURT_LENGTH_TENTHS // CELL_SIZE - 1
+    cursor.executescript(f"""
+        DROP TABLE IF EXISTS league_baseline_cells;
+        CREATE TABLE league_baseline_cells (
+            year INTEGER,
+            cell_x INTEGER,
+            cell_y INTEGER,
+            attempts INTEGER,
+            makes INTEGER,
+            PRIMARY KEY (year, cell_x, cell_y)
+        ) WITHOUT ROWID;
+        INSERT INTO league_baseline_cells
+        select
+            year,
+            min(shotX_tenths / {CELL_SIZE}, {last_x}) as cell_x,
+            min(shotY_tenths / {CELL_SIZE}, {last_y}) as cell_y,
+            count(*) as attempts,
+            sum(made) as makes
+        from shots
+        where
+            shotX_tenths between 0 and {COURT_WIDTH_TENTHS}
+            and shotY_tenths between 0 and {COURT_LENGTH_TENTHS}
+        group by year, cell_x, cell_y;
+
+        -- zones from clean_data.assign_zone, for cells with too few league shots to go by
+        DROP TABLE IF EXISTS league_baseline_zones;
+        CREATE TABLE league_baseline_zones (
+            year INTEGER,
+            zone INTEGER,
+            attempts INTEGER,
+            makes INTEGER,
+            PRIMARY KEY (year, zone)
+        ) WITHOUT ROWID;
+        INSERT INTO league_baseline_zones
+        select year, zone, count(*) as attempts, sum(made) as makes
+        from shots
+        group by year, zone;
+    """)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default='data/nba_shots.db')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    print('Connected to SQLite DB.')
+
+    print('Aggregating league baselines per season...')
+    start_time = time.time()
+    cursor = conn.cursor()
+    create_league_baseline_tables(cursor)
+    conn.commit()
+    cells, seasons = conn.execute('select count(*), count(distinct year) from league_baseline_cells').fetchone()
+    zones = conn.execute('select count(*) from league_baseline_zones').fetchone()[0]
+    print(f'{cells:,} cells and {zones:,} zones over {seasons} seasons in {time.time() - start_time:.1f} sec')
+    conn.close()
+
+    print('Done.')
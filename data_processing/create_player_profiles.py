@@ -1,14 +1,20 @@
+import json
 import pandas as pd
 import sqlite3
 
+# zones from clean_data.assign_zone, 0 (outside all of them) to 16
+NUM_ZONES = 17
+# distance buckets (feet) are split at these distances: under 4, 4 to 9, ..., 30 and over
+DISTANCE_BUCKETS = [4, 10, 16, 22, 26, 30]
+
 def create_player_profiles(conn, by_team=False, by_year=False):
     sql_query = f"""
         select 
-            player,
-            {'team,' if by_team else ''}
-            {'year,' if by_year else ''}
+            players.player,
+            {'teams.team,' if by_team else ''}
+            {'shots.year,' if by_year else ''}
             avg(distance) as avg_distance,
-            avg(shotX) as avg_shotX,
+            avg(shotX_tenths) / 10.0 as avg_shotX,
             avg(made) as accuracy,
             sum(case when made = 1 then 1 else 0 end) as total_makes,
             sum(case when (made = 1 and quarter = 1) then 1 else 0 end) as q1_makes,
@@ -16,14 +22,53 @@ def create_player_profiles(conn, by_team=False, by_year=False):
             sum(case when (made = 1 and quarter = 3) then 1 else 0 end) as q3_makes,
             sum(case when (made = 1 and quarter = 4) then 1 else 0 end) as q4_makes
         from shots
-        where trim(player) <> 'made' and trim(player) <> 'missed'
+        join players on players.player_id = shots.player_id
+        join teams on teams.team_id = shots.team_id
+        where trim(players.player) <> 'made' and trim(players.player) <> 'missed'
         group by
-            {'team,' if by_team else ''}
-            {'year,' if by_year else ''}
-            player
+            {'teams.team,' if by_team else ''}
+            {'shots.year,' if by_year else ''}
+            players.player
     """
     return pd.read_sql(sql_query, conn)
 
+def create_shot_diet_profiles(conn, by_team=False, by_year=False):
+    """
+    returns the profile keys with zone_attempts and distance_attempts: JSON lists of the attempts
+    in each zone and in each distance bucket, indexed by zone and bucket
+    """
+    keys = ['player'] + (['team'] if by_team else []) + (['year'] if by_year else [])
+    distance_bucket = ' '.join(f'when distance < {edge} then {i}' for i, edge in enumerate(DISTANCE_BUCKETS))
+    sql_query = f"""
+        select
+            players.player,
+            {'teams.team,' if by_team else ''}
+            {'shots.year,' if by_year else ''}
+            zone,
+            case {distance_bucket} else {len(DISTANCE_BUCKETS)} end as distance_bucket,
+            count(*) as attempts
+        from shots
+        join players on players.player_id = shots.player_id
+        join teams on teams.team_id = shots.team_id
+        where trim(players.player) <> 'made' and trim(players.player) <> 'missed'
+        group by
+            {'teams.team,' if by_team else ''}
+            {'shots.year,' if by_year else ''}
+            players.player,
+            zone,
+            distance_bucket
+    """
+    attempts = pd.read_sql(sql_query, conn)
+    profiles = None
+    for column, buckets, name in [('zone', NUM_ZONES, 'zone_attempts'), ('distance_bucket', len(DISTANCE_BUCKETS) + 1, 'distance_attempts')]:
+        counts = (
+            attempts.pivot_table(index=keys, columns=column, values='attempts', aggfunc='sum', fill_value=0)
+            .reindex(columns=range(buckets), fill_value=0)
+        )
+        vectors = pd.DataFrame({name: [json.dumps(row) for row in counts.values.tolist()]}, index=counts.index)
+        profiles = vectors if profiles is None else profiles.join(vectors)
+    return profiles.reset_index()
+
 def create_player_profile_tables(cursor):
     cursor.executescript(
         """
@@ -37,7 +82,9 @@ def create_player_profile_tables(cursor):
                 q2_makes INTEGER,
                 q3_makes INTEGER,
                 q4_makes INTEGER,
-                top_quarter INTEGER
+                top_quarter INTEGER,
+                zone_attempts TEXT,
+                distance_attempts TEXT
             );
             CREATE TABLE IF NOT EXISTS player_profiles_by_team (
                 player TEXT,
@@ -50,7 +97,9 @@ def create_player_profile_tables(cursor):
                 q2_makes INTEGER,
                 q3_makes INTEGER,
                 q4_makes INTEGER,
-                top_quarter INTEGER
+                top_quarter INTEGER,
+                zone_attempts TEXT,
+                distance_attempts TEXT
             );
             CREATE TABLE IF NOT EXISTS player_profiles_by_year (
                 player TEXT,
@@ -63,7 +112,9 @@ def create_player_profile_tables(cursor):
                 q2_makes INTEGER,
                 q3_makes INTEGER,
                 q4_makes INTEGER,
-                top_quarter INTEGER
+                top_quarter INTEGER,
+                zone_attempts TEXT,
+                distance_attempts TEXT
             );
             CREATE TABLE IF NOT EXISTS player_profiles_by_team_and_year (
                 player TEXT,
@@ -77,7 +128,9 @@ def create_player_profile_tables(cursor):
                 q2_makes INTEGER,
                 q3_makes INTEGER,
                 q4_makes INTEGER,
-                top_quarter INTEGER
+                top_quarter INTEGER,
+                zone_attempts TEXT,
+                distance_attempts TEXT
             );
         """
     )
@@ -89,6 +142,11 @@ def create_player_profile_indexes(cursor):
             CREATE INDEX IF NOT EXISTS idx_pprof_team ON player_profiles_by_team(player, team);
             CREATE INDEX IF NOT EXISTS idx_pprof_year ON player_profiles_by_year(player, year);
             CREATE INDEX IF NOT EXISTS idx_pprof_team_year ON player_profiles_by_team_and_year(player, team, year);
+            -- for the dropdown option queries filtered by team or year, in the order each dropdown lists its options
+            CREATE INDEX IF NOT EXISTS idx_pprof_team_year_team_player ON player_profiles_by_team_and_year(team, player);
+            CREATE INDEX IF NOT EXISTS idx_pprof_team_year_team_year ON player_profiles_by_team_and_year(team, year);
+            CREATE INDEX IF NOT EXISTS idx_pprof_team_year_year_player ON player_profiles_by_team_and_year(year, player);
+            CREATE INDEX IF NOT EXISTS idx_pprof_team_year_year_team ON player_profiles_by_team_and_year(year, team);
         """
     )
 
@@ -113,6 +171,14 @@ if __name__ == '__main__':
     player_profiles_by_year['top_quarter'] = player_profiles_by_year.apply(get_mode_quarter_makes, axis=1)
     player_profiles_by_team_and_year['top_quarter'] = player_profiles_by_team_and_year.apply(get_mode_quarter_makes, axis=1)
 
+    print('Adding shot diet profiles...')
+    player_profiles = player_profiles.merge(create_shot_diet_profiles(conn), on=['player'], how='left')
+    player_profiles_by_team = player_profiles_by_team.merge(create_shot_diet_profiles(conn, by_team=True), on=['player', 'team'], how='left')
+    player_profiles_by_year = player_profiles_by_year.merge(create_shot_diet_profiles(conn, by_year=True), on=['player', 'year'], how='left')
+    player_profiles_by_team_and_year = player_profiles_by_team_and_year.merge(
+        create_shot_diet_profiles(conn, by_team=True, by_year=True), on=['player', 'team', 'year'], how='left'
+    )
+
     print('Writing tables...')
     cursor = conn.cursor()
     create_player_profile_tables(cursor)
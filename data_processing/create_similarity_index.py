@@ -0,0 +1,58 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+# The webapp's index code, so the indexes stored here are read back by the same code that built them
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'webapp'))
+import similarity_index
+
+def create_similarity_index_table(conn, n_components=None):
+    """
+    builds a shot diet index for each profile table (see webapp/similarity_index.py) and stores them in similarity_index
+    """
+    conn.executescript("""
+        DROP TABLE IF EXISTS similarity_index;
+        CREATE TABLE similarity_index (
+            level TEXT PRIMARY KEY,
+            rows INTEGER,
+            dimensions INTEGER,
+            data BLOB
+        );
+    """)
+    for level, (table, keys) in similarity_index.LEVELS.items():
+        start_time = time.time()
+        profiles = pd.read_sql(f'select {", ".join(keys)}, zone_attempts, distance_attempts from {table}', conn)
+        X = similarity_index.shot_diet_vectors(
+            profiles['zone_attempts'].map(json.loads).tolist(),
+            profiles['distance_attempts'].map(json.loads).tolist(),
+        )
+        key_values = {key: profiles[key].to_numpy(dtype=str if key != 'year' else np.int64) for key in keys}
+        index = similarity_index.build_index(key_values, X, n_components)
+        conn.execute(
+            'INSERT INTO similarity_index VALUES (?, ?, ?, ?)',
+            (level, len(X), index['vectors'].shape[1], similarity_index.to_bytes(index))
+        )
+        print(f'  {level}: {len(X):,} rows, {index["vectors"].shape[1]} dimensions, '
+              f'{len(index["centroids"])} clusters in {time.time() - start_time:.1f} sec')
+    conn.commit()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default='data/nba_shots.db')
+    parser.add_argument('--pca', type=int, default=0, metavar='COMPONENTS',
+                        help='reduce the vectors to this many principal components (default: keep them all)')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    print('Connected to SQLite DB.')
+
+    print('Building shot diet similarity indexes...')
+    create_similarity_index_table(conn, args.pca or None)
+    conn.close()
+
+    print('Done.')
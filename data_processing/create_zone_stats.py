@@ -0,0 +1,62 @@
+import argparse
+import itertools
+import sqlite3
+import time
+
+# Attempts, makes and points per zone (from clean_data.assign_zone) for every player/team/year filter the
+# web app offers, so a zone view is a lookup of at most one row per zone instead of a scan of the shots.
+# A NULL player, team or year stands for all of them, like the dropdowns' "all" option.
+
+def zone_stats_query(by_player, by_team, by_year):
+    group_by = [column for column, used in [('players.player', by_player), ('teams.team', by_team), ('shots.year', by_year)] if used]
+    return f"""
+        select
+            {'players.player' if by_player else 'null'} as player,
+            {'teams.team' if by_team else 'null'} as team,
+            {'shots.year' if by_year else 'null'} as year,
+            zone,
+            count(*) as attempts,
+            sum(made) as makes,
+            sum(made * shot_type) as points
+        from shots
+        join players on players.player_id = shots.player_id
+        join teams on teams.team_id = shots.team_id
+        group by {', '.join(group_by + ['zone'])}
+    """
+
+def create_zone_stats_table(cursor):
+    cursor.executescript("""
+        DROP TABLE IF EXISTS zone_stats;
+        CREATE TABLE zone_stats (
+            player TEXT,
+            team TEXT,
+            year INTEGER,
+            zone INTEGER,
+            attempts INTEGER,
+            makes INTEGER,
+            points INTEGER
+        );
+    """)
+    for by_player, by_team, by_year in itertools.product([True, False], repeat=3):
+        cursor.execute(f'INSERT INTO zone_stats {zone_stats_query(by_player, by_team, by_year)}')
+    # covering, so the web app's lookups (player is ? and team is ? and year is ?) never read the table
+    cursor.execute('CREATE INDEX idx_zone_stats ON zone_stats(player, team, year, zone, attempts, makes, points)')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default='data/nba_shots.db')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    print('Connected to SQLite DB.')
+
+    print('Aggregating zone stats for every filter...')
+    start_time = time.time()
+    cursor = conn.cursor()
+    create_zone_stats_table(cursor)
+    conn.commit()
+    rows = conn.execute('select count(*) from zone_stats').fetchone()[0]
+    print(f'{rows:,} rows in {time.time() - start_time:.1f} sec')
+    conn.close()
+
+    print('Done.')
@@ -1,3 +1,4 @@
+import re
 import pandas as pd
 
 class clean_data:
@@ -22,11 +23,31 @@ class clean_data:
         return f"{month}/{day}/{year}"  # formatting
 
 
+    def map_unique(self, series, func):
+      """
+      applies func to each distinct value of series instead of to every row. columns like match_id
+      and quarter only have a few thousand distinct values across hundreds of thousands of shots.
+      """
+      codes, uniques = pd.factorize(series)
+      return pd.Series(pd.Index(uniques).map(func).to_numpy()[codes], index=series.index)
+
+    def parse_match_id(self, df):
+      """
+      creates the date, year and game_location columns from match_id in one pass
+      (match_id is YYYYMMDD followed by the home team's letters)
+      """
+      codes, uniques = pd.factorize(df['match_id'])
+      uniques = pd.Series(uniques, dtype=str)
+      df['date'] = uniques.map(self.extract_date).to_numpy()[codes]
+      df['year'] = uniques.str.slice(0, 4).astype('int16').to_numpy()[codes]
+      df['game_location'] = uniques.str.replace('[^a-zA-Z]', '', regex=True).to_numpy()[codes]
+      return df
+
     def get_date_column(self,df):
        """
        create a date column based on match id
        """
-       df['date'] = df['match_id'].apply(self.extract_date)
+       df['date'] = self.map_unique(df['match_id'], self.extract_date)
 
        return df
 
@@ -34,7 +55,7 @@ class clean_data:
        """
        create a year column based on match id
        """
-       df['year'] = df['match_id'].apply(lambda id: int(id[:4]))
+       df['year'] = self.map_unique(df['match_id'], lambda id: int(id[:4])).astype('int16')
 
        return df
 
@@ -48,17 +69,14 @@ class clean_data:
       """
       returns location of game - based on alphabetic characters in match_id
       """
-      df = df.copy()
-      df.loc[:, 'game_location'] = df['match_id'].str.replace('[^a-zA-Z]', '', regex=True)
-      return df[['date','year','game_location','shotX','shotY','quarter','player','team','made','distance','shot_type']]
+      df['game_location'] = self.map_unique(df['match_id'], lambda id: re.sub('[^a-zA-Z]', '', id))
+      return df
 
     def get_quarter(self,df):
       """
       Instead of "1st quarter" - converts quarter column to numeric (i.e. 1)
       """
-      df = df.copy()
-      df.loc[:, 'quarter'] = df['quarter'].str.replace('[^0-9]', '', regex=True)
-
+      df['quarter'] = self.map_unique(df['quarter'], lambda q: int(re.sub('[^0-9]', '', q))).astype('int8')
 
       return df
 
@@ -66,8 +84,7 @@ class clean_data:
       """
       Instead of "2-pointer" or "3-pointer" - convert shot_type column to 2 or 3 (I double checked that the dataset does not include free throws)
       """
-      df = df.copy()
-      df.loc[:, 'shot_type'] = df['shot_type'].str.replace('[^0-9]', '', regex=True)
+      df['shot_type'] = self.map_unique(df['shot_type'], lambda t: int(re.sub('[^0-9]', '', t))).astype('int8')
 
       return df
     
@@ -130,16 +147,16 @@ class clean_data:
       return df
 
     def full_clense(self):
+      """
+      cleans self.df in place, adding columns to it and selecting the output columns once at the end
+      """
       self.assert_columns(self.df)
-      df = self.get_date_column(self.df)
-      df = self.get_year_column(self.df)
-      df = self.remove_columns(df)
-      df = self.get_location(df)
+      df = self.parse_match_id(self.df)
       df = self.get_quarter(df)
       df = self.shot_type(df)
       df = self.assign_zone(df)
 
-      return df
+      return df[['date','year','game_location','shotX','shotY','quarter','player','team','made','distance','shot_type','zone']]
     
 
 if __name__ == "__main__":
@@ -0,0 +1,110 @@
+import argparse
+import itertools
+import os
+import sqlite3
+import sys
+import time
+
+# The webapp's query builders, so the plans checked here are the plans the app actually runs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'webapp'))
+import queries
+
+ALL_VALUES = queries.ALL_VALUES
+
+def tune_database(conn, page_size=8192):
+    """
+    gathers planner statistics, then rebuilds the file with the given page size and no free pages
+    """
+    start_time = time.time()
+    conn.execute('ANALYZE')
+    conn.execute(f'PRAGMA page_size = {int(page_size)}')
+    conn.execute('VACUUM')
+    conn.execute('PRAGMA optimize')
+    print(f'Analyzed and vacuumed in {time.time() - start_time:.1f} sec')
+
+def hot_queries(conn):
+    """
+    yields (description, sql, params) for every filtered query the webapp runs per interaction.
+    unfiltered queries are skipped: they read whole tables by design and are preloaded or cached.
+    """
+    player, team, year = conn.execute("""
+        select player, team, year
+        from player_profiles_by_team_and_year
+        order by player, team, year
+        limit 1
+    """).fetchone()
+
+    # plots.filter_db_data
+    for use_player, use_team, use_year in itertools.product([True, False], repeat=3):
+        if not (use_player or use_team or use_year):
+            continue
+        filters = (player if use_player else ALL_VALUES, team if use_team else ALL_VALUES, year if use_year else ALL_VALUES)
+        yield (f'shots {filters}', *queries.shots_query(*filters))
+        # the app's /export/shots route
+        yield (f'shots export {filters}', *queries.shots_export_query(*filters))
+
+    # profile.update_*_options, each filtered by one or both of the other two dropdowns
+    for column, others in [('player', ['team', 'year']), ('team', ['player_name', 'year']), ('year', ['player_name', 'team'])]:
+        values = {'player_name': player, 'team': team, 'year': year}
+        for use_first, use_second in itertools.product([True, False], repeat=2):
+            if not (use_first or use_second):
+                continue
+            kwargs = {}
+            if use_first:
+                kwargs[others[0]] = values[others[0]]
+            if use_second:
+                kwargs[others[1]] = values[others[1]]
+            yield (f'{column} options {kwargs}', *queries.filter_options_query(column, **kwargs))
+
+    # profile.update_profile_sliders
+    for use_team, use_year in itertools.product([True, False], repeat=2):
+        filters = (player, team if use_team else ALL_VALUES, year if use_year else ALL_VALUES)
+        yield (f'profile {filters}', *queries.profile_query(*filters))
+
+    # plots.update_zone_efficiency, including the league's rows it compares against
+    for use_player, use_team, use_year in itertools.product([True, False], repeat=3):
+        filters = (player if use_player else ALL_VALUES, team if use_team else ALL_VALUES, year if use_year else ALL_VALUES)
+        yield (f'zone stats {filters}', *queries.zone_stats_query(*filters))
+
+    # the app's /images/<etag> route
+    yield ('image by etag', *queries.image_query('0' * 16))
+
+def full_scans(conn, sql_query, params):
+    """
+    returns the EXPLAIN QUERY PLAN steps that walk a whole table or index instead of searching one
+    """
+    plan = conn.execute(f'EXPLAIN QUERY PLAN {sql_query}', params).fetchall()
+    return [detail for _, _, _, detail in plan if detail.startswith('SCAN ') and detail != 'SCAN CONSTANT ROW']
+
+def check_query_plans(conn):
+    failures = []
+    for description, sql_query, params in hot_queries(conn):
+        scans = full_scans(conn, sql_query, params)
+        if scans:
+            failures.append((description, scans))
+            print(f'  FULL SCAN  {description}: {"; ".join(scans)}')
+        else:
+            print(f'  ok         {description}')
+    return failures
+
+def finalize_database(db_path, page_size=8192):
+    size_before = os.path.getsize(db_path)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    tune_database(conn, page_size)
+    print(f'Database size: {size_before:,} -> {os.path.getsize(db_path):,} bytes')
+
+    print('Checking query plans...')
+    failures = check_query_plans(conn)
+    conn.close()
+    return failures
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default='data/nba_shots.db')
+    parser.add_argument('--page-size', type=int, default=8192)
+    args = parser.parse_args()
+
+    failures = finalize_database(args.db, args.page_size)
+    if failures:
+        sys.exit(f'{len(failures)} hot queries fall back to a full scan.')
+    print('Done.')
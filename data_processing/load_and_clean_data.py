@@ -1,9 +1,13 @@
+import argparse
 import pandas as pd
 from data_cleaning_library import clean_data
 import kagglehub
 import os
 import shutil
 import sqlite3
+import time
+from unidecode import unidecode
+from concurrent.futures import ProcessPoolExecutor
 
 def download_data():
     # Define the directory name for the dataset
@@ -32,21 +36,28 @@ def download_data():
         print("Dataset already exists in the 'nba' directory.")
 
 
-def stack_csvs(output_file):
+def season_files():
+    """
+    returns the paths of the season CSVs to load, in file name (season) order
+    """
     # Define the input folder as the "nba" directory in the current working directory
     input_folder = os.path.join(os.getcwd(), 'data/nba')
-    dataframes = []
-    
+    file_paths = []
+
     # Loop through all files in the input folder
-    for file_name in os.listdir(input_folder):
+    for file_name in sorted(os.listdir(input_folder)):
         # Check if the file is a CSV
-        year_from_file = int(file_name[:4])
-        if file_name.endswith('.csv') and year_from_file > 2013:
-            file_path = os.path.join(input_folder, file_name)
-            # Read the CSV file and append the DataFrame to the list
-            df = pd.read_csv(file_path)
-            dataframes.append(df)
-            # print(f"Loaded: {file_name}")
+        if file_name.endswith('.csv') and int(file_name[:4]) > 2013:
+            file_paths.append(os.path.join(input_folder, file_name))
+    return file_paths
+
+def stack_csvs(output_file):
+    dataframes = []
+    for file_path in season_files():
+        # Read the CSV file and append the DataFrame to the list
+        df = pd.read_csv(file_path)
+        dataframes.append(df)
+        # print(f"Loaded: {file_name}")
 
     # Concatenate all DataFrames in the list into a single DataFrame
     stacked_df = pd.concat(dataframes, ignore_index=True)
@@ -61,23 +72,170 @@ def data_cleaning(path_to_csv):
 
     return clean_df
 
-def retrieve_and_clean_data():
+def parallel_data_cleaning(workers=None):
+    """
+    parses and cleans each season file on its own process, then stacks the cleaned seasons.
+    executor.map returns results in file order, so the output doesn't depend on which worker finishes first.
+    """
+    file_paths = season_files()
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        dataframes = list(executor.map(data_cleaning, file_paths))
+    print(f"Cleaned {len(file_paths)} season files on {workers} processes")
+    return pd.concat(dataframes, ignore_index=True)
+
+# create scrape_name, basketball-reference's id for a player
+def create_scrape_name(player):
+    parts = player.replace('.', '').replace("'",'').lower().split()
+    if len(parts) == 2:
+        first, last = parts
+        scrape_name = last[:5] + first[:2] + "01" 
+    else:
+        scrape_name = parts[0][:5] + "01" 
+    scrape_name = unidecode(scrape_name)
+    return scrape_name
+
+def get_image_link(scrape_name):
+    link = f"https://www.basketball-reference.com/req/202106291/images/headshots/{scrape_name}.jpg"
+    return link
+
+def get_logo_link(team):
+    link = f"https://cdn.ssref.net/req/202410231/tlogo/bbr/{team}.png"
+    return link
+
+def build_dimensions(df):
+    """
+    splits the repeated text columns of the cleaned shots into players, teams and games dimension
+    tables, returning (players, teams, games, shots) where shots references them by integer id.
+    ids are assigned in sorted order so rebuilding the same data gives the same ids.
+    players and teams also carry the headshot and logo links shown by the webapp.
+    """
+    players = pd.DataFrame({'player': sorted(df['player'].unique())})
+    players.insert(0, 'player_id', range(1, len(players) + 1))
+    players['scrape_name'] = players['player'].apply(create_scrape_name)
+    players['player_image_link'] = players['scrape_name'].apply(get_image_link)
+    teams = pd.DataFrame({'team': sorted(df['team'].unique())})
+    teams.insert(0, 'team_id', range(1, len(teams) + 1))
+    teams['logo_link'] = teams['team'].apply(get_logo_link)
+
+    # days since 1970-01-01, so the webapp can rebuild dates without parsing strings
+    shot_games = pd.DataFrame({
+        'day': (pd.to_datetime(df['date'], format='%m/%d/%Y') - pd.Timestamp('1970-01-01')).dt.days,
+        'game_location': df['game_location']
+    })
+    games = shot_games.drop_duplicates().sort_values(['day', 'game_location']).reset_index(drop=True)
+    games.insert(0, 'game_id', range(1, len(games) + 1))
+    shot_games = shot_games.merge(games, how='left', on=['day', 'game_location'])
+
+    shots = pd.DataFrame({
+        'game_id': shot_games['game_id'].values,
+        'day': shot_games['day'].values,
+        'year': df['year'].values,
+        'player_id': df['player'].map(players.set_index('player')['player_id']).values,
+        'team_id': df['team'].map(teams.set_index('team')['team_id']).values,
+        'quarter': df['quarter'].astype(int).values,
+        # coordinates are stored as integer tenths of a foot, which SQLite packs into 2 bytes instead of 8
+        'shotX_tenths': (df['shotX'] * 10).round().astype(int).values,
+        'shotY_tenths': (df['shotY'] * 10).round().astype(int).values,
+        'made': df['made'].astype(int).values,
+        'distance': df['distance'].values,
+        'shot_type': df['shot_type'].astype(int).values,
+        'zone': df['zone'].values,
+    })
+    return players, teams, games, shots
+
+def create_shots_tables(cursor):
+    cursor.executescript('''
+        CREATE TABLE IF NOT EXISTS players (
+            player_id INTEGER PRIMARY KEY,
+            player TEXT NOT NULL UNIQUE,
+            scrape_name TEXT NOT NULL,
+            player_image_link TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS teams (
+            team_id INTEGER PRIMARY KEY,
+            team TEXT NOT NULL UNIQUE,
+            logo_link TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS games (
+            game_id INTEGER PRIMARY KEY,
+            day INTEGER NOT NULL,
+            game_location TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS shots (
+            game_id INTEGER NOT NULL REFERENCES games(game_id),
+            day INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            player_id INTEGER NOT NULL REFERENCES players(player_id),
+            team_id INTEGER NOT NULL REFERENCES teams(team_id),
+            quarter INTEGER,
+            shotX_tenths INTEGER,
+            shotY_tenths INTEGER,
+            made INTEGER,
+            distance INTEGER,
+            shot_type INTEGER,
+            zone INTEGER
+        );
+        -- thumbnails of the links above, filled in by mirror_images.py and served by the webapp
+        CREATE TABLE IF NOT EXISTS images (
+            url TEXT PRIMARY KEY,
+            etag TEXT NOT NULL,
+            content_type TEXT NOT NULL,
+            data BLOB NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_images_etag ON images(etag);
+    ''')
+
+def create_shots_indexes(cursor):
+    # Covering indexes for the webapp's shot filters (filter_db_data in webapp/components/plots.py).
+    # Each holds every column the filter reads, so filtered queries never touch the table itself.
+    #   player, player + team, player + year, player + team + year -> idx_shots_player
+    #   team, team + year                                          -> idx_shots_team
+    #   year                                                       -> idx_shots_year
+    cursor.executescript('''
+        CREATE INDEX idx_shots_player ON shots(player_id, team_id, year, shot_type, distance, made, shotX_tenths, shotY_tenths, day, zone);
+        CREATE INDEX idx_shots_team ON shots(team_id, year, shot_type, distance, made, shotX_tenths, shotY_tenths, day, zone);
+        CREATE INDEX idx_shots_year ON shots(year, shot_type, distance, made, shotX_tenths, shotY_tenths, day, zone);
+    ''')
+
+def retrieve_and_clean_data(workers=0):
+    """
+    workers=0 stacks the season files and cleans them in one process. Otherwise each season is
+    cleaned on a process pool of that many workers (None uses every core).
+    """
+    stage_times = {}
+
+    start_time = time.time()
     download_data()  ### downloading
-    
-    ## Ensure final dataset does not already exist. If it doesn't exist, stack CSVs.
-    final_dataset_path = os.path.join(os.getcwd(), 'data/combined_dataset.csv')
-    if not os.path.isfile(final_dataset_path):
-        stack_csvs('data/combined_dataset.csv')
-        
-    # data cleaning script - doing the same thing to make sure it doesn't already exist
+    stage_times['download'] = time.time() - start_time
+
     cleaned_dataset_path = os.path.join(os.getcwd(), 'data/cleaned_final_dataset.csv')
-    if not os.path.isfile(cleaned_dataset_path):
-        data_cleaning(final_dataset_path).to_csv('data/cleaned_final_dataset.csv')
+    if workers == 0:
+        ## Ensure final dataset does not already exist. If it doesn't exist, stack CSVs.
+        start_time = time.time()
+        final_dataset_path = os.path.join(os.getcwd(), 'data/combined_dataset.csv')
+        if not os.path.isfile(final_dataset_path):
+            stack_csvs('data/combined_dataset.csv')
+        stage_times['stack'] = time.time() - start_time
+
+        # data cleaning script - doing the same thing to make sure it doesn't already exist
+        start_time = time.time()
+        if not os.path.isfile(cleaned_dataset_path):
+            data_cleaning(final_dataset_path).to_csv('data/cleaned_final_dataset.csv', index=False)
+        stage_times['clean'] = time.time() - start_time
+    elif not os.path.isfile(cleaned_dataset_path):
+        # the combined CSV is never written in this mode, each worker reads its own season file
+        start_time = time.time()
+        parallel_data_cleaning(workers).to_csv('data/cleaned_final_dataset.csv', index=False)
+        stage_times['parallel load and clean'] = time.time() - start_time
 
     # Load and round data for insertion
+    start_time = time.time()
     df = pd.read_csv(cleaned_dataset_path)  
+    df = df.drop(columns=[c for c in df.columns if c.startswith('Unnamed:')])  # index column from older runs
     df['shotX'] = df['shotX'].round(1)
     df['shotY'] = df['shotY'].round(1)
+    stage_times['read cleaned'] = time.time() - start_time
 
     # Check if SQLite database file exists
     db_path = os.path.join(os.getcwd(), 'data/nba_shots.db')
@@ -85,43 +243,41 @@ def retrieve_and_clean_data():
         ### Only create the database if it doesn't already exist
         conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
+        create_shots_tables(cursor)
 
-        # Create table if it does not exist
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS shots (
-                date TEXT,
-                year INTEGER,
-                game_location TEXT,
-                shotX REAL,
-                shotY REAL,
-                quarter INTEGER,
-                player TEXT,
-                team TEXT,
-                made BOOLEAN,
-                distance INTEGER,
-                shot_type INTEGER,
-                zone INTEGER
-            )
-        ''')
+        start_time = time.time()
+        players, teams, games, shots = build_dimensions(df)
+        stage_times['build dimensions'] = time.time() - start_time
 
         # Insert data into the database
-        df.to_sql('shots', conn, if_exists='replace', index=False)
+        start_time = time.time()
+        players.to_sql('players', conn, if_exists='append', index=False)
+        teams.to_sql('teams', conn, if_exists='append', index=False)
+        games.to_sql('games', conn, if_exists='append', index=False)
+        shots.to_sql('shots', conn, if_exists='append', index=False, chunksize=100_000)
+        stage_times['insert'] = time.time() - start_time
 
         # Create indexes for UI filtering
-        cursor.executescript('''
-            CREATE INDEX idx_shots_team ON shots(team);
-            CREATE INDEX idx_shots_year ON shots(year);
-            CREATE INDEX idx_shots_player_year ON shots(player, year);
-            CREATE INDEX idx_shots_team_year ON shots(team, year);
-            CREATE INDEX idx_shots_player_team_year ON shots(player, team, year);
-        ''')
+        start_time = time.time()
+        create_shots_indexes(cursor)
 
         # Commit changes and close connection
         conn.commit()
         conn.close()
+        stage_times['index'] = time.time() - start_time
+
+    print('Stage wall-clock times:')
+    for stage, seconds in stage_times.items():
+        print(f'  {stage:<24} {seconds:8.2f} sec')
+    print(f'  {"total":<24} {sum(stage_times.values()):8.2f} sec')
 
     return df
 
 if __name__ == "__main__":
-    df = retrieve_and_clean_data()
-    print(df.head())
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-w', '--workers', type=int, default=0,
+                        help='clean season files in parallel on this many processes (-1 for every core, default 0 cleans in one process)')
+    args = parser.parse_args()
+
+    df = retrieve_and_clean_data(workers=None if args.workers < 0 else args.workers)
+    print(df.head())
@@ -0,0 +1,225 @@
+import argparse
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from PIL import Image
+
+IMAGES_DIR = 'data/images'
+
+# Thumbnails are sized for 2x displays: headshots render 220px high, logos at most 80px high
+HEADSHOT_SIZE = (300, 440)
+LOGO_SIZE = (160, 160)
+
+# Sports Reference (basketball-reference.com, and cdn.ssref.net for logos) bans clients for a while when they
+# make more than about 20 requests a minute, so its hosts share a budget of one request every 3 seconds
+SPORTS_REFERENCE_HOSTS = ('basketball-reference.com', 'ssref.net')
+SPORTS_REFERENCE_RATE = 1 / 3
+
+# Longest wait between retries, whatever Retry-After asks for, so a throttled run can't stall for hours
+MAX_RETRY_WAIT = 60
+
+class RateLimiter:
+    """
+    spaces out requests to each host so that no more than `rate` start per second, across all threads.
+    host_groups maps a name to (host suffixes, rate) for hosts that share a slower budget. a host (or
+    group) that answered 429 is stopped, and its remaining requests are skipped
+    """
+    def __init__(self, rate, host_groups=None):
+        self.interval = 1 / rate
+        self.group_intervals = [(name, suffixes, 1 / min(rate, group_rate))
+                                for name, (suffixes, group_rate) in (host_groups or {}).items()]
+        self.next_time = {}
+        self.stopped = set()
+        self.lock = threading.Lock()
+
+    def budget(self, url):
+        """
+        returns the name of url's host or group, and the seconds between its requests
+        """
+        host = urlsplit(url).netloc
+        for name, suffixes, interval in self.group_intervals:
+            if any(host == suffix or host.endswith(f'.{suffix}') for suffix in suffixes):
+                return name, interval
+        return host, self.interval
+
+    def wait(self, url):
+        """
+        sleeps until url's host can take another request, returns False if it was stopped
+        """
+        key, interval = self.budget(url)
+        with self.lock:
+            if key in self.stopped:
+                return False
+            now = time.monotonic()
+            start = max(now, self.next_time.get(key, now))
+            self.next_time[key] = start + interval
+        time.sleep(start - now)
+        # it may have been stopped while this thread waited its turn
+        return key not in self.stopped
+
+    def stop(self, url):
+        key, _ = self.budget(url)
+        with self.lock:
+            if key in self.stopped:
+                return
+            self.stopped.add(key)
+        print(f'  {key} is throttling requests, skipping its remaining images')
+
+class CappedRetry(Retry):
+    """
+    a Retry that waits at most MAX_RETRY_WAIT seconds, even when Retry-After asks for longer, and
+    that leaves 429s to the caller (urllib3 retries them when they have a Retry-After header)
+    """
+    def is_retry(self, method, status_code, has_retry_after=False):
+        return status_code != 429 and super().is_retry(method, status_code, has_retry_after)
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, MAX_RETRY_WAIT)
+
+def create_session(workers, retries=4):
+    """
+    returns a session with a connection pool per host big enough for every worker, retrying
+    connection errors and 5xx responses with exponential backoff (honoring Retry-After, up to
+    MAX_RETRY_WAIT). 429s aren't retried, see mirror_image
+    """
+    retry = CappedRetry(
+        total=retries,
+        backoff_factor=1,
+        backoff_max=MAX_RETRY_WAIT,
+        status_forcelist=[500, 502, 503, 504],
+        allowed_methods=['GET'],
+        respect_retry_after_header=True
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=workers, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = 'BasketRadar image mirror'
+    return session
+
+def make_thumbnail(content, size, image_format):
+    """
+    shrinks an image to fit in size (never enlarging it) and re-encodes it
+    """
+    image = Image.open(io.BytesIO(content))
+    image.thumbnail(size)
+    out = io.BytesIO()
+    if image_format == 'JPEG':
+        image.convert('RGB').save(out, 'JPEG', quality=85, optimize=True)
+    else:
+        image.save(out, image_format, optimize=True)
+    return out.getvalue()
+
+def mirror_image(url, dest_path, size, image_format, session, limiter):
+    """
+    downloads url and saves its thumbnail to dest_path. images already on disk are kept, so an
+    interrupted run picks up where it stopped. returns True if the image is available locally.
+    a 429 stops the host, rather than waiting out its ban: the images left are skipped, and the
+    web app hot-links them until a later run
+    """
+    if os.path.exists(dest_path):
+        return True
+
+    if not limiter.wait(url):
+        return False
+    try:
+        r = session.get(url, timeout=30)
+    except requests.RequestException as e:
+        print(f'  failed {url}: {e}')
+        return False
+    if r.status_code == 429:
+        limiter.stop(url)
+        return False
+    if r.status_code != 200:
+        print(f'  failed {url}: HTTP {r.status_code}')
+        return False
+
+    try:
+        thumbnail = make_thumbnail(r.content, size, image_format)
+    except OSError as e:
+        print(f'  failed {url}: {e}')
+        return False
+
+    tmp_path = f'{dest_path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(thumbnail)
+    os.replace(tmp_path, dest_path)
+    return True
+
+def image_jobs(conn, images_dir=IMAGES_DIR):
+    """
+    returns (url, dest_path, size, format, content_type) for every distinct headshot and logo link
+    """
+    jobs = []
+    for (url,) in conn.execute('select distinct player_image_link from players order by player_image_link'):
+        name = os.path.basename(urlsplit(url).path)
+        jobs.append((url, os.path.join(images_dir, 'players', name), HEADSHOT_SIZE, 'JPEG', 'image/jpeg'))
+    for (url,) in conn.execute('select distinct logo_link from teams order by logo_link'):
+        name = os.path.basename(urlsplit(url).path)
+        jobs.append((url, os.path.join(images_dir, 'teams', name), LOGO_SIZE, 'PNG', 'image/png'))
+    return jobs
+
+def store_images(conn, jobs):
+    """
+    loads the mirrored thumbnails into the images table, so they ship inside the database snapshot.
+    each image's etag is a hash of its bytes, so the webapp can serve it from a never-changing url.
+    """
+    rows = []
+    for url, dest_path, _, _, content_type in jobs:
+        if not os.path.exists(dest_path):
+            continue
+        with open(dest_path, 'rb') as f:
+            content = f.read()
+        etag = hashlib.sha256(content).hexdigest()[:16]
+        rows.append((url, etag, content_type, content))
+
+    conn.execute('delete from images')
+    conn.executemany('insert or replace into images (url, etag, content_type, data) values (?, ?, ?, ?)', rows)
+    conn.commit()
+    return rows
+
+def mirror_images(db_path='data/nba_shots.db', images_dir=IMAGES_DIR, workers=8, rate=4,
+                  sports_reference_rate=SPORTS_REFERENCE_RATE):
+    start_time = time.time()
+    conn = sqlite3.connect(db_path)
+    jobs = image_jobs(conn, images_dir)
+    os.makedirs(os.path.join(images_dir, 'players'), exist_ok=True)
+    os.makedirs(os.path.join(images_dir, 'teams'), exist_ok=True)
+
+    session = create_session(workers)
+    limiter = RateLimiter(rate, {'Sports Reference': (SPORTS_REFERENCE_HOSTS, sports_reference_rate)})
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(
+            lambda job: mirror_image(job[0], job[1], job[2], job[3], session, limiter),
+            jobs
+        ))
+    print(f'Mirrored {sum(results)} of {len(jobs)} images in {time.time() - start_time:.1f} sec')
+    if limiter.stopped:
+        print(f'Stopped early for {", ".join(sorted(limiter.stopped))}, rerun later to fetch the rest')
+
+    rows = store_images(conn, jobs)
+    conn.close()
+    print(f'Stored {len(rows)} thumbnails ({sum(len(row[3]) for row in rows):,} bytes) in {db_path}')
+    return sum(results), len(jobs)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default='data/nba_shots.db')
+    parser.add_argument('--images-dir', default=IMAGES_DIR)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=4, help='maximum requests per second to each host')
+    parser.add_argument('--sports-reference-rate', type=float, default=SPORTS_REFERENCE_RATE,
+                        help='maximum requests per second to Sports Reference hosts, together')
+    args = parser.parse_args()
+
+    mirror_images(args.db, args.images_dir, args.workers, args.rate, args.sports_reference_rate)
+    print('Done.')
@@ -0,0 +1,75 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import time
+
+SNAPSHOT_DIR = 'data/snapshots'
+SNAPSHOT_FILES = ['nba_shots.db']
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """
+    returns (size, sha256 hex digest) of a file
+    """
+    sha = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            sha.update(chunk)
+            size += len(chunk)
+    return size, sha.hexdigest()
+
+def compress_file(src_path, dest_path, chunk_size=1024 * 1024):
+    """
+    gzips a file in chunks so the whole file never has to be held in memory
+    """
+    with open(src_path, 'rb') as src, gzip.GzipFile(dest_path, 'wb', compresslevel=6, mtime=0) as dest:
+        shutil.copyfileobj(src, dest, chunk_size)
+
+def publish_snapshot(data_dir='data', snapshot_dir=SNAPSHOT_DIR, version=None):
+    """
+    writes compressed copies of the built data files to snapshots/<version>/ along with a manifest of
+    their checksums and sizes. snapshots/latest.json always holds the manifest of the newest version.
+    """
+    version = version or time.strftime('%Y%m%d%H%M%S', time.gmtime())
+    version_dir = os.path.join(snapshot_dir, version)
+    os.makedirs(version_dir, exist_ok=True)
+
+    files = []
+    for file_name in SNAPSHOT_FILES:
+        src_path = os.path.join(data_dir, file_name)
+        dest_name = f'{file_name}.gz'
+        dest_path = os.path.join(version_dir, dest_name)
+
+        start_time = time.time()
+        compress_file(src_path, dest_path)
+        uncompressed_size, uncompressed_sha256 = file_digest(src_path)
+        size, sha256 = file_digest(dest_path)
+        print(f'Compressed {file_name}: {uncompressed_size:,} -> {size:,} bytes in {time.time() - start_time:.1f} sec')
+
+        files.append({
+            'name': file_name,
+            'path': f'{version}/{dest_name}',
+            'compression': 'gzip',
+            'size': size,
+            'sha256': sha256,
+            'uncompressed_size': uncompressed_size,
+            'uncompressed_sha256': uncompressed_sha256,
+        })
+
+    manifest = {
+        'version': version,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'files': files,
+    }
+    with open(os.path.join(version_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    with open(os.path.join(snapshot_dir, 'latest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+if __name__ == '__main__':
+    manifest = publish_snapshot()
+    print(f'Published snapshot {manifest["version"]} to {SNAPSHOT_DIR}')
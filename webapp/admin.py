@@ -0,0 +1,25 @@
+import functools
+import hmac
+import os
+from flask import request, abort
+
+# Admin routes are disabled unless a token is configured, and then require it in the X-Admin-Token header
+ADMIN_TOKEN_ENV = 'BASKETRADAR_ADMIN_TOKEN'
+
+def is_admin():
+    """
+    whether the request carries the admin token, for admin features that are quietly off otherwise
+    """
+    token = os.environ.get(ADMIN_TOKEN_ENV)
+    return bool(token) and hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token)
+
+def admin_required(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token = os.environ.get(ADMIN_TOKEN_ENV)
+        if not token:
+            abort(404)
+        if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token):
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,207 @@
+import functools
+import hashlib
+import json
+import numpy as np
+import pandas as pd
+from flask import Blueprint, abort, jsonify, make_response, request
+import queries
+import shot_binning
+from components import plots
+from components.profile import SHOT_DIET
+
+# Read-only JSON versions of the dashboard's aggregates, under /api/v1, for notebooks and other tools. They
+# come from the same cached functions as the charts, so a request the dashboard already made is served from
+# the cache. A response only changes with the data version, so its ETag is a hash of the version, the
+# endpoint and the filters: a client revalidating with If-None-Match gets a 304 before anything is computed.
+API_VERSION = 'v1'
+SIMILARITY_ATTRIBUTES = ['avg_distance', 'avg_shotX', 'accuracy', 'top_quarter']
+SIMILARITY_FILTERS = ['same-team', 'same-year']
+
+
+def json_values(values, decimals=4):
+    """
+    returns the values as a list for JSON, rounded, with NaN as None
+    """
+    values = np.round(np.asarray(values, dtype=float), decimals)
+    return [None if np.isnan(value) else value for value in values.tolist()]
+
+
+def json_records(df):
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def make_etag(*key):
+    return hashlib.sha1(json.dumps([API_VERSION, *key], default=str).encode()).hexdigest()
+
+
+def etag_matches(etag):
+    """
+    returns the If-None-Match tag that matches etag, or None. flask-compress appends the encoding to the
+    ETag of compressed responses ("<etag>:gzip"), which is ignored here
+    """
+    if request.if_none_match.star_tag:
+        return etag
+    for tag in request.if_none_match.as_set(include_weak=True):
+        if tag.split(':')[0] == etag:
+            return tag
+    return None
+
+
+def create_api_routes(app, data, get_selection, plot_data, find_similar):
+    get_shots, get_moving_averages, get_shot_bins, get_zone_stats = plot_data
+    api = Blueprint('api', __name__, url_prefix=f'/api/{API_VERSION}')
+
+    def aggregate(*params):
+        """
+        serves the view's dict as JSON for the player, team and year query parameters (left out for all of
+        them), revalidated with an ETag. params are the view's other query parameters, which it reads itself
+        """
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper():
+                if not data.is_ready():
+                    abort(503)
+                player_name = request.args.get('player', queries.ALL_VALUES)
+                team = request.args.get('team', queries.ALL_VALUES)
+                year = request.args.get('year', queries.ALL_VALUES)
+                if year != queries.ALL_VALUES:
+                    if not year.isdigit():
+                        abort(400)
+                    # the dashboard's filter state holds ints, so both share the cached results
+                    year = int(year)
+
+                version = data.version
+                etag = make_etag(version, request.endpoint, player_name, team, year, [request.args.get(p) for p in params])
+                matched = etag_matches(etag)
+                if matched:
+                    response = make_response('', 304)
+                    response.headers['ETag'] = f'"{matched}"'
+                else:
+                    response = jsonify(view(player_name, team, year, version))
+                    response.set_etag(etag)
+                # stored by browsers and proxies, but revalidated on every use since a data swap changes it
+                response.cache_control.public = True
+                response.cache_control.no_cache = True
+                response.headers['X-Data-Version'] = version
+                return response
+            return wrapper
+        return decorator
+
+    @api.route('/distance-accuracy')
+    @aggregate()
+    def distance_accuracy(player_name, team, year, version):
+        """
+        the share of shots made and the number of shots at each distance, per shot type
+        """
+        dff = get_shots(player_name, team, year, version)
+        rows = plots.distance_accuracy(dff) if not dff.empty else pd.DataFrame()
+        return {'rows': json_records(rows)}
+
+    @api.route('/shot-grid')
+    @aggregate('bin_size')
+    def shot_grid(player_name, team, year, version):
+        """
+        the attempts and makes in each cell of the shot map grid that has any, at the bin_size parameter or
+        the size the shot map starts at. vs_league is None for databases without league baselines
+        """
+        pyramid = get_shot_bins(player_name, team, year, version)
+        if pyramid is None:
+            return {'bin_size': None, 'bin_sizes': shot_binning.BIN_SIZES, 'cells': None}
+        bin_size = request.args.get('bin_size', type=int) or shot_binning.pick_bin_size(pyramid)
+        if bin_size not in pyramid:
+            abort(400)
+        level = pyramid[bin_size]
+        iy, ix = np.nonzero(level['attempts'])
+        cells = {
+            'x': json_values(level['x'][ix], 1),
+            'y': json_values(level['y'][iy], 1),
+            'attempts': level['attempts'][iy, ix].tolist(),
+            'makes': level['makes'][iy, ix].tolist(),
+            'fg_pct': json_values(shot_binning.bin_values(level, shot_binning.FG_PCT)[iy, ix]),
+            'vs_league': None,
+        }
+        if 'expected' in level:
+            cells['vs_league'] = json_values(shot_binning.bin_values(level, shot_binning.VS_LEAGUE)[iy, ix])
+        return {'bin_size': bin_size, 'bin_sizes': sorted(pyramid), 'cells': cells}
+
+    @api.route('/moving-averages')
+    @aggregate()
+    def moving_averages(player_name, team, year, version):
+        """
+        the 3 game moving average of the share of 2 and 3 pointers made, by date
+        """
+        moving_avg_df = get_moving_averages(player_name, team, year, version)
+        return {
+            'dates': [date.strftime('%Y-%m-%d') for date in moving_avg_df.index],
+            **{f'{shot_type}-pointer': json_values(moving_avg_df[shot_type]) if shot_type in moving_avg_df else None
+               for shot_type in (2, 3)},
+        }
+
+    @api.route('/zones')
+    @aggregate()
+    def zones(player_name, team, year, version):
+        """
+        the attempts, makes and points in each zone, with the league's for the same season(s)
+        """
+        zones = get_zone_stats(player_name, team, year, version)
+        if zones is None:
+            return {'zones': None}
+        league = get_zone_stats(queries.ALL_VALUES, queries.ALL_VALUES, year, version)
+        zones = zones.merge(league, on='zone', how='left', suffixes=('', '_league'))
+        zones.insert(1, 'name', zones['zone'].map(plots.ZONE_NAMES))
+        return {'zones': json_records(zones)}
+
+    @api.route('/profile')
+    @aggregate()
+    def profile(player_name, team, year, version):
+        """
+        the profile row behind the sliders, for a player's selection
+        """
+        if player_name == queries.ALL_VALUES:
+            abort(400)
+        profile = get_selection({'player': player_name, 'team': team, 'year': year}, version)['profile']
+        if profile is None:
+            abort(404)
+        profile = dict(profile)
+        for column in ('zone_attempts', 'distance_attempts'):
+            if isinstance(profile.get(column), str):
+                profile[column] = json.loads(profile[column])
+        return {'profile': json_records(pd.DataFrame([profile]))[0]}
+
+    @api.route('/similar')
+    @aggregate('mode', 'attributes', 'filters')
+    def similar(player_name, team, year, version):
+        """
+        the 3 most and 3 least similar rows to a player's selection, at its level of aggregation. mode is
+        'attributes' (the default) or 'shot_diet', attributes and filters are comma separated like the
+        dashboard's checklists
+        """
+        if player_name == queries.ALL_VALUES:
+            abort(400)
+        mode = request.args.get('mode', 'attributes')
+        attributes = [a for a in request.args.get('attributes', ','.join(SIMILARITY_ATTRIBUTES)).split(',') if a]
+        filters = [f for f in request.args.get('filters', '').split(',') if f]
+        if mode not in ('attributes', SHOT_DIET) or not set(attributes) <= set(SIMILARITY_ATTRIBUTES) \
+                or not set(filters) <= set(SIMILARITY_FILTERS):
+            abort(400)
+        if mode != SHOT_DIET and not attributes:
+            abort(400)
+        # in a fixed order, so any order of the same attributes shares the cached similarity matrix
+        attributes = [a for a in SIMILARITY_ATTRIBUTES if a in attributes]
+
+        try:
+            top, bottom = find_similar(year, player_name, team, attributes, filters, version, mode)
+        except KeyError:
+            # not a row of the similarity matrices
+            abort(404)
+        if top is None:
+            return {'similar': None, 'dissimilar': None}
+
+        def rows(similarities):
+            keys = similarities.index.to_frame(index=False)
+            keys['distance'] = json_values(similarities.to_numpy())
+            return json_records(keys)
+
+        return {'similar': rows(top), 'dissimilar': rows(bottom)}
+
+    app.register_blueprint(api)
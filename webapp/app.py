@@ -1,50 +1,73 @@
-from dash import Dash, html, dcc
+from dash import Dash, DiskcacheManager, html, dcc, Output, Input
+import diskcache
 import dash_bootstrap_components as dbc
-import pandas as pd
 import components.plots as plots
 import components.profile as profile
+import components.filter_state as filter_state
 from components.page import navbar
-import sqlite3
+from data_source import DataSource, STORAGE_URL
 import os
-import requests
-from flask_caching import Cache
+from flask import jsonify, request, Response, abort, send_from_directory
+from werkzeug.utils import secure_filename
+import queries
+import shot_export
+import api
+from admin import admin_required
+from single_flight import single_flight
+from query_stats import query_stats
+import profiling
+from cache_accounting import AccountingCache
 import argparse
 
-dash_app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP, dbc.icons.BOOTSTRAP, './assets/custom.css'],  suppress_callback_exceptions=True)
+# Callbacks declared with background=True (the whole league's graphs, the similarity modal's dendrogram) run
+# as jobs in separate processes instead of the request thread. A newer request for the same callback from the
+# same page cancels the job still running for the old one. A job's process is forked, so it reads the app's
+# cache and single-flight state as they were, but what it adds to them is lost when it exits, unless it's
+# forwarded (see job_results.py).
+background_callback_manager = DiskcacheManager(
+    diskcache.Cache(os.environ.get('BASKETRADAR_JOB_CACHE_DIR', './data/jobs')),
+    cache_by=[lambda: data.version],
+    expire=3600
+)
+
+# compress=True has flask-compress gzip/brotli the callback responses (mostly figure JSON) and static assets
+dash_app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP, dbc.icons.BOOTSTRAP, './assets/custom.css'],  suppress_callback_exceptions=True,
+                background_callback_manager=background_callback_manager, compress=True)
 dash_app.title = 'BasketRadar'
 app = dash_app.server
 
-cache = Cache(app, config={
-    'CACHE_TYPE': 'SimpleCache',
-    'CACHE_DEFAULT_TIMEOUT': 3600
+# A SimpleCache that accounts for the memory of each entry (see cache_accounting.py). BASKETRADAR_CACHE_MAX_MB
+# and BASKETRADAR_CACHE_MAX_ENTRY_MB set memory budgets, over which entries are evicted or not kept
+cache = AccountingCache(app, config={
+    'CACHE_TYPE': 'cache_accounting.AccountingSimpleCache',
+    'CACHE_DEFAULT_TIMEOUT': 3600,
+    'CACHE_MAX_BYTES': int(float(os.environ.get('BASKETRADAR_CACHE_MAX_MB', '0')) * 2**20),
+    'CACHE_MAX_ENTRY_BYTES': int(float(os.environ.get('BASKETRADAR_CACHE_MAX_ENTRY_MB', '0')) * 2**20),
 })
 
-player_images = pd.read_csv('https://basketradarstorage.blob.core.windows.net/cleandata/player_images.csv')
-team_images = pd.read_csv('https://basketradarstorage.blob.core.windows.net/cleandata/team_images.csv')
-
-sqlite_file_path = './data/nba_shots.db'
-if not os.path.exists(sqlite_file_path):
-    print('SQLite database does not exist.')
-    os.makedirs('data', exist_ok=True)
-    print('Downloading...')
-    with requests.get('https://basketradarstorage.blob.core.windows.net/cleandata/nba_shots.db', stream=True) as r:
-        r.raise_for_status()
-        with open(sqlite_file_path, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=8192): 
-                f.write(chunk)
-    print('Database downloaded.')
-
-conn = sqlite3.connect(sqlite_file_path, check_same_thread=False, isolation_level=None)
+# The SQLite database is loaded in the background (see data_source.py) so the app
+# can serve requests right away. Set BASKETRADAR_EAGER_STARTUP=1 to load everything before serving.
+data = DataSource('./data/nba_shots.db', os.environ.get('BASKETRADAR_STORAGE_URL', STORAGE_URL))
+
+# An admin request with X-Profile: 1 profiles the callbacks it runs (see profiling.py)
+app.before_request(profiling.read_request_header)
+
 profile_content = dbc.Container(
     [
         dbc.Row(
             [
                 dcc.Location(id='url', refresh=False),
-                dbc.Col(profile.player_selector(conn), md=2),
+                dcc.Store(id='data-ready', data=False),
+                dcc.Store(id='filter-state'),
+                dcc.Store(id='image-map'),
+                plots.shot_map_bins,
+                plots.league_graphs_request,
+                dcc.Interval(id='data-ready-poll', interval=1000),
+                dbc.Col(profile.player_selector(), md=2),
                 dbc.Col(
                     [
-                        dbc.Row([dbc.Col(profile.team_selector(conn), md=12)]),
-                        dbc.Row([dbc.Col(profile.year_selector(conn), md=12)])
+                        dbc.Row([dbc.Col(profile.team_selector(), md=12)]),
+                        dbc.Row([dbc.Col(profile.year_selector(), md=12)])
                     ],
                     md=2
                 ),
@@ -97,12 +120,13 @@ profile_content = dbc.Container(
 
 dashboard_content = dbc.Container(
     [
+        plots.graphs_progress,
         dbc.Row(
             [
                 dbc.Col(
-                    plots.shot_map, 
+                    [plots.shot_map_metric, plots.shot_map], 
                     md=6,
-                    className='d-flex justify-content-center',
+                    className='d-flex flex-column align-items-center',
                     # style={"background-color": "lightblue"},
                 ),
                 dbc.Col(
@@ -126,6 +150,7 @@ dashboard_content = dbc.Container(
             align="center",
             justify="center",
         ),
+        dbc.Row(dbc.Col(plots.zone_efficiency, md=12)),
     ],
     fluid=True,
     class_name="mt-2"
@@ -139,12 +164,144 @@ dash_app.layout = html.Div(
     ]
 )
 
-plots.create_plot_callbacks(dash_app, conn, cache)
-profile.create_filter_callbacks(dash_app, player_images, team_images, conn)
-profile.create_slider_callbacks(dash_app, conn)
+@app.route('/ready')
+def ready():
+    if data.error is not None:
+        return jsonify(ready=False, error=str(data.error)), 500
+    return jsonify(ready=data.is_ready()), 200 if data.is_ready() else 503
+
+@app.route('/images/<etag>')
+def image(etag):
+    """
+    serves a mirrored headshot/logo thumbnail. the etag is a hash of the image, so the url never
+    changes meaning and browsers can cache it for a year; revalidations still get a 304.
+    """
+    if not data.is_ready():
+        abort(503)
+    # a page loaded before a data swap still has the replaced version's image map until its next interaction
+    for version in data.loaded_versions():
+        try:
+            row = data.conn_for(version).execute(*queries.image_query(etag)).fetchone()
+        except KeyError:
+            # retired since
+            continue
+        if row is not None:
+            break
+    else:
+        abort(404)
+
+    content_type, content = row
+    response = Response(content, mimetype=content_type)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 60 * 60
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
+@app.route('/export/shots')
+@app.route('/export/shots.<fmt>')
+def export_shots(fmt='csv'):
+    """
+    streams the shots for the player, team and year query parameters (left out for all of them, like the
+    dropdowns' "all" option) as CSV or newline-delimited JSON, gzipped when the client accepts it
+    """
+    if not data.is_ready():
+        abort(503)
+    if fmt not in shot_export.FORMATS:
+        abort(404)
+    player_name = request.args.get('player', queries.ALL_VALUES)
+    team = request.args.get('team', queries.ALL_VALUES)
+    year = request.args.get('year', queries.ALL_VALUES)
+    if year != queries.ALL_VALUES and not year.isdigit():
+        abort(400)
+
+    version = data.version
+    sql_query, params = queries.shots_export_query(player_name, team, year)
+    # a connection of its own, opened and closed by the generator, so the stream outlives this request context
+    gzip = 'gzip' in request.accept_encodings
+    chunks = shot_export.stream_query(lambda: data.open_reader(version), sql_query, params, fmt, gzip=gzip)
+    response = Response(chunks, mimetype=shot_export.FORMATS[fmt])
+    # compressed here as it streams; flask-compress would buffer the whole body first (and skips these types)
+    if gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    name = '_'.join(value for value in [player_name, team, year] if value != queries.ALL_VALUES) or 'all'
+    response.headers['Content-Disposition'] = f'attachment; filename="shots_{secure_filename(name)}.{fmt}"'
+    response.headers['X-Data-Version'] = version
+    return response
+
+@app.route('/admin/coalescing')
+@admin_required
+def coalescing_stats():
+    """
+    how many calls to each single-flight function ran, and how many waited on an identical call instead
+    """
+    return jsonify(single_flight.stats())
+
+@app.route('/admin/queries', methods=['GET', 'DELETE'])
+@admin_required
+def query_log():
+    """
+    totals per SQL statement (calls, time, rows, parameter counts) and the latest slow queries with their
+    query plans, for this process. DELETE starts them over
+    """
+    if request.method == 'DELETE':
+        query_stats.reset()
+    return jsonify(query_stats.snapshot())
+
+@app.route('/admin/cache')
+@admin_required
+def cache_stats():
+    """
+    the size, age, hits and last access of every cache entry, with totals per cached function
+    """
+    return jsonify(cache.cache.snapshot())
+
+@app.route('/admin/profiles')
+@admin_required
+def profiles():
+    """
+    the saved callback profiles (see profiling.py), newest first
+    """
+    return jsonify(profiling.list_profiles())
+
+@app.route('/admin/profiles/<name>')
+@admin_required
+def download_profile(name):
+    return send_from_directory(os.path.abspath(profiling.PROFILE_DIR), name, as_attachment=True)
+
+@dash_app.callback(
+    Output('data-ready', 'data'),
+    Output('data-ready-poll', 'disabled'),
+    Input('data-ready-poll', 'n_intervals')
+)
+def poll_data_ready(n_intervals):
+    return data.is_ready(), data.is_ready()
+
+get_selection = filter_state.create_filter_state_callbacks(dash_app, data, cache)
+plot_data = plots.create_plot_callbacks(dash_app, data, cache)
+profile.create_filter_callbacks(dash_app, data, get_selection)
+profile.create_slider_callbacks(dash_app, data, get_selection)
+
+similarity_calculators = profile.create_similarity_calc_funcs(cache, data)
+find_similar = profile.create_similarity_list_callbacks(dash_app, similarity_calculators, data)
+
+api.create_api_routes(app, data, get_selection, plot_data, find_similar)
+
+if os.environ.get('BASKETRADAR_EAGER_STARTUP') == '1':
+    data.load()
+else:
+    data.load_in_background()
+
+# Poll for newly published snapshots and swap them in without a restart
+refresh_interval = int(os.environ.get('BASKETRADAR_REFRESH_INTERVAL', '0'))
+if refresh_interval > 0:
+    data.watch_for_updates(refresh_interval)
 
-similarity_calculators = profile.create_similarity_calc_funcs(cache, conn)
-profile.create_similarity_list_callbacks(dash_app, similarity_calculators, conn)
+# Print a summary of the cache's memory every so often
+cache_log_interval = int(os.environ.get('BASKETRADAR_CACHE_LOG_INTERVAL', '0'))
+if cache_log_interval > 0:
+    cache.cache.log_every(cache_log_interval)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -0,0 +1,112 @@
+// Clientside callbacks for interactions that only rearrange the page, so they don't need a server round-trip.
+// Registered in components/profile.py with ClientsideFunction('basketradar', <name>).
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    basketradar: {
+        toggleModal: function(n1, n2, isOpen) {
+            if (n1 || n2) {
+                return !isOpen;
+            }
+            return isOpen;
+        },
+
+        profileColVisibility: function(selectedPlayer) {
+            if (selectedPlayer === 'all_values') {
+                return ['text-muted', 'd-none', 'd-none'];
+            }
+            return ['d-none', '', ''];
+        },
+
+        modalPills: function(selectedAttrs, selectedFilters, filterClassName, similarityMode) {
+            const attrMap = {
+                'avg_distance': 'Average Distance',
+                'avg_shotX': 'Side Preference',
+                'accuracy': 'Accuracy',
+                'top_quarter': 'Top Quarter'
+            };
+            const filterMap = {
+                'same-team': 'Same Team',
+                'same-year': 'Same Year'
+            };
+            const pill = function(text) {
+                return {
+                    namespace: 'dash_bootstrap_components',
+                    type: 'Badge',
+                    props: {children: text, pill: true, color: 'primary', className: 'me-1'}
+                };
+            };
+
+            let filterPills = [];
+            if ((filterClassName || '').includes('d-none')) {
+                filterClassName = 'd-none';
+            } else {
+                filterPills = (selectedFilters || []).map(f => pill(filterMap[f]));
+                filterClassName = filterPills.length > 0 ? '' : 'd-none';
+            }
+            const attrPills = similarityMode === 'shot_diet'
+                ? [pill('Shot Diet')]
+                : (selectedAttrs || []).map(a => pill(attrMap[a]));
+
+            return [attrPills, filterPills, filterClassName];
+        },
+
+        // Keeps the dropdowns and the querystring in sync: a URL change (or the data becoming ready)
+        // sets the dropdowns, and a dropdown change rewrites the URL.
+        syncUrl: function(selectedPlayer, selectedTeam, selectedYear, queryStr, dataReady) {
+            const noUpdate = window.dash_clientside.no_update;
+            // Dropdowns drop values missing from their options, so wait until the options can be loaded
+            if (!dataReady) {
+                return [noUpdate, noUpdate, noUpdate, noUpdate];
+            }
+
+            const triggered = window.dash_clientside.callback_context.triggered.map(t => t.prop_id.split('.')[0]);
+            if (triggered.includes('url') || triggered.includes('data-ready')) {
+                const args = new URLSearchParams((queryStr || '').slice(1));
+                const urlPlayer = args.get('player') || 'all_values';
+                const urlTeam = args.get('team') || 'all_values';
+                // a year that isn't a whole number (say ?year=abc) is dropped, like the dropdown drops unknown ones
+                const urlYear = /^\d+$/.test(args.get('year') || '') ? args.get('year') : 'all_values';
+                return [
+                    urlPlayer !== selectedPlayer ? urlPlayer : noUpdate,
+                    urlTeam !== selectedTeam ? urlTeam : noUpdate,
+                    urlYear !== String(selectedYear) ? urlYear : noUpdate,
+                    noUpdate
+                ];
+            }
+
+            const newArgs = new URLSearchParams();
+            if (selectedPlayer !== 'all_values') newArgs.set('player', selectedPlayer);
+            if (selectedTeam !== 'all_values') newArgs.set('team', selectedTeam);
+            if (selectedYear !== 'all_values') newArgs.set('year', selectedYear);
+
+            return [noUpdate, noUpdate, noUpdate, `/?${newArgs.toString()}`];
+        },
+
+        // imageMap is {version, players: {player: src}, teams: {team: src}}, loaded once per data version by load_image_map
+        playerImage: function(selectedPlayer, imageMap) {
+            if (!selectedPlayer || selectedPlayer === 'all_values') {
+                return defaultText('All Players');
+            }
+            const src = imageMap && imageMap.players[selectedPlayer];
+            if (!src) {
+                return defaultText(selectedPlayer);
+            }
+            return {namespace: 'dash_html_components', type: 'Img', props: {src: src, alt: selectedPlayer, height: '220'}};
+        },
+
+        teamImage: function(selectedTeam, imageMap) {
+            if (!selectedTeam || selectedTeam === 'all_values') {
+                return defaultText('All Teams');
+            }
+            const src = imageMap && imageMap.teams[selectedTeam];
+            if (!src) {
+                return defaultText(selectedTeam);
+            }
+            return {namespace: 'dash_html_components', type: 'Img', props: {src: src, alt: selectedTeam, style: {'max-height': '80px'}}};
+        }
+    }
+});
+
+function defaultText(text) {
+    return {namespace: 'dash_html_components', type: 'H3', props: {children: text, id: 'player-card-default-text'}};
+}
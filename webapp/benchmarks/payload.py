@@ -0,0 +1,102 @@
+"""
+Measures the size of the figures update_graphs sends for a selection (raw JSON, gzip and brotli)
+and the time to build, serialize and compress them, with and without compact figure encoding
+(BASKETRADAR_COMPACT_FIGURES, see figure_encoding.py).
+
+Run from the webapp folder:
+    python benchmarks/payload.py --runs 5
+    python benchmarks/payload.py -s "LeBron James" -s "LeBron James,LAL,2020"    # player[,team[,year]]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+WEBAPP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter per mode, since the encoding is chosen when components/plots.py is imported
+CHILD_SCRIPT = """
+import contextlib, gzip, io, json, statistics, sys, time
+import brotli
+from plotly.io.json import to_json_plotly
+sys.path.insert(0, {webapp_dir!r})
+with contextlib.redirect_stdout(io.StringIO()):
+    import app
+    if not app.data.wait_ready(600):
+        raise app.data.error or TimeoutError('data not ready')
+# server callbacks by name; the league's has outputs shared with update_graphs, so its key has a hash in it
+callbacks = {{c['callback'].__wrapped__.__name__: c['callback'].__wrapped__
+             for c in app.dash_app.callback_map.values() if 'callback' in c}}
+update_graphs = app.dash_app.callback_map[
+    '..distance-scatter.figure...shot-map.figure...moving-average.figure...league-graphs-request.data..']['callback'].__wrapped__
+update_league_graphs = callbacks['update_league_graphs']
+
+def build(state):
+    *figs, league_request = update_graphs(state, 'Field Goal Percentage')
+    if isinstance(league_request, dict):
+        # the whole league's graphs are drawn by a background job until its bins are cached, run inline here
+        figs = update_league_graphs(lambda *a: None, league_request)
+    return figs
+
+results = []
+for player, team, year in {selections!r}:
+    state = {{'player': player, 'team': team, 'year': year}}
+    build_times, charts = [], {{}}
+    for _ in range({runs}):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            figs = build(state)
+            build_times.append(time.perf_counter() - start)
+        for name, fig in zip(['distance scatter', 'shot map', 'trend charts'], figs):
+            start = time.perf_counter()
+            payload = to_json_plotly(fig).encode()
+            serialized = time.perf_counter()
+            gzipped = gzip.compress(payload, compresslevel=6)
+            gzipped_time = time.perf_counter()
+            brotlied = brotli.compress(payload, quality=4)
+            brotlied_time = time.perf_counter()
+            chart = charts.setdefault(name, {{'json': len(payload), 'gzip': len(gzipped), 'br': len(brotlied),
+                                              'serialize': [], 'gzip_time': [], 'br_time': []}})
+            chart['serialize'].append(serialized - start)
+            chart['gzip_time'].append(gzipped_time - serialized)
+            chart['br_time'].append(brotlied_time - gzipped_time)
+    for chart in charts.values():
+        for key in ['serialize', 'gzip_time', 'br_time']:
+            chart[key] = statistics.median(chart[key])
+    results.append({{'selection': [player, team, year], 'build': statistics.median(build_times), 'charts': charts}})
+print(json.dumps(results))
+"""
+
+def run_mode(compact, selections, runs):
+    env = dict(os.environ, BASKETRADAR_COMPACT_FIGURES='1' if compact else '0')
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD_SCRIPT.format(webapp_dir=WEBAPP_DIR, selections=selections, runs=runs)],
+        cwd=WEBAPP_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def parse_selection(value):
+    parts = [p.strip() for p in value.split(',')] + ['all_values'] * 2
+    player, team, year = parts[:3]
+    return [player or 'all_values', team or 'all_values', int(year) if year.isdigit() else 'all_values']
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--runs', type=int, default=3)
+    parser.add_argument('-s', '--selection', action='append', type=parse_selection,
+                        help='player[,team[,year]] to measure, defaults to all players, teams and years')
+    args = parser.parse_args()
+    selections = args.selection or [['all_values'] * 3]
+
+    modes = {'plain': run_mode(False, selections, args.runs), 'compact': run_mode(True, selections, args.runs)}
+    for i, selection in enumerate(selections):
+        print(f'\n{" / ".join(str(s) for s in selection)}')
+        for mode, results in modes.items():
+            print(f'  {mode:>8} update_graphs: {results[i]["build"]:.3f} sec')
+        for chart in modes['plain'][i]['charts']:
+            print(f'  {chart}')
+            for mode, results in modes.items():
+                c = results[i]['charts'][chart]
+                print(f'    {mode:>8}: json {c["json"] / 1024:9.1f} KB, gzip {c["gzip"] / 1024:8.1f} KB, br {c["br"] / 1024:8.1f} KB | '
+                      f'serialize {c["serialize"] * 1000:6.1f} ms, gzip {c["gzip_time"] * 1000:6.1f} ms, br {c["br_time"] * 1000:6.1f} ms')
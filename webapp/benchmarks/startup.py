@@ -0,0 +1,64 @@
+"""
+Measures web app cold start: time to import app.py, time until the first request is served,
+and time until /ready reports that the data is loaded.
+
+Run from the webapp folder:
+    python benchmarks/startup.py --runs 5
+    python benchmarks/startup.py --runs 3 --cold    # start each run without a local copy of the DB
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+WEBAPP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter so every run pays the full import cost
+CHILD_SCRIPT = """
+import json, sys, time
+sys.path.insert(0, {webapp_dir!r})
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get('/')
+first_request = time.perf_counter()
+while client.get('/ready').status_code != 200:
+    if app.data.error is not None:
+        raise app.data.error
+    time.sleep(0.05)
+ready = time.perf_counter()
+print(json.dumps({{
+    'import': imported - start,
+    'first_request': first_request - start,
+    'ready': ready - start,
+}}))
+"""
+
+def run_once(cold):
+    env = dict(os.environ)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cwd = tmp_dir if cold else WEBAPP_DIR
+        result = subprocess.run(
+            [sys.executable, '-c', CHILD_SCRIPT.format(webapp_dir=WEBAPP_DIR)],
+            cwd=cwd, env=env, capture_output=True, text=True, check=True
+        )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--runs', type=int, default=5)
+    parser.add_argument('--cold', action='store_true', help='run without a local copy of the database')
+    parser.add_argument('--eager', action='store_true', help='load all data before serving (BASKETRADAR_EAGER_STARTUP=1)')
+    args = parser.parse_args()
+
+    if args.eager:
+        os.environ['BASKETRADAR_EAGER_STARTUP'] = '1'
+
+    runs = [run_once(args.cold) for _ in range(args.runs)]
+    for key in ['import', 'first_request', 'ready']:
+        values = [r[key] for r in runs]
+        print(f'{key:>14}: median {statistics.median(values):.3f} sec, min {min(values):.3f} sec, max {max(values):.3f} sec')
@@ -0,0 +1,204 @@
+import threading
+import time
+from flask_caching import Cache
+from flask_caching.backends.simplecache import SimpleCache
+
+# SimpleCache keeps every value pickled, so an entry's pickled size is the memory it holds. AccountingSimpleCache
+# tracks that size with each entry's age, hits and last access, and can hold the cache to memory budgets:
+# a value over max_entry_bytes isn't kept, and while the total is over max_bytes the expired entries, then
+# the least recently used ones, are evicted. AccountingCache labels the entries of memoized functions with
+# the function and its arguments, as their keys are hashes. GET /admin/cache shows it all.
+
+# labels kept for keys that were looked up but never set
+MAX_LABELS = 10000
+
+
+class AccountingSimpleCache(SimpleCache):
+    def __init__(self, max_bytes=0, max_entry_bytes=0, **kwargs):
+        super().__init__(**kwargs)
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.evictions = {'expired': 0, 'least_recently_used': 0, 'too_large': 0}
+        self._lock = threading.Lock()
+        # key: {'size', 'created', 'last_access', 'hits'}
+        self._entries = {}
+        # key: (function, arguments), for memoized functions
+        self._labels = {}
+        self._logger = None
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        kwargs.update(max_bytes=config.get('CACHE_MAX_BYTES', 0), max_entry_bytes=config.get('CACHE_MAX_ENTRY_BYTES', 0))
+        return super().factory(app, config, args, kwargs)
+
+    def label(self, key, function, arguments):
+        if key not in self._labels:
+            self._labels[key] = (function, repr(arguments)[:200])
+
+    def get(self, key):
+        value = super().get(key)
+        item = self._cache.get(key)
+        if item is not None and (item[0] == 0 or item[0] > time.time()):
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry['hits'] += 1
+                    entry['last_access'] = time.time()
+        return value
+
+    def set(self, key, value, timeout=None):
+        result = super().set(key, value, timeout)
+        self._stored(key)
+        return result
+
+    def add(self, key, value, timeout=None):
+        result = super().add(key, value, timeout)
+        if result:
+            self._stored(key)
+        return result
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._labels.pop(key, None)
+        return super().delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._labels.clear()
+        return super().clear()
+
+    def _stored(self, key):
+        item = self._cache.get(key)
+        if item is None:
+            return
+        size = len(item[1])
+        now = time.time()
+        with self._lock:
+            if self.max_entry_bytes and size > self.max_entry_bytes:
+                self._cache.pop(key, None)
+                self.evictions['too_large'] += 1
+                print(f'Cache: not keeping {self._name(key)} ({size / 2**20:.1f} MB), over the {self.max_entry_bytes / 2**20:.1f} MB entry budget')
+                self._entries.pop(key, None)
+                self._labels.pop(key, None)
+                return
+            self._entries[key] = {'size': size, 'created': now, 'last_access': now, 'hits': 0}
+            if self.max_bytes:
+                self._enforce_budget(keep=key)
+
+    def _forget_missing(self):
+        # entries SimpleCache dropped itself, past its threshold
+        for key in [key for key in self._entries if key not in self._cache]:
+            del self._entries[key]
+            self._labels.pop(key, None)
+        # labels are added when a memoized function looks its key up, before its value is set, so they're
+        # only cleared in bulk, for calls that raised and never set one
+        if len(self._labels) > MAX_LABELS:
+            for key in [key for key in self._labels if key not in self._cache]:
+                del self._labels[key]
+
+    def _enforce_budget(self, keep):
+        self._forget_missing()
+        total = sum(entry['size'] for entry in self._entries.values())
+        if total <= self.max_bytes:
+            return
+        now = time.time()
+        # SimpleCache prunes its dict on another thread's set without this lock, so a key can be gone by now
+        expired = [key for key in self._entries if 0 < self._cache.get(key, (0,))[0] < now]
+        # a memoized function's version key is tiny, and evicting it would strand all of the function's entries
+        by_last_access = sorted((key for key in self._entries if not key.endswith('_memver')),
+                                key=lambda key: self._entries[key]['last_access'])
+        evicted = freed = 0
+        for reason, keys in [('expired', expired), ('least_recently_used', by_last_access)]:
+            for key in keys:
+                if total <= self.max_bytes:
+                    break
+                if key == keep or key not in self._entries:
+                    continue
+                size = self._entries.pop(key)['size']
+                self._cache.pop(key, None)
+                self._labels.pop(key, None)
+                self.evictions[reason] += 1
+                total -= size
+                freed += size
+                evicted += 1
+        print(f'Cache: evicted {evicted} entries ({freed / 2**20:.1f} MB) to stay within {self.max_bytes / 2**20:.1f} MB')
+
+    def _name(self, key):
+        return self._labels.get(key, (key, ''))[0]
+
+    def snapshot(self):
+        """
+        returns the totals, per function and overall, and every entry, largest first
+        """
+        now = time.time()
+        with self._lock:
+            self._forget_missing()
+            items = []
+            for key, entry in self._entries.items():
+                item = self._cache.get(key)
+                if item is None:
+                    # pruned by SimpleCache since _forget_missing
+                    continue
+                expires = item[0]
+                function, arguments = self._labels.get(key, (None, None))
+                items.append({
+                    'key': key,
+                    'function': function,
+                    'arguments': arguments,
+                    'bytes': entry['size'],
+                    'age': round(now - entry['created'], 1),
+                    'hits': entry['hits'],
+                    'idle': round(now - entry['last_access'], 1),
+                    'expires_in': round(expires - now, 1) if expires else None,
+                })
+            evictions = dict(self.evictions)
+        items.sort(key=lambda item: item['bytes'], reverse=True)
+        functions = {}
+        for item in items:
+            name = item['function'] or item['key']
+            totals = functions.setdefault(name, {'function': name, 'entries': 0, 'bytes': 0, 'hits': 0})
+            totals['entries'] += 1
+            totals['bytes'] += item['bytes']
+            totals['hits'] += item['hits']
+        return {
+            'entries': len(items),
+            'bytes': sum(item['bytes'] for item in items),
+            'max_bytes': self.max_bytes,
+            'max_entry_bytes': self.max_entry_bytes,
+            'evictions': evictions,
+            'functions': sorted(functions.values(), key=lambda totals: totals['bytes'], reverse=True),
+            'items': items,
+        }
+
+    def summary(self):
+        stats = self.snapshot()
+        largest = ', '.join(f'{totals["function"]} {totals["bytes"] / 2**20:.1f} MB ({totals["entries"]})'
+                            for totals in stats['functions'][:3])
+        budget = f' of {self.max_bytes / 2**20:.0f} MB' if self.max_bytes else ''
+        return f'Cache: {stats["entries"]} entries, {stats["bytes"] / 2**20:.1f} MB{budget}; largest: {largest or "none"}'
+
+    def log_every(self, interval):
+        """
+        prints a summary every interval seconds on a daemon thread
+        """
+        def log():
+            while True:
+                time.sleep(interval)
+                print(self.summary())
+
+        self._logger = threading.Thread(target=log, name='cache-summary', daemon=True)
+        self._logger.start()
+
+
+class AccountingCache(Cache):
+    def _memoize_make_cache_key(self, *args, **kwargs):
+        make_cache_key = super()._memoize_make_cache_key(*args, **kwargs)
+
+        def labelled_cache_key(f, *f_args, **f_kwargs):
+            key = make_cache_key(f, *f_args, **f_kwargs)
+            if isinstance(self.cache, AccountingSimpleCache):
+                self.cache.label(key, f.__name__, f_args + tuple(f_kwargs.items()))
+            return key
+        return labelled_cache_key
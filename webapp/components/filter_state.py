@@ -0,0 +1,75 @@
+from dash import Output, Input, State, no_update
+import pandas as pd
+import queries
+from single_flight import single_flight
+
+# A change to any of the three dropdowns (or the URL sync re-setting them) used to fire every dependent
+# callback, each re-querying SQLite for overlapping data. Instead, resolve_filter_state turns the dropdowns
+# into one `filter-state` value, and only writes it when the selection actually changed. Callbacks that
+# depend on the selection take `filter-state` as their input and read the shared data with `get_selection`,
+# which is fetched once per (player, team, year, data version) and cached server side.
+
+def parse_year(value):
+    """
+    returns the year as an int, or 'all_values' for no year or one that isn't a whole number
+    """
+    # years come back from the URL as strings and from the dropdown as ints
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 'all_values'
+
+def create_filter_state_callbacks(dash_app, data, cache):
+    @single_flight.wrap
+    @cache.memoize()
+    def selection_data(player_name, team, year, version):
+        conn = data.conn_for(version)
+
+        def options(column, **filters):
+            sql_query, params = queries.filter_options_query(column, **filters)
+            return pd.read_sql(sql_query, conn, params=params)[column].tolist()
+
+        profile = None
+        if player_name != 'all_values':
+            sql_query, params = queries.profile_query(player_name, team, year)
+            rows = pd.read_sql(sql_query, conn, params=params).to_dict('records')
+            profile = rows[0] if rows else None
+
+        return {
+            'player_options': options('player', team=team, year=year),
+            'team_options': options('team', player_name=player_name, year=year),
+            'year_options': options('year', player_name=player_name, team=team),
+            'profile': profile,
+        }
+
+    def get_selection(state, version=None):
+        """
+        returns the options and profile for a filter state, from the cache filled by resolve_filter_state
+        """
+        # keyed on the live version rather than stored in the state, so a data swap is picked up by the next interaction
+        return selection_data(state['player'], state['team'], state['year'], version or data.version)
+
+    @dash_app.callback(
+        Output('filter-state', 'data'),
+        Input('crossfilter-player', 'value'),
+        Input('crossfilter-team', 'value'),
+        Input('crossfilter-year', 'value'),
+        Input('data-ready', 'data'),
+        State('filter-state', 'data')
+    )
+    def resolve_filter_state(selected_player, selected_team, selected_year, data_ready, cur_state):
+        if not data_ready:
+            return None if cur_state is not None else no_update
+
+        state = {
+            'player': selected_player or 'all_values',
+            'team': selected_team or 'all_values',
+            'year': parse_year(selected_year)
+        }
+        if state == cur_state:
+            return no_update
+
+        get_selection(state)
+        return state
+
+    return get_selection
@@ -1,19 +1,63 @@
 import numpy as np
-import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-# import dash_bootstrap_components as dbc
-from dash import Output, Input, dcc, html
+import dash_bootstrap_components as dbc
+from dash import Output, Input, State, Patch, ctx, no_update, dcc, html
 from utils import draw_plotly_court
+import queries
+import shot_binning
+from single_flight import single_flight
+import job_results
+from profiling import profiled
+from figure_encoding import compact_figure, compact_trace, COMPACT_FIGURES_ENV
 import pandas as pd
 import time
+import os
 # from datetime import timedelta
 from dateutil.relativedelta import relativedelta
 
 
 distance_scatter = dcc.Loading(dcc.Graph(id='distance-scatter'))
 moving_average = dcc.Loading(dcc.Graph(id='moving-average'))
+zone_efficiency = dcc.Loading(dcc.Graph(id='zone-efficiency'))
 shot_map = dcc.Loading(dcc.Graph(id='shot-map',style={'marginLeft': 'auto', 'marginRight': 'auto'}))
+# The bin size zoom_shot_map last patched into the shot map, None while it shows the one update_graphs drew
+shot_map_bins = dcc.Store(id='shot-map-bins')
+# Set by update_graphs to have update_league_graphs draw the whole league's graphs as a background job
+league_graphs_request = dcc.Store(id='league-graphs-request')
+# Shown while update_league_graphs runs
+graphs_progress = dbc.Progress(id='graphs-progress', value=0, max=4, className='d-none', style={'height': '4px'})
+shot_map_metric = dbc.RadioItems(
+    id='shotmap-metric',
+    options=[
+        {'label': 'FG%', 'value': shot_binning.FG_PCT},
+        {'label': 'vs. League Average', 'value': shot_binning.VS_LEAGUE}
+    ],
+    value=shot_binning.FG_PCT,
+    inline=True,
+    className='ms-5'
+)
+# zones from clean_data.assign_zone in data_processing/data_cleaning_library.py
+ZONE_NAMES = {
+    1: 'Left Corner 3',
+    2: 'Right Corner 3',
+    3: 'Top of the Arc 3',
+    4: 'Deep 3 (Sides)',
+    5: 'Deep 3 (Straight On)',
+    6: 'Left Wing Mid-Range',
+    7: 'Right Wing Mid-Range',
+    8: 'Top of the Key Mid-Range',
+    9: 'Left Baseline Mid-Range',
+    10: 'Right Baseline Mid-Range',
+    11: 'Lower Paint',
+    12: 'Upper Paint',
+    13: 'Paint Edges',
+    14: 'Restricted Area',
+    15: 'At the Rim',
+    16: 'Dunk Zone',
+    0: 'Other',
+}
+THREE_POINT_ZONES = {1, 2, 3, 4, 5}
 # controls_metric = dbc.Card(
 #     [
 #         html.Div(
@@ -33,366 +77,688 @@ shot_map = dcc.Loading(dcc.Graph(id='shot-map',style={'marginLeft': 'auto', 'mar
 #     ],
 # )
 
-def create_plot_callbacks(dash_app, conn, cache):
-    def filter_db_data(player_name, team, year):
-        sql_query = f"""
-            select 
-                shot_type, 
-                distance, 
-                made, 
-                shotX, 
-                shotY,
-                date,
-                year
-            from shots
-            where
-                1 = 1
-                {'and player = (?)' if player_name != 'all_values' else ''}
-                {'and team = (?)' if team != 'all_values' else ''}
-                {'and year = (?)' if year != 'all_values' else ''}
-        """
+# Figures are sent as typed arrays rounded to display precision (see figure_encoding.py);
+# set BASKETRADAR_COMPACT_FIGURES=0 to send plain plotly JSON instead
+compact_figures = os.environ.get(COMPACT_FIGURES_ENV, '1') != '0'
 
-        params = []
-        if player_name and player_name != 'all_values':
-            params = params + [player_name]
-        if team and team != 'all_values':
-            params = params + [team]
-        if year and year != 'all_values':
-            params = params + [int(year)]
-        print(f'params: \n{params}')
+def placeholder_figure(height, text='Loading data...'):
+    fig = go.Figure()
+    fig.update_layout(
+        height=height,
+        plot_bgcolor='white',
+        xaxis=dict(visible=False),
+        yaxis=dict(visible=False),
+        annotations=[dict(text=text, showarrow=False, xref='paper', yref='paper', x=0.5, y=0.5, font=dict(size=16))]
+    )
+    return fig
 
+def visible_ranges(relayout_data):
+    """
+    returns the (x range, y range) shown after a shot map relayout, or None if it didn't zoom or pan
+    """
+    if not relayout_data:
+        return None
+    ranges = []
+    for axis, full_range in [('xaxis', shot_binning.X_RANGE), ('yaxis', shot_binning.Y_RANGE)]:
+        if relayout_data.get(f'{axis}.autorange'):
+            ranges.append(full_range)
+        elif f'{axis}.range[0]' in relayout_data:
+            ranges.append((relayout_data[f'{axis}.range[0]'], relayout_data[f'{axis}.range[1]']))
+        elif f'{axis}.range' in relayout_data:
+            ranges.append(tuple(relayout_data[f'{axis}.range']))
+        else:
+            ranges.append(None)
+    if ranges == [None, None]:
+        return None
+    return ranges[0] or shot_binning.X_RANGE, ranges[1] or shot_binning.Y_RANGE
+
+def shot_map_values(level, metric):
+    return {'x': level['x'], 'y': level['y'], 'z': shot_binning.bin_values(level, metric)}
+
+def shot_map_style(metric):
+    """
+    returns the contour properties and title that depend on the shot map metric
+    """
+    if metric == shot_binning.VS_LEAGUE:
+        # colorblind-safe diverging colorscale from https://colorbrewer2.org/#type=diverging&scheme=RdBu&n=9
+        colorscale = ['#2166ac', '#4393c3', '#92c5de', '#d1e5f0', '#f7f7f7', '#fddbc7', '#f4a582', '#d6604d', '#b2182b']
+        return {
+            'colorscale': [[i / 8, color] for i, color in enumerate(colorscale)],
+            # bins with a handful of shots swing far past this, so the scale is fixed rather than fit to them
+            'zmin': -0.2,
+            'zmax': 0.2,
+            'hovertemplate': "<b>FG% vs. league average</b>: %{z:+.2%}<br><extra></extra>",
+            'colorbar': {'title': {'text': 'vs. league'}, 'tickformat': '+.0%'},
+        }, 'Shooting Accuracy vs. League Average'
+    # colorblind-safe colorscale from https://colorbrewer2.org/#type=sequential&scheme=OrRd&n=9
+    custom_colorscale = [
+        [0.0, '#fff7ec'],
+        [0.11, '#fee8c8'],
+        [0.22, '#fdd49e'],
+        [0.33, '#fdbb84'],
+        [0.44, '#fc8d59'],
+        [0.56, '#ef6548'],
+        [0.67, '#d7301f'],
+        [0.78, '#b30000'],
+        [1.0, '#7f0000']
+    ]
+    return {
+        'colorscale': custom_colorscale,
+        'zmin': None,
+        'zmax': None,
+        'hovertemplate': (
+            f"<b>{metric}</b>: %{{z:.2%}}<br>"
+            "<extra></extra>"
+        ),
+        'colorbar': {'title': {'text': 'FG%'}, 'tickformat': '.0%'},
+    }, 'Shooting Accuracy Shot Map'
+
+# Figure builders, used by the callbacks below and by export_charts.py outside of Dash
+
+def load_shots(conn, player_name, team, year):
+    """
+    returns the shots for a player/team/year filter, with their dates and court coordinates
+    """
+    sql_query, params = queries.shots_query(player_name, team, year)
+    print(f'params: \n{params}')
+
+    start_time = time.time()
+    dff = pd.read_sql(sql_query, conn, params=params) if len(params) > 0 else pd.read_sql(sql_query, conn)
+    dff['date'] = pd.to_datetime(dff.pop('day'), unit='D')
+    dff['shotX_'] = dff['shotX'] / 50 * 500 - 250
+    dff['shotY_'] = dff['shotY'] / 47 * 470 - 52.5
+    print(f'DF loaded in {time.time() - start_time} sec')
+    return dff
+
+def agg_ma_data(dff):
+    start_time = time.time()
+    # dff may be shared with other requests, so it's copied rather than modified
+    dff = dff.assign(date=pd.to_datetime(dff['date'])).sort_values(by='date')
+    moving_avg_df = dff[['date', 'shot_type', 'made']].groupby(['date', 'shot_type']).mean().reset_index().pivot_table(
+        index='date', 
+        columns='shot_type', 
+        values='made', 
+        fill_value=np.nan
+    )
+    moving_avg_df.columns.name = None
+    moving_avg_df=moving_avg_df.rolling(window=3).mean()
+    print(f'    ma agg took {time.time() - start_time} sec')
+
+    return moving_avg_df
+
+def load_league_baseline(conn):
+    """
+    returns the league's attempts and makes per season by shot map cell and zone (see shot_binning.league_baseline)
+    """
+    cells_df = pd.read_sql(queries.league_baseline_cells_query()[0], conn)
+    zones_df = pd.read_sql(queries.league_baseline_zones_query()[0], conn)
+    return shot_binning.league_baseline(cells_df, zones_df)
+
+def bin_selection(dff, baseline):
+    """
+    returns the shot map pyramid for the selected shots, with the league's expected makes when there's a baseline
+    """
+    start_time = time.time()
+    expected = None
+    if baseline is not None:
+        expected = shot_binning.league_fg_pct(baseline, dff['shotX_'], dff['shotY_'], dff['year'], dff['zone'])
+    pyramid = shot_binning.bin_shots(dff['shotX_'], dff['shotY_'], dff['made'], expected)
+    print(f'shots binned in {time.time() - start_time} sec')
+    return pyramid
+
+def distance_accuracy(dff):
+    """
+    returns the share of shots made and the number of shots at each distance, per shot type
+    """
+    agg_dist_df = dff.groupby(['distance', 'shot_type']).agg(
+        average_made=('made', 'mean'),
+        count_shots=('made', 'count')
+    ).reset_index()
+    # drop points that are less than 22 ft from basket yet labeled a 3-pointer
+    agg_dist_df = agg_dist_df.drop(agg_dist_df[(agg_dist_df.distance<22) & (agg_dist_df.shot_type==3)].index)
+    # drop points that are more than 23 ft from basket yet labeled a 2-pointer
+    agg_dist_df = agg_dist_df.drop(agg_dist_df[(agg_dist_df.distance>23) & (agg_dist_df.shot_type==2)].index)
+    return agg_dist_df
+
+def scatter_figure(dff):
+    """
+    returns the shooting accuracy by distance chart for the selected shots
+    """
+    if dff.empty:
+        import plotly.express as px
+        return px.scatter(title="No data available for the selected filters.")
+    else:
         start_time = time.time()
-        dff = pd.read_sql(sql_query, conn, params=params) if len(params) > 0 else pd.read_sql(sql_query, conn)
-        dff['shotX_'] = dff['shotX'] / 50 * 500 - 250
-        dff['shotY_'] = dff['shotY'] / 47 * 470 - 52.5
-        print(f'DF loaded in {time.time() - start_time} sec')
-        return dff
-    
-    def agg_ma_data(dff):
-        start_time = time.time()
-        dff['date'] = pd.to_datetime(dff['date'])
-        dff = dff.sort_values(by='date')
-        moving_avg_df = dff[['date', 'shot_type', 'made']].groupby(['date', 'shot_type']).mean().reset_index().pivot_table(
-            index='date', 
-            columns='shot_type', 
-            values='made', 
-            fill_value=np.nan
+        agg_dist_df = distance_accuracy(dff)
+        agg_dist_df['shot_type_label'] = agg_dist_df.shot_type.astype(str) + '-pointer'
+
+        print(f'DF aggregated in {time.time() - start_time} sec')
+
+        fig = go.Figure(data=[go.Scatter(
+            x=agg_dist_df['distance'],
+            y=agg_dist_df['average_made'],
+            mode='markers',
+            marker=dict(
+                size=agg_dist_df['count_shots'],
+                sizemode='area',
+                sizeref=(2. * max(agg_dist_df['count_shots'])/(40 ** 2)),
+                color=['dodgerblue' if shot_type == '2-pointer' else '#fc8d59' 
+                    for shot_type in agg_dist_df['shot_type_label']],
+                sizemin=2
+            ),
+            text=agg_dist_df['distance'], 
+        )])
+        fig.update_layout(
+            title='Shooting Accuracy by Distance from Basket',
+            xaxis_title='Distance (feet)',
+            yaxis_title='FG%',
         )
-        moving_avg_df.columns.name = None
-        moving_avg_df=moving_avg_df.rolling(window=3).mean()
-        print(f'    ma agg took {time.time() - start_time} sec')
+        fig.update_traces(hovertemplate=(
+            "<b>%{x} feet</b><br>"
+            "FG%: %{y:.2%}<br>"
+            "%{marker.size:,} shot attempts<br>"
+            "<extra></extra>"
+        ))
+        fig.update_layout(
+            plot_bgcolor="white",
+            height=250,
+            margin={'l': 40, 'b': 40, 't': 40, 'r': 0},
+            yaxis=dict(
+                title='FG%',
+                tickformat='2%',
+                showgrid=True, 
+                gridcolor='LightGray',
+                dtick=0.2
+            ),
+            legend=dict(
+                orientation="h",
+                yanchor="top",
+                y=1,
+                xanchor="right",
+                x=0.99
+            )
+        )
+        return fig
 
-        return moving_avg_df
+def shot_map_figure(pyramid, metric, uirevision=None):
+    """
+    returns the shot map for a pyramid from bin_selection, or a blank one when pyramid is None (no shots)
+    """
+    if pyramid is None:
+        return go.Figure(data=[go.Scatter(x=[], y=[], mode='text', text=["No data available for the selected filters."])])
+    else:
+        # binned on the server rather than in the browser, at the size that suits the full court (see shot_binning.py)
+        level = pyramid[shot_binning.pick_bin_size(pyramid)]
+        if 'expected' not in level:
+            metric = shot_binning.FG_PCT
+        style, title = shot_map_style(metric)
+        colorbar = style.pop('colorbar')
+        shotmap_fig = go.Figure()
+        draw_plotly_court(shotmap_fig, fig_width=850, margins=0)
+        shotmap_fig.add_trace(go.Contour(
+            **shot_map_values(level, metric),
+            **style,
+            line=dict(width=0),
+            hoverinfo='x+y+z',
+            showscale=True,
+            colorbar=dict(
+                **colorbar,
+                orientation='h',
+                x=0.5,
+                y=-0.1, 
+                xanchor='center', 
+                yanchor='bottom', 
+                # thickness=15,
+                len=0.8
+            ),
+            colorbar_xpad=False,
+            colorbar_ypad=False,
+        ))
+        shotmap_fig.update_layout(
+            title=dict(
+                text=title,
+                x=0.06,
+                y=0.99,
+                xanchor='left',  
+                yanchor='top'
+            ),
+            autosize=True, 
+            margin=dict(l=0, r=0, t=35, b=0),  
+            # keeps the user's zoom when zoom_shot_map patches in another bin size
+            uirevision=uirevision,
+        )
+        shotmap_fig.update_xaxes(fixedrange=False)
+        shotmap_fig.update_yaxes(fixedrange=False)
+        return shotmap_fig
 
-    # Preload and cache unfiltered dataframe
-    @cache.cached(key_prefix='unfiltered_data', timeout=0)
-    def preload_unfiltered_data():
-        return filter_db_data(*['all_values'] * 3)
-    preload_unfiltered_data()
+def trend_figure(moving_avg_df):
+    """
+    returns the moving average charts for the moving averages from agg_ma_data
+    """
+    moving_avg_df=moving_avg_df.rename(columns={col: str(col) for col in moving_avg_df.columns})
 
-    # Preload and cache moving avg agg on unfiltered dataframe
-    @cache.memoize(timeout=0)
-    def preload_unfiltered_ma():
-        return agg_ma_data(preload_unfiltered_data())
-    preload_unfiltered_ma()
+    last_date = moving_avg_df.index.max()
+    six_mo_ago = last_date - relativedelta(months=6)
+    first_date = max(moving_avg_df.index.min(), six_mo_ago)
+    date_range_index = pd.Index(pd.date_range(start=moving_avg_df.index[0], end=moving_avg_df.index[-1]).date)
+    dt_breaks = date_range_index.difference(moving_avg_df.index).tolist()
 
-    #create & update plots
-    @dash_app.callback(
-        Output('distance-scatter', 'figure'),
-        Output('shot-map', 'figure'),
-        Output('moving-average', 'figure'),
-        Input('crossfilter-player', 'value'),
-        Input('crossfilter-team', 'value'),
-        Input('crossfilter-year', 'value'),
-        # Input('shotmap-metric', 'value')
+    fig_moving_avg = make_subplots(
+        rows=2,
+        cols=1,
+        shared_xaxes=True, 
+        vertical_spacing=0.00,
     )
-    def update_graphs(player_name, team, year, metric='Field Goal Percentage'):
-        def update_scatter(dff):
-            if dff.empty:
-                return px.scatter(title="No data available for the selected filters.")
-            else:
-                start_time = time.time()
-                agg_dist_df = dff.groupby(['distance', 'shot_type']).agg(
-                    average_made=('made', 'mean'),
-                    count_shots=('made', 'count')
-                ).reset_index()
-                agg_dist_df['shot_type_label'] = agg_dist_df.shot_type.astype(str) + '-pointer'
-                # drop points that are less than 22 ft from basket yet labeled a 3-pointer
-                agg_dist_df = agg_dist_df.drop(agg_dist_df[(agg_dist_df.distance<22) & (agg_dist_df.shot_type==3)].index)
-                # drop points that are more than 23 ft from basket yet labeled a 2-pointer
-                agg_dist_df = agg_dist_df.drop(agg_dist_df[(agg_dist_df.distance>23) & (agg_dist_df.shot_type==2)].index)
-                
-                print(f'DF aggregated in {time.time() - start_time} sec')
-
-                fig = go.Figure(data=[go.Scatter(
-                    x=agg_dist_df['distance'],
-                    y=agg_dist_df['average_made'],
-                    mode='markers',
-                    marker=dict(
-                        size=agg_dist_df['count_shots'],
-                        sizemode='area',
-                        sizeref=(2. * max(agg_dist_df['count_shots'])/(40 ** 2)),
-                        color=['dodgerblue' if shot_type == '2-pointer' else '#fc8d59' 
-                            for shot_type in agg_dist_df['shot_type_label']],
-                        sizemin=2
-                    ),
-                    text=agg_dist_df['distance'], 
-                )])
-                fig.update_layout(
-                    title='Shooting Accuracy by Distance from Basket',
-                    xaxis_title='Distance (feet)',
-                    yaxis_title='FG%',
-                )
-                fig.update_traces(hovertemplate=(
-                    "<b>%{x} feet</b><br>"
-                    "FG%: %{y:.2%}<br>"
-                    "%{marker.size:,} shot attempts<br>"
-                    "<extra></extra>"
-                ))
-                fig.update_layout(
-                    plot_bgcolor="white",
-                    height=250,
-                    margin={'l': 40, 'b': 40, 't': 40, 'r': 0},
-                    yaxis=dict(
-                        title='FG%',
-                        tickformat='2%',
-                        showgrid=True, 
-                        gridcolor='LightGray',
-                        dtick=0.2
-                    ),
-                    legend=dict(
-                        orientation="h",
-                        yanchor="top",
-                        y=1,
-                        xanchor="right",
-                        x=0.99
-                    )
-                )
-                return fig
-
-        def update_shot_map(dff, metric):
-            if dff.empty:
-                return go.Figure(data=[go.Scatter(x=[], y=[], mode='text', text=["No data available for the selected filters."])])
-            else:
-                # colorblind-safe colorscale from https://colorbrewer2.org/#type=sequential&scheme=OrRd&n=9
-                custom_colorscale = [
-                    [0.0, '#fff7ec'],
-                    [0.11, '#fee8c8'],
-                    [0.22, '#fdd49e'],
-                    [0.33, '#fdbb84'],
-                    [0.44, '#fc8d59'],
-                    [0.56, '#ef6548'],
-                    [0.67, '#d7301f'],
-                    [0.78, '#b30000'],
-                    [1.0, '#7f0000']
-                ]
-                metric_histfunc = "avg" if metric == 'Field Goal Percentage' else "count"
-                x_bin_size = 15
-                y_bin_size = 15
-                shotmap_fig = go.Figure()
-                draw_plotly_court(shotmap_fig, fig_width=850, margins=0)
-                shotmap_fig.add_trace(go.Histogram2dContour(
-                    x=dff['shotX_'],
-                    y=dff['shotY_'],
-                    z=dff['made'], 
-                    histfunc=metric_histfunc,
-                    colorscale=custom_colorscale,
-                    line=dict(width=0),
-                    hoverinfo='x+y+z',
-                    hovertemplate=(
-                        f"<b>{metric}</b>: %{{z:.2%}}<br>"
-                        "<extra></extra>"
-                    ),
-                    xbins=dict(start=-250, end=250, size=x_bin_size),
-                    ybins=dict(start=-52.5, end=417.5, size=y_bin_size),
-                    showscale=True,
-                    colorbar=dict(
-                        title='FG%',
-                        orientation='h',
-                        x=0.5,
-                        y=-0.1, 
-                        xanchor='center', 
-                        yanchor='bottom', 
-                        tickformat='.0%',
-                        # thickness=15,
-                        len=0.8
-                    ),
-                    colorbar_xpad=False,
-                    colorbar_ypad=False,
-                ))
-                shotmap_fig.update_layout(
-                    title=dict(
-                        text='Shooting Accuracy Shot Map',
-                        x=0.06,
-                        y=0.99,
-                        xanchor='left',  
-                        yanchor='top'
-                    ),
-                    autosize=True, 
-                    margin=dict(l=0, r=0, t=35, b=0),  
-                )
-                return shotmap_fig
-        
-        def update_trend_charts(dff):
-
-            if player_name == 'all_values' and team == 'all_values' and year == 'all_values':
-                moving_avg_df = preload_unfiltered_ma()
-            else:
-                moving_avg_df = agg_ma_data(dff)            
-            moving_avg_df=moving_avg_df.rename(columns={col: str(col) for col in moving_avg_df.columns})
-
-            last_date = moving_avg_df.index.max()
-            six_mo_ago = last_date - relativedelta(months=6)
-            first_date = max(moving_avg_df.index.min(), six_mo_ago)
-            date_range_index = pd.Index(pd.date_range(start=moving_avg_df.index[0], end=moving_avg_df.index[-1]).date)
-            dt_breaks = date_range_index.difference(moving_avg_df.index).tolist()
-
-            fig_moving_avg = make_subplots(
-                rows=2,
-                cols=1,
-                shared_xaxes=True, 
-                vertical_spacing=0.00,
+
+    for i, col in enumerate(['2','3'], start=1):
+        average_rate = moving_avg_df[col].mean()
+        above_avg = np.where(moving_avg_df[col] > average_rate, moving_avg_df[col], average_rate)
+        below_avg = np.where(moving_avg_df[col] < average_rate, moving_avg_df[col], average_rate)
+
+        fig_moving_avg.add_trace(go.Scatter(
+            x=[moving_avg_df.index.min(),moving_avg_df.index.max()],
+            y=[average_rate, average_rate],
+            mode='lines',
+            line_color="rgba(0,0,0,0)",
+            showlegend=False
+        ), row=i, col=1)
+
+        fig_moving_avg.add_trace(go.Scatter(
+            x=moving_avg_df.index,
+            y=below_avg,
+            fill='tonexty',
+            mode='none',
+            fillcolor='lightcoral',
+            showlegend=False,
+            hovertemplate=(
+                "<b>%{x}</b><br>"
+                f"{col}-pointer" + " moving average: %{y:.2%} (below average)"
+                "<extra></extra>"),
+        ), row=i, col=1)
+
+        fig_moving_avg.add_trace(go.Scatter(
+            x=[moving_avg_df.index.min(),moving_avg_df.index.max()],
+            y=[average_rate, average_rate],
+            mode='lines',
+            line_color="rgba(0,0,0,0)",
+            showlegend=False
+        ), row=i, col=1)
+
+        fig_moving_avg.add_trace(go.Scatter(
+            x=moving_avg_df.index,
+            y=above_avg,
+            fill='tonexty',
+            mode='none',
+            fillcolor='rgba(0, 109, 44, 0.4)',
+            showlegend=False,
+            hovertemplate=(
+                "<b>%{x}</b><br>"
+                f"{col}-pointer" + " moving average: %{y:.2%} (above average)"
+                "<extra></extra>"),
+        ), row=i, col=1)
+
+        # a constant line only needs its end points
+        fig_moving_avg.add_trace(go.Scatter(
+            x=[moving_avg_df.index.min(),moving_avg_df.index.max()],
+            y=[average_rate, average_rate],
+            mode='lines',
+            line=dict(color='Black', dash='dash'),
+            showlegend=False,
+            name=f'average {col}-pointer %',
+            hovertemplate=(
+                "<b>%{x}</b><br>"
+                f"{col}-pointer" + " overall average: %{y:.2%}<extra></extra>"
+                "<extra></extra>"),
+        ), row=i, col=1)
+
+        fig_moving_avg.update_xaxes(
+            title='Date' if i == 2 else '',
+            type="date",
+            range=[first_date, last_date],
+            rangebreaks=[dict(values=dt_breaks)],
+            row=i,
+            col=1
+        )
+        if i == 1:
+            fig_moving_avg.update_xaxes(
+                rangeselector=dict(
+                    buttons=list([
+                        dict(count=7, label="1w", step="day", stepmode="backward"),
+                        dict(count=1, label="1m", step="month", stepmode="backward"),
+                        dict(count=6, label="6m", step="month", stepmode="backward"),
+                        dict(count=1, label="YTD", step="year", stepmode="todate"),
+                        dict(count=1, label="1y", step="year", stepmode="backward"),
+                        dict(step="all")
+                    ])
+                ),
+                row=i,
+                col=1
             )
 
-            for i, col in enumerate(['2','3'], start=1):
-                average_rate = moving_avg_df[col].mean()
-                above_avg = np.where(moving_avg_df[col] > average_rate, moving_avg_df[col], average_rate)
-                below_avg = np.where(moving_avg_df[col] < average_rate, moving_avg_df[col], average_rate)
-
-                fig_moving_avg.add_trace(go.Scatter(
-                    x=[moving_avg_df.index.min(),moving_avg_df.index.max()],
-                    y=[average_rate, average_rate],
-                    mode='lines',
-                    line_color="rgba(0,0,0,0)",
-                    showlegend=False
-                ), row=i, col=1)
-
-                fig_moving_avg.add_trace(go.Scatter(
-                    x=moving_avg_df.index,
-                    y=below_avg,
-                    fill='tonexty',
-                    mode='none',
-                    fillcolor='lightcoral',
-                    showlegend=False,
-                    hovertemplate=(
-                        "<b>%{x}</b><br>"
-                        f"{col}-pointer" + " moving average: %{y:.2%} (below average)"
-                        "<extra></extra>"),
-                ), row=i, col=1)
-
-                fig_moving_avg.add_trace(go.Scatter(
-                    x=[moving_avg_df.index.min(),moving_avg_df.index.max()],
-                    y=[average_rate, average_rate],
-                    mode='lines',
-                    line_color="rgba(0,0,0,0)",
-                    showlegend=False
-                ), row=i, col=1)
-
-                fig_moving_avg.add_trace(go.Scatter(
-                    x=moving_avg_df.index,
-                    y=above_avg,
-                    fill='tonexty',
-                    mode='none',
-                    fillcolor='rgba(0, 109, 44, 0.4)',
-                    showlegend=False,
-                    hovertemplate=(
-                        "<b>%{x}</b><br>"
-                        f"{col}-pointer" + " moving average: %{y:.2%} (above average)"
-                        "<extra></extra>"),
-                ), row=i, col=1)
-
-                fig_moving_avg.add_trace(go.Scatter(
-                    x=moving_avg_df.index,
-                    y=[average_rate] * len(moving_avg_df.index),
-                    mode='lines',
-                    line=dict(color='Black', dash='dash'),
-                    showlegend=False,
-                    name=f'average {col}-pointer %',
-                    hovertemplate=(
-                        "<b>%{x}</b><br>"
-                        f"{col}-pointer" + " overall average: %{y:.2%}<extra></extra>"
-                        "<extra></extra>"),
-                ), row=i, col=1)
-
-                fig_moving_avg.update_xaxes(
-                    title='Date' if i == 2 else '',
-                    type="date",
-                    range=[first_date, last_date],
-                    rangebreaks=[dict(values=dt_breaks)],
-                    row=i,
-                    col=1
-                )
-                if i == 1:
-                    fig_moving_avg.update_xaxes(
-                        rangeselector=dict(
-                            buttons=list([
-                                dict(count=7, label="1w", step="day", stepmode="backward"),
-                                dict(count=1, label="1m", step="month", stepmode="backward"),
-                                dict(count=6, label="6m", step="month", stepmode="backward"),
-                                dict(count=1, label="YTD", step="year", stepmode="todate"),
-                                dict(count=1, label="1y", step="year", stepmode="backward"),
-                                dict(step="all")
-                            ])
-                        ),
-                        row=i,
-                        col=1
-                    )
-
-                fig_moving_avg.update_yaxes(
-                    title=f'Moving Average',
-                    tickformat='2%',
-                    showgrid=True,
-                    gridcolor='LightGray',
-                    nticks=4,
-                    row=i,
-                    col=1        
-                )
-
-            fig_moving_avg.update_layout(
-                title='Shooting Accuracy 3-day Moving Average',
-                plot_bgcolor='white',
-                height=550,
-                annotations=[
-                    dict(
-                        yanchor="bottom",
-                        y=0.95,
-                        xanchor="right",
-                        x=0.99,
-                        xref='paper', 
-                        yref='paper',
-                        text='2-Pointer',
-                        showarrow=False,
-                        font=dict(size=14)
-                    ),
-                    dict(
-                        yanchor="bottom",
-                        y=0.4,
-                        xanchor="right",
-                        x=0.99,
-                        xref='paper', 
-                        yref='paper',
-                        text='3-Pointer',
-                        showarrow=False,
-                        font=dict(size=14)
-                    )
-                ]
+        fig_moving_avg.update_yaxes(
+            title=f'Moving Average',
+            tickformat='2%',
+            showgrid=True,
+            gridcolor='LightGray',
+            nticks=4,
+            row=i,
+            col=1        
+        )
+
+    fig_moving_avg.update_layout(
+        title='Shooting Accuracy 3-day Moving Average',
+        plot_bgcolor='white',
+        height=550,
+        annotations=[
+            dict(
+                yanchor="bottom",
+                y=0.95,
+                xanchor="right",
+                x=0.99,
+                xref='paper', 
+                yref='paper',
+                text='2-Pointer',
+                showarrow=False,
+                font=dict(size=14)
+            ),
+            dict(
+                yanchor="bottom",
+                y=0.4,
+                xanchor="right",
+                x=0.99,
+                xref='paper', 
+                yref='paper',
+                text='3-Pointer',
+                showarrow=False,
+                font=dict(size=14)
             )
-            return fig_moving_avg
+        ]
+    )
+    return fig_moving_avg
+
+def load_zone_stats(conn, player_name, team, year):
+    """
+    returns the attempts, makes and points per zone for a player/team/year filter
+    """
+    sql_query, params = queries.zone_stats_query(player_name, team, year)
+    return pd.read_sql(sql_query, conn, params=params)
+
+def zone_efficiency_figure(zones, league):
+    """
+    returns the points per attempt by zone chart for the zone stats of the selection and of the league
+    """
+    zones = zones.merge(league, on='zone', how='left', suffixes=('', '_league'))
+    zones = zones[zones['zone'].isin(ZONE_NAMES)].sort_values('zone', ascending=False)
+    names = zones['zone'].map(ZONE_NAMES)
+
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=zones['points'] / zones['attempts'],
+        y=names,
+        orientation='h',
+        marker_color=['#fc8d59' if zone in THREE_POINT_ZONES else 'dodgerblue' for zone in zones['zone']],
+        customdata=np.stack([zones['attempts'], zones['makes'] / zones['attempts']], axis=-1),
+        hovertemplate=(
+            "<b>%{y}</b><br>"
+            "%{x:.2f} points per attempt<br>"
+            "FG%: %{customdata[1]:.2%}<br>"
+            "%{customdata[0]:,} shot attempts"
+            "<extra></extra>"
+        ),
+        name='Selection',
+    ))
+    fig.add_trace(go.Scatter(
+        x=zones['points_league'] / zones['attempts_league'],
+        y=names,
+        mode='markers',
+        marker=dict(symbol='line-ns-open', size=18, color='black', line=dict(width=2)),
+        hovertemplate="League: %{x:.2f} points per attempt<extra></extra>",
+        name='League Average',
+    ))
+    fig.update_layout(
+        title='Points per Attempt by Zone',
+        plot_bgcolor='white',
+        height=350,
+        margin={'l': 40, 'b': 40, 't': 40, 'r': 0},
+        xaxis=dict(title='Points per Attempt', showgrid=True, gridcolor='LightGray', rangemode='tozero'),
+        legend=dict(orientation='h', yanchor='bottom', y=1, xanchor='right', x=0.99),
+    )
+    return fig
 
+def create_plot_callbacks(dash_app, data, cache):
+    # Concurrent requests for the same selection share one query (see single_flight.py)
+    @single_flight.wrap
+    def filter_db_data(player_name, team, year, version):
+        return load_shots(data.conn_for(version), player_name, team, year)
+    
+    # Preload and cache unfiltered dataframe for each data version before it goes live
+    @data.add_warmup
+    @cache.memoize(timeout=0)
+    def preload_unfiltered_data(version):
+        return filter_db_data(*['all_values'] * 3, version)
+
+    # Preload and cache moving avg agg on unfiltered dataframe
+    @data.add_warmup
+    @cache.memoize(timeout=0)
+    def preload_unfiltered_ma(version):
+        return agg_ma_data(preload_unfiltered_data(version))
+
+    # League FG% per season by shot map cell and zone, built by data_processing/create_league_baselines.py.
+    # None for databases built before those tables existed, which only offer the plain FG% shot map
+    @data.add_warmup
+    @cache.memoize(timeout=0)
+    def league_baseline(version):
+        try:
+            return load_league_baseline(data.conn_for(version))
+        except pd.errors.DatabaseError as e:
+            print(f'No league baseline in data version {version}: {e}')
+            return None
+
+    def selection_data(player_name, team, year, version):
         if player_name == 'all_values' and team == 'all_values' and year == 'all_values':
-            dff = preload_unfiltered_data()
-        else:
-            dff = filter_db_data(player_name, team, year)
+            return preload_unfiltered_data(version)
+        return filter_db_data(player_name, team, year, version)
+
+    def moving_averages(player_name, team, year, version, dff=None):
+        if player_name == 'all_values' and team == 'all_values' and year == 'all_values':
+            return preload_unfiltered_ma(version)
+        if dff is None:
+            dff = selection_data(player_name, team, year, version)
+        return single_flight.do(('agg_ma_data', player_name, team, year, version), agg_ma_data, dff)
+
+    # Shots binned at every zoom level, for zoom_shot_map. The whole league's are binned by update_league_graphs'
+    # job, which forwards them to this process (see job_results.py) to be cached here
+    @single_flight.wrap
+    @cache.memoize()
+    def shot_bin_pyramid(player_name, team, year, version):
+        pyramid = job_results.claim(('shot_bin_pyramid', player_name, team, year, version))
+        if pyramid is not job_results.MISSING:
+            return pyramid
+        dff = selection_data(player_name, team, year, version)
+        if dff.empty:
+            return None
+        return bin_selection(dff, league_baseline(version))
+
+    def league_bins_ready(version):
+        """
+        returns whether the whole league's shot_bin_pyramid is cached, or waiting to be claimed
+        """
+        args = (*['all_values'] * 3, version)
+        return (cache.cache.has(shot_bin_pyramid.make_cache_key(shot_bin_pyramid.uncached, *args))
+                or job_results.pending(('shot_bin_pyramid', *args)))
+
+    # Per-zone totals from data_processing/create_zone_stats.py, a handful of rows for any filter.
+    # None for databases built before that table existed
+    @single_flight.wrap
+    @cache.memoize()
+    def zone_stats(player_name, team, year, version):
+        try:
+            return load_zone_stats(data.conn_for(version), player_name, team, year)
+        except pd.errors.DatabaseError as e:
+            print(f'No zone stats in data version {version}: {e}')
+            return None
+
+    @data.add_retire_hook
+    def evict_unfiltered_data(version):
+        cache.delete_memoized(preload_unfiltered_ma, version)
+        cache.delete_memoized(preload_unfiltered_data, version)
+        cache.delete_memoized(league_baseline, version)
+        # binned by a job whose result this process never needed
+        job_results.discard(('shot_bin_pyramid', *['all_values'] * 3, version))
+
+    def build_graphs(player_name, team, year, version, metric, set_progress=lambda step: None):
+        dff = selection_data(player_name, team, year, version)
+        set_progress(1)
 
-        # update_graphs
         start_time = time.time()
-        scatter_fig = update_scatter(dff)
+        scatter_fig = scatter_figure(dff)
         print(f'scatter loaded in {time.time() - start_time} sec')
+        set_progress(2)
         start_time = time.time()
-        shot_map_fig = update_shot_map(dff, metric)
+        pyramid = shot_bin_pyramid(player_name, team, year, version)
+        shot_map_fig = shot_map_figure(pyramid, metric, uirevision=f'{player_name}/{team}/{year}')
         print(f'shot map loaded in {time.time() - start_time} sec')
+        set_progress(3)
         start_time = time.time()
-        fig_moving_avg = update_trend_charts(dff)
+        moving_avg_df = moving_averages(player_name, team, year, version, dff)
+        fig_moving_avg = trend_figure(moving_avg_df)
         print(f'ma loaded in {time.time() - start_time} sec')
-        
+        set_progress(4)
+
+        if compact_figures:
+            start_time = time.time()
+            # rounded to what's displayed: percentages to 2 decimals, court positions (in tenths of a foot) to 1 decimal
+            scatter_fig = compact_figure(scatter_fig, decimals={'y': 4})
+            shot_map_fig = compact_figure(shot_map_fig, decimals={'x': 1, 'y': 1, 'z': 4})
+            fig_moving_avg = compact_figure(fig_moving_avg, decimals={'y': 4})
+            print(f'figures encoded in {time.time() - start_time} sec')
+
         return scatter_fig, shot_map_fig, fig_moving_avg
+
+    #create & update plots
+    # Runs in the request thread, where the shots and bins it loads stay cached for the other callbacks. The whole
+    # league's shot map takes long to bin, so until its bins are cached that selection is handed to
+    # update_league_graphs instead
+    @dash_app.callback(
+        Output('distance-scatter', 'figure'),
+        Output('shot-map', 'figure'),
+        Output('moving-average', 'figure'),
+        Output('league-graphs-request', 'data'),
+        Input('filter-state', 'data'),
+        # a new selection keeps the current metric, and switching metrics is left to zoom_shot_map
+        State('shotmap-metric', 'value')
+    )
+    @profiled
+    def update_graphs(state, metric):
+        if state is None:
+            return placeholder_figure(250), placeholder_figure(850), placeholder_figure(550), no_update
+
+        player_name, team, year = state['player'], state['team'], state['year']
+        version = data.version
+        if player_name == team == year == 'all_values' and not league_bins_ready(version):
+            # requested_at makes a repeated request a change, so it always starts a job
+            return no_update, no_update, no_update, {'version': version, 'metric': metric, 'requested_at': time.time()}
+        return (*build_graphs(player_name, team, year, version, metric), no_update)
+
+    # A background job (see the background callback manager in app.py), cancelled when the selection changes
+    # before it's done. The bins it computes are forwarded to the app's process, for zoom_shot_map and the
+    # next time the whole league is selected
+    @dash_app.callback(
+        Output('distance-scatter', 'figure', allow_duplicate=True),
+        Output('shot-map', 'figure', allow_duplicate=True),
+        Output('moving-average', 'figure', allow_duplicate=True),
+        Input('league-graphs-request', 'data'),
+        background=True,
+        interval=250,
+        progress=Output('graphs-progress', 'value'),
+        running=[(Output('graphs-progress', 'className'), '', 'd-none')],
+        cancel=[Input('filter-state', 'data')],
+        prevent_initial_call=True
+    )
+    @profiled
+    def update_league_graphs(set_progress, request):
+        if request is None:
+            return no_update, no_update, no_update
+        args = (*['all_values'] * 3, request['version'])
+        graphs = build_graphs(*args, request['metric'], set_progress)
+        # cached in this process by build_graphs
+        job_results.forward(('shot_bin_pyramid', *args), shot_bin_pyramid(*args))
+        return graphs
+
+    # Zooming the shot map swaps in the bins for the new zoom level, and switching its metric swaps in the
+    # values and colors for that metric, without rebuilding the figure
+    @dash_app.callback(
+        Output('shot-map', 'figure', allow_duplicate=True),
+        Output('shot-map-bins', 'data'),
+        Input('shot-map', 'relayoutData'),
+        Input('shotmap-metric', 'value'),
+        Input('filter-state', 'data'),
+        State('shot-map-bins', 'data'),
+        prevent_initial_call=True
+    )
+    def zoom_shot_map(relayout_data, metric, state, shown_size):
+        if state is None:
+            return no_update, no_update
+        if ctx.triggered_id == 'filter-state':
+            # update_graphs is drawing a new shot map at its own bin size
+            return no_update, None
+
+        pyramid = shot_bin_pyramid(state['player'], state['team'], state['year'], data.version)
+        if pyramid is None:
+            return no_update, no_update
+        shown_size = shown_size or shot_binning.pick_bin_size(pyramid)
+
+        patch = Patch()
+        if ctx.triggered_id == 'shotmap-metric':
+            bin_size = shown_size
+            if 'expected' not in pyramid[bin_size]:
+                return no_update, no_update
+            style, title = shot_map_style(metric)
+            for key, value in style.pop('colorbar').items():
+                patch['data'][0]['colorbar'][key] = value
+            for key, value in style.items():
+                patch['data'][0][key] = value
+            patch['layout']['title']['text'] = title
+        else:
+            ranges = visible_ranges(relayout_data)
+            if ranges is None:
+                return no_update, no_update
+            bin_size = shot_binning.pick_bin_size(pyramid, *ranges)
+            if bin_size == shown_size:
+                return no_update, no_update
+            print(f'shot map zoomed to {bin_size} unit bins')
+
+        if 'expected' not in pyramid[bin_size]:
+            metric = shot_binning.FG_PCT
+        values = shot_map_values(pyramid[bin_size], metric)
+        if compact_figures:
+            values = compact_trace(values, decimals={'x': 1, 'y': 1, 'z': 4})
+        for key, value in values.items():
+            patch['data'][0][key] = value
+        return patch, bin_size
+
+    # Points per attempt in each zone, next to the league's for the same season(s)
+    @dash_app.callback(
+        Output('zone-efficiency', 'figure'),
+        Input('filter-state', 'data')
+    )
+    def update_zone_efficiency(state):
+        if state is None:
+            return placeholder_figure(350)
+
+        start_time = time.time()
+        version = data.version
+        zones = zone_stats(state['player'], state['team'], state['year'], version)
+        if zones is None:
+            return placeholder_figure(350, 'Zone stats are not available for this data.')
+        if zones.empty:
+            return placeholder_figure(350, 'No data available for the selected filters.')
+        league = zone_stats('all_values', 'all_values', state['year'], version)
+        fig = zone_efficiency_figure(zones, league)
+        print(f'zone efficiency loaded in {time.time() - start_time} sec')
+        if compact_figures:
+            fig = compact_figure(fig, decimals={'x': 3})
+        return fig
+
+    # the data behind the charts, for the JSON API (see api.py)
+    return selection_data, moving_averages, shot_bin_pyramid, zone_stats
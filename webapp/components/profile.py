@@ -1,18 +1,21 @@
-from dash import html, dcc, Output, Input, ctx, State
-import plotly.express as px
-from plotly.figure_factory import create_dendrogram
+from dash import html, dcc, Output, Input, State, ClientsideFunction, no_update
 import dash_bootstrap_components as dbc
 import pandas as pd
 import urllib.parse
 import numpy as np
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics.pairwise import euclidean_distances
-import scipy.cluster.hierarchy as sch
+import queries
+import similarity_index
+from single_flight import single_flight
+from profiling import profiled
+
+# sklearn, scipy and plotly.figure_factory are imported inside the functions that use them
+# so they don't add to app startup time
 
 # Basic filters
 
-def player_selector(conn):
-    all_players = [{'label': player, 'value': player} for player in pd.read_sql('select distinct player from player_profiles', conn).player]
+# Options are filled in by the callbacks in create_filter_callbacks once the data is ready
+
+def player_selector():
     return dbc.Card(
         [
             dbc.CardBody(
@@ -28,7 +31,7 @@ def player_selector(conn):
                 [
                     dcc.Dropdown(
                         id='crossfilter-player',
-                        options=[{'label': 'All Players', 'value': 'all_values'}] + all_players,
+                        options=[{'label': 'All Players', 'value': 'all_values'}],
                         value='all_values'
                     ),  
                 ]
@@ -40,8 +43,7 @@ def player_selector(conn):
         }
     )
 
-def team_selector(conn):
-    all_teams = [{'label': team, 'value': team} for team in pd.read_sql('select distinct team from player_profiles_by_team order by team', conn).team]
+def team_selector():
     return dbc.Card(
         [
             dbc.CardBody(
@@ -56,7 +58,7 @@ def team_selector(conn):
                 [
                     dcc.Dropdown(
                         id='crossfilter-team',
-                        options=[{'label': 'All Teams', 'value': 'all_values'}] + all_teams,
+                        options=[{'label': 'All Teams', 'value': 'all_values'}],
                         value='all_values'
                     ), 
                 ]
@@ -69,14 +71,13 @@ def team_selector(conn):
         }
     )
 
-def year_selector(conn):
-    all_years = [{'label': year, 'value': year} for year in pd.read_sql('select distinct year from player_profiles_by_year order by year desc', conn).year]
+def year_selector():
     return dbc.Card(
         [
             dbc.CardBody(
                 dcc.Dropdown(
                     id='crossfilter-year',
-                    options=[{'label': 'All Years', 'value': 'all_values'}] + all_years,
+                    options=[{'label': 'All Years', 'value': 'all_values'}],
                     value='all_values'
                 ),
             )
@@ -88,108 +89,87 @@ def year_selector(conn):
         }
     )
 
-def create_filter_callbacks(dash_app, player_images, team_images, conn):
+def create_filter_callbacks(dash_app, data, get_selection):
+    # The image map is sent once per data version; swapping the player/team image is done in the browser
+    # (assets/callbacks.js). After a data swap, it's sent again on the page's next interaction
     @dash_app.callback(
+        Output('image-map', 'data'),
+        Input('data-ready', 'data'),
+        Input('filter-state', 'data'),
+        State('image-map', 'data')
+    )
+    def load_image_map(data_ready, state, image_map):
+        if not data_ready:
+            return None
+        version = data.version
+        if image_map is not None and image_map.get('version') == version:
+            return no_update
+        conn = data.conn_for(version)
+
+        def image_src(link, etag):
+            # mirrored thumbnails are served by the app itself (see /images in app.py), others are hot-linked
+            return dash_app.get_relative_path(f'/images/{etag}') if etag else link
+
+        return {
+            'version': version,
+            'players': {player: image_src(link, etag) for player, link, etag in conn.execute(*queries.player_images_query())},
+            'teams': {team: image_src(link, etag) for team, link, etag in conn.execute(*queries.team_logos_query())}
+        }
+
+    dash_app.clientside_callback(
+        ClientsideFunction(namespace='basketradar', function_name='playerImage'),
         Output('player-img-container', 'children'),
-        Input('crossfilter-player', 'value')
+        Input('crossfilter-player', 'value'),
+        Input('image-map', 'data')
     )
-    def update_player_image(selected_player):
-        if selected_player == 'all_values':
-            return  html.H3("All Players", id="player-card-default-text")
 
-        img_loc = player_images.loc[player_images.player == selected_player, :].player_image_link.values[0]
-        return html.Img(src=img_loc, alt=selected_player, height="220")
-    
-    @dash_app.callback(
+    dash_app.clientside_callback(
+        ClientsideFunction(namespace='basketradar', function_name='teamImage'),
         Output('team-img-container', 'children'),
-        Input('crossfilter-team', 'value')
+        Input('crossfilter-team', 'value'),
+        Input('image-map', 'data')
     )
-    def update_team_image(selected_team):
-        if selected_team == 'all_values':
-            return  html.H3("All Teams", id="player-card-default-text")
-
-        img_loc = team_images.loc[team_images.team == selected_team, :].logo_link.values[0]
-        return html.Img(src=img_loc, alt=selected_team, style={'max-height': '80px'})
     
     # update dropdown options based on the other dropdowns
     @dash_app.callback(
         Output('crossfilter-player', 'options'),
-        Input('crossfilter-team', 'value'),
-        Input('crossfilter-year', 'value')
+        Input('filter-state', 'data')
     )
-    def update_player_options(selected_team, selected_year):
-        sql_query = f"""
-            select distinct player
-            from player_profiles_by_team_and_year
-            where
-                1 = 1
-                {'and team = (?)' if selected_team != 'all_values' else ''}
-                {'and year = (?)' if selected_year != 'all_values' else ''}
-            order by player
-        """
-        params = []
-        if selected_team != 'all_values':
-            params = params + [selected_team]
-        if selected_year != 'all_values':
-            params = params + [selected_year]
+    def update_player_options(state):
+        if state is None:
+            return [{'label': 'All Players', 'value': 'all_values'}]
 
-        all_players = [{'label': player, 'value': player} for player in pd.read_sql(sql_query, conn, params=params).player]
+        all_players = [{'label': player, 'value': player} for player in get_selection(state)['player_options']]
         players = [{'label': 'All Players', 'value': 'all_values'}] + all_players
         return players
 
     @dash_app.callback(
         Output('crossfilter-team', 'options'),
-        Input('crossfilter-player', 'value'),
-        Input('crossfilter-year', 'value')
+        Input('filter-state', 'data')
     )
-    def update_team_options(selected_player, selected_year):
-        sql_query = f"""
-            select distinct team
-            from player_profiles_by_team_and_year
-            where
-                1 = 1
-                {'and player = (?)' if selected_player != 'all_values' else ''}
-                {'and year = (?)' if selected_year != 'all_values' else ''}
-            order by team
-        """
-        params = []
+    def update_team_options(state):
+        if state is None:
+            return [{'label': 'All Teams', 'value': 'all_values'}]
 
-        if selected_player != 'all_values':
-            params = params + [selected_player]
-        if selected_year != 'all_values':
-            params = params + [selected_year]
-        
-        all_teams = [{'label': team, 'value': team} for team in pd.read_sql(sql_query, conn, params=params).team]
+        all_teams = [{'label': team, 'value': team} for team in get_selection(state)['team_options']]
         teams = [{'label': 'All Teams', 'value': 'all_values'}] + all_teams
         return teams
 
     @dash_app.callback(
         Output('crossfilter-year', 'options'),
-        Input('crossfilter-player', 'value'),
-        Input('crossfilter-team', 'value')
+        Input('filter-state', 'data')
     )
-    def update_year_options(selected_player, selected_team):
-        sql_query = f"""
-            select distinct year
-            from player_profiles_by_team_and_year
-            where
-                1 = 1
-                {'and player = (?)' if selected_player != 'all_values' else ''}
-                {'and team = (?)' if selected_team != 'all_values' else ''}
-            order by year desc
-        """
-        params = []
+    def update_year_options(state):
+        if state is None:
+            return [{'label': 'All Years', 'value': 'all_values'}]
 
-        if selected_player != 'all_values':
-            params = params + [selected_player]
-        if selected_team != 'all_values':
-            params = params + [selected_team]
-
-        all_years = [{'label': year, 'value': year} for year in pd.read_sql(sql_query, conn, params=params).year]
+        all_years = [{'label': year, 'value': year} for year in get_selection(state)['year_options']]
         years = [{'label': 'All Years', 'value': 'all_values'}] + all_years
         return years
 
-    @dash_app.callback(
+    # Querystring sync runs in the browser (assets/callbacks.js); it only writes the dropdowns when the URL changes
+    dash_app.clientside_callback(
+        ClientsideFunction(namespace='basketradar', function_name='syncUrl'),
         [
             Output('crossfilter-player', 'value'),
             Output('crossfilter-team', 'value'),
@@ -200,28 +180,11 @@ def create_filter_callbacks(dash_app, player_images, team_images, conn):
             Input('crossfilter-player', 'value'),
             Input('crossfilter-team', 'value'),
             Input('crossfilter-year', 'value'),
-            Input('url', 'search')
+            Input('url', 'search'),
+            Input('data-ready', 'data')
         ],
         prevent_initial_call=True
     )
-    def update_selections_from_url(selected_player, selected_team, selected_year, query_str):
-        trigger_id = ctx.triggered[0]['prop_id'].split('.')[0]
-        if trigger_id == 'url':
-            args = urllib.parse.parse_qs(query_str[1:])
-            return (
-                args.get('player', ['all_values'])[0],
-                args.get('team', ['all_values'])[0],
-                args.get('year', ['all_values'])[0],
-                f'/{query_str}'
-            )
-        
-        new_args = {}
-        if selected_player != 'all_values': new_args['player'] = selected_player
-        if selected_team != 'all_values': new_args['team'] = selected_team
-        if selected_year != 'all_values': new_args['year'] = selected_year
-        new_query_str = f'/?{urllib.parse.urlencode(new_args)}'
-
-        return selected_player, selected_team, selected_year, new_query_str
 
 # Profile sliders
  
@@ -233,8 +196,9 @@ def stat_slider(val, min, max, marks, label, id):
         ],
     )
 
-def create_slider_callbacks(dash_app, conn):
-    @dash_app.callback(
+def create_slider_callbacks(dash_app, data, get_selection):
+    dash_app.clientside_callback(
+        ClientsideFunction(namespace='basketradar', function_name='profileColVisibility'),
         [
             Output('profile-slider-placeholder-col', 'className'),
             Output('profile-slider-col', 'className'),
@@ -242,11 +206,6 @@ def create_slider_callbacks(dash_app, conn):
         ],
         [Input('crossfilter-player', 'value')]
     )
-    def update_profile_col_visibility(selected_player):
-        if selected_player == 'all_values':
-            return 'text-muted', 'd-none', 'd-none'
-        return 'd-none', '', ''
-
 
     @dash_app.callback(
         [
@@ -255,34 +214,28 @@ def create_slider_callbacks(dash_app, conn):
             Output('acc-slider', 'value'), 
             Output('quarter-slider', 'value')
         ],
-        [Input('crossfilter-year', 'value'), Input('crossfilter-player', 'value'), Input('crossfilter-team', 'value')]
+        [Input('filter-state', 'data')]
     )
-    def update_profile_sliders(selected_year, selected_player, selected_team):
-        if selected_player == 'all_values':
+    def update_profile_sliders(state):
+        if state is None or state['player'] == 'all_values':
             return None, None, None, None
         
-        if selected_team == 'all_values' and selected_year == 'all_values':
-            player_profile = pd.read_sql('select * from player_profiles where player = (?)', 
-                                         conn, params=(selected_player,))
-        elif selected_year == 'all_values':
-            player_profile = pd.read_sql('select * from player_profiles_by_team where player = (?) and team = (?)', 
-                                         conn, params=(selected_player, selected_team,))
-        elif selected_team == 'all_values':
-            player_profile = pd.read_sql('select * from player_profiles_by_year where player = (?) and year = (?)', 
-                                         conn, params=(selected_player, selected_year,))
-        else:
-            player_profile = pd.read_sql('select * from player_profiles_by_team_and_year where player = (?) and team = (?) and year = (?)', 
-                                         conn, params=(selected_player, selected_team, selected_year,))
+        player_profile = get_selection(state)['profile']
+        if player_profile is None:
+            return None, None, None, None
             
-        avg_dist = min(player_profile.avg_distance.item(), 21)
-        avg_side = max(min((50 - player_profile.avg_shotX.item()), 35), 15)
-        acc = player_profile.accuracy.item()
-        top_qtr = player_profile.top_quarter.item()
+        avg_dist = min(player_profile['avg_distance'], 21)
+        avg_side = max(min((50 - player_profile['avg_shotX']), 35), 15)
+        acc = player_profile['accuracy']
+        top_qtr = player_profile['top_quarter']
 
         return avg_dist, avg_side, acc, top_qtr
     
 # Similarity search
 
+# similarity-mode value comparing shot diets (see similarity_index.py) instead of the profile attributes
+SHOT_DIET = 'shot_diet'
+
 def similarity_filters():
     return html.Div(
         [
@@ -292,6 +245,17 @@ def similarity_filters():
                 id='similarity-filters',
                 className='d-none'
             ),
+            dbc.Label('Compare By:', html_for='similarity-mode'),
+            dbc.RadioItems(
+                options=[
+                    {'label': 'Attributes', 'value': 'attributes'},
+                    {'label': 'Shot Diet', 'value': SHOT_DIET},
+                ],
+                value='attributes',
+                id='similarity-mode',
+                inline=True,
+                className='mb-2'
+            ),
             dbc.Label('Compare Attributes:', html_for='similarity-attributes',),
             dbc.Checklist(
                 options=[
@@ -354,7 +318,9 @@ def similarity_modal():
                         ],
                         style={'display': 'flex', 'justify-content': 'space-around'}
                     ),
-                    html.Div(id='similarity-modal-body'),
+                    # filled in by update_similarity_modal when the modal opens
+                    dbc.Progress(id='similarity-modal-progress', value=0, max=2, className='d-none', style={'height': '4px'}),
+                    dcc.Loading(html.Div(id='similarity-modal-body')),
                 ]
             ),
             dbc.ModalFooter(
@@ -369,12 +335,16 @@ def similarity_modal():
     )
     return modal
 
-def create_similarity_dendrogram(df, similarity_attributes, selected_player, similar_players):
+def create_similarity_dendrogram(df, similarity_attributes, selected_player, similar_player_names, scale=True):
+    from sklearn.preprocessing import StandardScaler
+    from plotly.figure_factory import create_dendrogram
+    import scipy.cluster.hierarchy as sch
+
     X = df[similarity_attributes].values
     y = df.player.values
-    similar_player_names = similar_players.index
 
-    X_scaled = StandardScaler().fit_transform(X)
+    # shot diets are already shares of the same attempts, and are compared unscaled
+    X_scaled = StandardScaler().fit_transform(X) if scale else X
 
     # Compute threshold of furthest "similar player"
     # furthest_similar = similar_players.index[similar_players.argmax()]
@@ -424,9 +394,13 @@ def create_similarity_dendrogram(df, similarity_attributes, selected_player, sim
     fig.layout.yaxis.ticktext = [tick_text(t) for t in fig.layout.yaxis.ticktext]
     fig.update_layout(autosize=True, margin=dict(t=50, b=50))
 
-    return dcc.Graph(figure=fig, id='dendrogram', style={'width': '100%'})
+    # a plain dict, so cached copies don't have to be re-validated by plotly when they're unpickled
+    return dcc.Graph(figure=fig.to_dict(), id='dendrogram', style={'width': '100%'})
 
 def create_similarity_scatter(df, selected_player, similar_players):    
+    import plotly.express as px
+    from sklearn.preprocessing import StandardScaler
+
     target = df.player.apply(lambda x: f'{selected_player} and most similar' if x in [selected_player, *similar_players] else 'Others') 
     size = df.player.apply(lambda x: 3 if x == selected_player else 1)
 
@@ -459,11 +433,13 @@ def create_similarity_scatter(df, selected_player, similar_players):
 
     return dcc.Graph(figure=fig_scatter2)
 
-def create_similarity_list_callbacks(dash_app, similarity_calculators, conn):
+def create_similarity_list_callbacks(dash_app, similarity_calculators, data):
     get_player_similarities = similarity_calculators[0]
     get_player_similarities_by_team = similarity_calculators[1]
     get_player_similarities_by_year = similarity_calculators[2]
     get_player_similarities_by_team_year = similarity_calculators[3]
+    get_similarity_dendrogram = similarity_calculators[4]
+    get_shot_diet_neighbors = similarity_calculators[5]
 
     @dash_app.callback(
         [
@@ -473,18 +449,15 @@ def create_similarity_list_callbacks(dash_app, similarity_calculators, conn):
             Output('similarity-filter-lbl', 'className')
         ],
         [
-            Input('crossfilter-year', 'value'),
-            Input('crossfilter-player', 'value'),
-            Input('crossfilter-team', 'value'),
+            Input('filter-state', 'data'),
             Input('similarity-filters', 'value'),
         ]
     )
-    def update_similarity_filters(selected_year, selected_player, selected_team, cur_filter_vals):
-        trigger_id = ctx.triggered[0]['prop_id'].split('.')[0]
-        
+    def update_similarity_filters(state, cur_filter_vals):
         options = []
-        if selected_player == 'all_values': 
+        if state is None or state['player'] == 'all_values': 
             return [], [], 'd-none', 'd-none'
+        selected_team, selected_year = state['team'], state['year']
         
         if selected_team != 'all_values':
             options += [{'label': 'Same Team', 'value': 'same-team'}]
@@ -495,171 +468,282 @@ def create_similarity_list_callbacks(dash_app, similarity_calculators, conn):
 
         return options, [v for v in filter_vals if v in [d['value'] for d in options]], '', 'd-none' if len(options) == 0 else ''
 
-    @dash_app.callback(
+    dash_app.clientside_callback(
+        ClientsideFunction(namespace='basketradar', function_name='modalPills'),
         Output('modal-attributes-container', 'children'),
         Output('modal-filters-container', 'children'),
         Output('modal-filters-container-parent', 'className'),
         Input('similarity-attributes', 'value'),
         Input('similarity-filters', 'value'),
-        Input('similarity-filters', 'className')
+        Input('similarity-filters', 'className'),
+        Input('similarity-mode', 'value')
     )
-    def update_modal_pills(selected_attrs, selected_filters, filter_className):
-        attr_map = {
-            'avg_distance': 'Average Distance', 
-            'avg_shotX': 'Side Preference', 
-            'accuracy': 'Accuracy',
-            'top_quarter': 'Top Quarter'
-        }
 
-        filter_map = {
-            'same-team': 'Same Team', 
-            'same-year': 'Same Year', 
-        }
+    def find_similar(selected_year, selected_player, selected_team, similarity_attributes, filters, version, mode=None):
+        """
+        returns the 3 most similar and 3 least similar rows to the selection, at the selection's level of aggregation
+        """
+        if mode == SHOT_DIET:
+            return get_shot_diet_neighbors(selected_player, selected_team, selected_year, filters, version)
 
-        if 'd-none' in filter_className:
-            filter_pills = []
-            filter_className = 'd-none'
+        # Grouped by player
+        if selected_team == 'all_values' and selected_year and selected_year == 'all_values':
+            player_similarities = get_player_similarities(similarity_attributes, version)
+            sorted_sims = player_similarities[selected_player].sort_values(ascending=True)
+            return sorted_sims[1:4], sorted_sims[-3:]
+        
+        # Grouped by player and team
+        elif selected_team != 'all_values' and selected_year == 'all_values':
+            player_similarities_team = get_player_similarities_by_team(similarity_attributes, version)
+            similar = player_similarities_team[(selected_player, selected_team)]
+            
+            # Optional filter
+            if 'same-team' in filters:
+                similar = similar[similar.index.get_level_values('team') == selected_team]
+        
+        # Grouped by player and year
+        elif selected_team == 'all_values' and selected_year != 'all_values':
+            player_similarities_year = get_player_similarities_by_year(similarity_attributes, version)
+            similar = player_similarities_year[(selected_player, selected_year)]
+            
+            # Optional filter
+            if 'same-year' in filters:
+                similar = similar[similar.index.get_level_values('year') == selected_year]
+        
+        # Grouped by player, team, and year
         else:
-            filter_pills = [dbc.Badge(filter_map[f], pill=True, color="primary", className="me-1") for f in selected_filters]
-            filter_className = '' if len(filter_pills) > 0 else 'd-none'
-
-        attr_pills = [dbc.Badge(attr_map[a], pill=True, color="primary", className="me-1") for a in selected_attrs]
+            player_similarities_team_year = get_player_similarities_by_team_year(similarity_attributes, version)
+            similar = player_similarities_team_year[(selected_player, selected_team, selected_year)]
+            
+            # Optional filters
+            if 'same-team' in filters and 'same-year' in filters:
+                similar = similar[(similar.index.get_level_values('team') == selected_team) & (similar.index.get_level_values('year') == selected_year)]
+            elif 'same-team' in filters:
+                similar = similar[similar.index.get_level_values('team') == selected_team]
+            elif 'same-year' in filters:
+                similar = similar[similar.index.get_level_values('year') == selected_year]
 
-        return attr_pills, filter_pills, filter_className
+        sorted_sims = similar.sort_values(ascending=True)
+        return sorted_sims[1:4], sorted_sims[-3:]
 
     @dash_app.callback(
         Output('similarity-list-results', 'children'),
         Output('dissimilarity-list-results', 'children'),
-        Output('similarity-modal-body', 'children'),
-        Input('crossfilter-year', 'value'),
-        Input('crossfilter-player', 'value'),
-        Input('crossfilter-team', 'value'),
+        Input('filter-state', 'data'),
         Input('similarity-attributes', 'value'),
-        Input('similarity-filters', 'value')
+        Input('similarity-filters', 'value'),
+        Input('similarity-mode', 'value')
     )
-    def update_similarity_list(selected_year, selected_player, selected_team, similarity_attributes, filters):
-        if selected_player == 'all_values': 
-            return [], [], None
+    @profiled
+    def update_similarity_list(state, similarity_attributes, filters, mode):
+        if state is None or state['player'] == 'all_values': 
+            return [], []
+        selected_player, selected_team, selected_year = state['player'], state['team'], state['year']
         
-        if len(similarity_attributes) == 0:
+        if mode != SHOT_DIET and len(similarity_attributes) == 0:
             return (
                 [html.Li('No Filters Selected!', style={'list-style-type': 'none'})], 
-                [html.Li('No Filters Selected!', style={'list-style-type': 'none'})],
-                None
+                [html.Li('No Filters Selected!', style={'list-style-type': 'none'})]
             )
 
-        df = pd.read_sql('select player, avg_distance, avg_shotX, accuracy, top_quarter from player_profiles', conn)
+        top, bottom = find_similar(selected_year, selected_player, selected_team, similarity_attributes, filters, data.version, mode)
+        if top is None:
+            return (
+                [html.Li('Shot diets are not available for this data.', style={'list-style-type': 'none'})],
+                []
+            )
 
         # Grouped by player
         if selected_team == 'all_values' and selected_year and selected_year == 'all_values':
-            player_similarities = get_player_similarities(similarity_attributes)
-            sorted_sims = player_similarities[selected_player].sort_values(ascending=True)
-            top = sorted_sims[1:4]
-            bottom = player_similarities[-3:]
             return (
                 [player_list_btn(i, result, {"player": result}) for i, result in enumerate(top.index)], 
-                [player_list_btn(i, result, {"player": result}, dissimilar=True) for i, result in enumerate(bottom.index)],
-                create_similarity_dendrogram(df, similarity_attributes, selected_player, top)
+                [player_list_btn(i, result, {"player": result}, dissimilar=True) for i, result in enumerate(bottom.index)]
             )
         
         # Grouped by player and team
         elif selected_team != 'all_values' and selected_year == 'all_values':
-            player_similarities_team = get_player_similarities_by_team(similarity_attributes)
-            similar = player_similarities_team[(selected_player, selected_team)]
-            
-            # Optional filter
-            if 'same-team' in filters:
-                similar = similar[similar.index.get_level_values('team') == selected_team]
-            sorted_sims = similar.sort_values(ascending=True)
-            top = sorted_sims[1:4]
-            bottom = sorted_sims[-3:]
             return (
                 [player_list_btn(i, f'{player} ({team})',{"player": player, "team": team}) for i, (player, team) in enumerate(top.index)], 
-                [player_list_btn(i, f'{player} ({team})',{"player": player, "team": team}, dissimilar=True) for i, (player, team) in enumerate(bottom.index)], 
-                create_similarity_dendrogram(df, similarity_attributes, selected_player, top)
+                [player_list_btn(i, f'{player} ({team})',{"player": player, "team": team}, dissimilar=True) for i, (player, team) in enumerate(bottom.index)]
             )
         
         # Grouped by player and year
         elif selected_team == 'all_values' and selected_year != 'all_values':
-            player_similarities_year = get_player_similarities_by_year(similarity_attributes)
-            similar = player_similarities_year[(selected_player, selected_year)]
-            
-            # Optional filter
-            if 'same-year' in filters:
-                similar = similar[similar.index.get_level_values('year') == selected_year]
-            
-            sorted_sims = similar.sort_values(ascending=True)
-            top = sorted_sims[1:4]
-            bottom = sorted_sims[-3:]
             return (
                 [player_list_btn(i, f'{player} ({year})',{"player": player, "year": year}) for i, (player, year) in enumerate(top.index)], 
-                [player_list_btn(i, f'{player} ({year})',{"player": player, "year": year}, dissimilar=False) for i, (player, year) in enumerate(bottom.index)], 
-                create_similarity_dendrogram(df, similarity_attributes, selected_player, top)
+                [player_list_btn(i, f'{player} ({year})',{"player": player, "year": year}, dissimilar=False) for i, (player, year) in enumerate(bottom.index)]
             )
         
         # Grouped by player, team, and year
         else:
-            player_similarities_team_year = get_player_similarities_by_team_year(similarity_attributes)
-            similar = player_similarities_team_year[(selected_player, selected_team, selected_year)]
-            
-            # Optional filters
-            if 'same-team' in filters and 'same-year' in filters:
-                similar = similar[(similar.index.get_level_values('team') == selected_team) & (similar.index.get_level_values('year') == selected_year)]
-            elif 'same-team' in filters:
-                similar = similar[similar.index.get_level_values('team') == selected_team]
-            elif 'same-year' in filters:
-                similar = similar[similar.index.get_level_values('year') == selected_year]
-
-            sorted_sims = similar.sort_values(ascending=True)
-            top = sorted_sims[1:4]
-            bottom = sorted_sims[-3:]
             return (
                 [player_list_btn(i, f'{player} ({team} {year})', {"player": player, "team": team, "year": year}) for i, (player, team, year) in enumerate(top.index)], 
-                [player_list_btn(i, f'{player} ({team} {year})', {"player": player, "team": team, "year": year}, dissimilar=False) for i, (player, team, year) in enumerate(bottom.index)], 
-                create_similarity_dendrogram(df, similarity_attributes, selected_player, top)
+                [player_list_btn(i, f'{player} ({team} {year})', {"player": player, "team": team, "year": year}, dissimilar=False) for i, (player, team, year) in enumerate(bottom.index)]
             )
-                
+
+    # The dendrogram is only built while the modal is open, instead of on every selection change.
+    # It runs as a background job, which closing the modal cancels.
     @dash_app.callback(
+        Output('similarity-modal-body', 'children'),
+        Input('similarity-modal', 'is_open'),
+        State('filter-state', 'data'),
+        State('similarity-attributes', 'value'),
+        State('similarity-filters', 'value'),
+        State('similarity-mode', 'value'),
+        background=True,
+        interval=250,
+        progress=Output('similarity-modal-progress', 'value'),
+        running=[(Output('similarity-modal-progress', 'className'), '', 'd-none')],
+        prevent_initial_call=True
+    )
+    @profiled
+    def update_similarity_modal(set_progress, is_open, state, similarity_attributes, filters, mode):
+        if not is_open or state is None or state['player'] == 'all_values':
+            return None
+        if mode != SHOT_DIET and len(similarity_attributes) == 0:
+            return None
+        selected_player, selected_team, selected_year = state['player'], state['team'], state['year']
+
+        version = data.version
+        top, _ = find_similar(selected_year, selected_player, selected_team, similarity_attributes, filters, version, mode)
+        if top is None:
+            return None
+        set_progress(1)
+        features = SHOT_DIET if mode == SHOT_DIET else similarity_attributes
+        # the dendrogram's leaves are players, while top's rows can be (player, team, year) keys
+        similar_player_names = top.index.get_level_values('player').unique().tolist()
+        return get_similarity_dendrogram(features, selected_player, similar_player_names, version)
+                
+    dash_app.clientside_callback(
+        ClientsideFunction(namespace='basketradar', function_name='toggleModal'),
         Output("similarity-modal", "is_open"),
         [Input("open-similarity-modal", "n_clicks"), Input("close", "n_clicks")],
         [State("similarity-modal", "is_open")],
     )
-    def toggle_modal(n1, n2, is_open):
-        if n1 or n2:
-            return not is_open
-        return is_open
 
-def create_similarity_calc_funcs(cache, conn):
+    return find_similar
+
+def create_similarity_calc_funcs(cache, data):
+    # Each takes the data version so cached matrices from a replaced version are never served.
+    # single_flight lets concurrent misses for the same matrix wait on one build instead of each building it.
+    @single_flight.wrap
     @cache.memoize()
-    def similarities_by_player(features):
-        player_profiles = pd.read_sql('select * from player_profiles', conn)
+    def similarities_by_player(features, version):
+        from sklearn.preprocessing import StandardScaler
+        from sklearn.metrics.pairwise import euclidean_distances
+        player_profiles = pd.read_sql('select * from player_profiles', data.conn_for(version))
         X_player_scaled = StandardScaler().fit_transform(player_profiles[features])
         similarities_player = pd.DataFrame(euclidean_distances(X_player_scaled), columns=player_profiles.player, index=player_profiles.player)
         return similarities_player
     
+    @single_flight.wrap
     @cache.memoize()
-    def similarities_by_player_team(features):
-        player_profiles_by_team = pd.read_sql('select * from player_profiles_by_team', conn)
+    def similarities_by_player_team(features, version):
+        from sklearn.preprocessing import StandardScaler
+        from sklearn.metrics.pairwise import euclidean_distances
+        player_profiles_by_team = pd.read_sql('select * from player_profiles_by_team', data.conn_for(version))
         X_player_team_scaled = StandardScaler().fit_transform(player_profiles_by_team[features])
         idx = pd.MultiIndex.from_frame(player_profiles_by_team[['player', 'team']])
         similarities_player_team = pd.DataFrame(euclidean_distances(X_player_team_scaled), columns=idx, index=idx)
         return similarities_player_team
     
+    @single_flight.wrap
     @cache.memoize()
-    def similarities_by_player_year(features):
-        player_profiles_by_year = pd.read_sql('select * from player_profiles_by_year', conn)
+    def similarities_by_player_year(features, version):
+        from sklearn.preprocessing import StandardScaler
+        from sklearn.metrics.pairwise import euclidean_distances
+        player_profiles_by_year = pd.read_sql('select * from player_profiles_by_year', data.conn_for(version))
         X_player_year_scaled = StandardScaler().fit_transform(player_profiles_by_year[features])
         idx = pd.MultiIndex.from_frame(player_profiles_by_year[['player', 'year']])
         similarities_player_year = pd.DataFrame(euclidean_distances(X_player_year_scaled), columns=idx, index=idx)
         return similarities_player_year
     
+    @single_flight.wrap
     @cache.memoize()
-    def similarities_by_player_team_year(features):
-        player_profiles_by_team_year = pd.read_sql('select * from player_profiles_by_team_and_year', conn)
+    def similarities_by_player_team_year(features, version):
+        from sklearn.preprocessing import StandardScaler
+        from sklearn.metrics.pairwise import euclidean_distances
+        player_profiles_by_team_year = pd.read_sql('select * from player_profiles_by_team_and_year', data.conn_for(version))
         X_player_team_year_scaled = StandardScaler().fit_transform(player_profiles_by_team_year[features])
         idx = pd.MultiIndex.from_frame(player_profiles_by_team_year[['player', 'team', 'year']])
         similarities_player_team_year = pd.DataFrame(euclidean_distances(X_player_team_year_scaled), columns=idx, index=idx)
         return similarities_player_team_year
 
-    return similarities_by_player, similarities_by_player_team, similarities_by_player_year, similarities_by_player_team_year 
-
+    # Shot diet indexes built by data_processing/create_similarity_index.py, loaded before a version goes live.
+    # None for databases built before the indexes existed
+    @cache.memoize(timeout=0)
+    def shot_diet_index(level, version):
+        sql_query, params = queries.similarity_index_query(level)
+        try:
+            rows = pd.read_sql(sql_query, data.conn_for(version), params=params)
+        except pd.errors.DatabaseError as e:
+            print(f'No shot diet index in data version {version}: {e}')
+            return None
+        return similarity_index.from_bytes(rows['data'].iloc[0]) if len(rows) else None
+
+    def shot_diet_neighbors(selected_player, selected_team, selected_year, filters, version):
+        """
+        returns the distances to the 3 nearest and 3 farthest shot diets, indexed like the similarity matrices,
+        or (None, None) without an index
+        """
+        key = {'player': selected_player}
+        if selected_team != 'all_values':
+            key['team'] = selected_team
+        if selected_year != 'all_values':
+            key['year'] = int(selected_year)
+        level = '_'.join(key)
+        index = shot_diet_index(level, version)
+        if index is None:
+            return None, None
+
+        row = similarity_index.find_row(index, **key)
+        if row is None:
+            return pd.Series(dtype=float), pd.Series(dtype=float)
+        # the optional filters leave few enough rows to compare with every one of them
+        candidates = None
+        for column, name in [('team', 'same-team'), ('year', 'same-year')]:
+            if name in filters and column in key:
+                matches = index[f'key_{column}'] == key[column]
+                candidates = matches if candidates is None else candidates & matches
+
+        def as_series(rows, distances):
+            if len(key) == 1:
+                idx = pd.Index(index['key_player'][rows], name='player')
+            else:
+                idx = pd.MultiIndex.from_arrays([index[f'key_{column}'][rows] for column in key], names=list(key))
+            return pd.Series(distances, index=idx)
+
+        return (
+            as_series(*similarity_index.search(index, row, 3, candidates=candidates)),
+            as_series(*similarity_index.search(index, row, 3, farthest=True, candidates=candidates)),
+        )
+
+    @single_flight.wrap
+    @cache.memoize()
+    def similarity_dendrogram(features, selected_player, similar_player_names, version):
+        if features == SHOT_DIET:
+            index = shot_diet_index('player', version)
+            dimensions = [f'dim_{i}' for i in range(index['vectors'].shape[1])]
+            player_profiles = pd.DataFrame(index['vectors'], columns=dimensions).assign(player=index['key_player'])
+            return create_similarity_dendrogram(player_profiles, dimensions, selected_player, similar_player_names, scale=False)
+        player_profiles = pd.read_sql('select player, avg_distance, avg_shotX, accuracy, top_quarter from player_profiles', data.conn_for(version))
+        return create_similarity_dendrogram(player_profiles, features, selected_player, similar_player_names)
+
+    @data.add_warmup
+    def prewarm_default_similarities(version):
+        similarities_by_player(['avg_distance', 'avg_shotX', 'accuracy', 'top_quarter'], version)
+
+    @data.add_warmup
+    def load_shot_diet_indexes(version):
+        for level in similarity_index.LEVELS:
+            shot_diet_index(level, version)
+
+    @data.add_retire_hook
+    def evict_shot_diet_indexes(version):
+        for level in similarity_index.LEVELS:
+            cache.delete_memoized(shot_diet_index, level, version)
+
+    return (
+        similarities_by_player, similarities_by_player_team, similarities_by_player_year, similarities_by_player_team_year,
+        similarity_dendrogram, shot_diet_neighbors
+    ) 
@@ -0,0 +1,375 @@
+import contextlib
+import glob
+import json
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+import requests
+import snapshot
+from query_stats import connection_factory, running
+
+STORAGE_URL = 'https://basketradarstorage.blob.core.windows.net/cleandata'
+
+# Version used for a database that wasn't installed from a published snapshot
+LOCAL_VERSION = 'local'
+
+# How long a replaced version stays open for requests that started before the swap
+RETIRE_GRACE_SECONDS = 60
+
+# Next to the database, names the file a refresh installed, so a restart loads it instead of the database
+LIVE_POINTER_SUFFIX = '.live.json'
+
+# The app's processes (e.g. gunicorn workers) share the data folder. One that downloads a database holds
+# <path>.lock, and one that has a version open keeps a <path>.<pid>.ref file, so that others don't remove it
+LOCK_SUFFIX = '.lock'
+REF_SUFFIX = '.ref'
+
+DataVersion = namedtuple('DataVersion', ['version', 'path', 'conn'])
+
+
+class DataSource:
+    """
+    Holds the SQLite connection used by the callbacks.
+
+    Everything is loaded by `load()`, which can run on a background thread so the
+    app can start serving (with placeholders) before the data is downloaded.
+    Callbacks should check `is_ready()` before touching `conn`.
+
+    The data can be replaced while serving with `swap_to()`. Cached functions should take the
+    data version as an argument and read through `conn_for(version)`, so their cache entries
+    are keyed on the version they were computed from.
+    """
+
+    def __init__(self, sqlite_file_path='./data/nba_shots.db', storage_url=STORAGE_URL):
+        self.sqlite_file_path = sqlite_file_path
+        self.storage_url = storage_url
+        self.current = None
+        self.error = None
+        self._staged = None
+        self._retiring = {}
+        self._warmups = []
+        self._retire_hooks = []
+        self._swap_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+        self._watcher = None
+        self._pid = os.getpid()
+        self._child_conns = {}
+
+    @property
+    def version(self):
+        return self.current.version if self.current else None
+
+    @property
+    def conn(self):
+        return self.conn_for(self.current.version) if self.current else None
+
+    def conn_for(self, version):
+        """
+        Returns the connection for a version that is live, being prewarmed, or still within its grace period.
+        """
+        for data_version in [self.current, self._staged, *self._retiring.values()]:
+            if data_version is not None and data_version.version == version:
+                return self._process_conn(data_version)
+        raise KeyError(f'Data version {version} is not loaded')
+
+    def loaded_versions(self):
+        """
+        Returns the versions conn_for can open, the live one first.
+        """
+        return [data_version.version for data_version in [self.current, self._staged, *list(self._retiring.values())]
+                if data_version is not None]
+
+    def open_reader(self, version):
+        """
+        Opens a separate read-only connection to a loaded version, for long reads like streamed exports
+        that shouldn't tie up the shared connection. It keeps working after the version is retired.
+        """
+        for data_version in [self.current, self._staged, *self._retiring.values()]:
+            if data_version is not None and data_version.version == version:
+                return sqlite3.connect(f'{pathlib.Path(data_version.path).resolve().as_uri()}?mode=ro', uri=True,
+                                       factory=connection_factory())
+        raise KeyError(f'Data version {version} is not loaded')
+
+    def _process_conn(self, data_version):
+        # SQLite connections can't be used across a fork, and background callbacks run in forked
+        # processes (see app.py), so a child process opens its own connection to the same file
+        if os.getpid() == self._pid:
+            return data_version.conn
+        if data_version.version not in self._child_conns:
+            self._child_conns[data_version.version] = sqlite3.connect(data_version.path, check_same_thread=False, isolation_level=None,
+                                                                       factory=connection_factory())
+        return self._child_conns[data_version.version]
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def add_warmup(self, func):
+        """
+        Registers a function to run with the new data version before it goes live.
+        """
+        self._warmups.append(func)
+        return func
+
+    def add_retire_hook(self, func):
+        """
+        Registers a function to run with the old data version after it has been replaced.
+        """
+        self._retire_hooks.append(func)
+        return func
+
+    def versioned_path(self, version):
+        root, ext = os.path.splitext(self.sqlite_file_path)
+        return f'{root}.{version}{ext}'
+
+    def live_path(self):
+        """
+        Returns the path of the database the last refresh installed, or sqlite_file_path if there is none.
+        """
+        try:
+            with open(f'{self.sqlite_file_path}{LIVE_POINTER_SUFFIX}') as f:
+                path = self.versioned_path(json.load(f)['version'])
+        except (OSError, ValueError, KeyError):
+            return self.sqlite_file_path
+        return path if snapshot.read_local_manifest(path) is not None else self.sqlite_file_path
+
+    def _record_live(self, path):
+        pointer_path = f'{self.sqlite_file_path}{LIVE_POINTER_SUFFIX}'
+        if path == self.sqlite_file_path:
+            if os.path.exists(pointer_path):
+                os.remove(pointer_path)
+            return
+        tmp_path = f'{pointer_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': snapshot.read_local_manifest(path)['version']}, f)
+        os.replace(tmp_path, pointer_path)
+
+    def _remove_stale_versions(self, live_path):
+        """
+        Removes the databases refreshes installed that are older than live_path and that no process has open.
+        Newer ones were just installed by another process that's about to swap to them.
+        """
+        live_manifest = snapshot.read_local_manifest(live_path)
+        if live_manifest is None:
+            return
+        root, ext = os.path.splitext(self.sqlite_file_path)
+        for path in glob.glob(f'{glob.escape(root)}.*{ext}'):
+            if path == live_path:
+                continue
+            manifest = snapshot.read_local_manifest(path)
+            # no manifest yet while a version is being installed
+            if manifest is None or manifest.get('created', '') >= live_manifest.get('created', ''):
+                continue
+            if self._referenced(path):
+                continue
+            print(f'Removing stale database {path}')
+            for stale in (path, f'{path}.manifest.json'):
+                # another process may be removing it at the same time
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(stale)
+
+    def _ref_path(self, path):
+        return f'{path}.{self._pid}{REF_SUFFIX}'
+
+    def _referenced(self, path):
+        """
+        Returns whether a running process has the database at path open, removing the refs of those that exited.
+        """
+        referenced = False
+        for ref_path in glob.glob(f'{glob.escape(path)}.*{REF_SUFFIX}'):
+            try:
+                pid = int(ref_path[len(path) + 1:-len(REF_SUFFIX)])
+            except ValueError:
+                continue
+            if running(pid):
+                referenced = True
+            else:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(ref_path)
+        return referenced
+
+    @contextlib.contextmanager
+    def _download_lock(self, path):
+        """
+        Holds the lock for downloading to path, waiting for another process that's downloading it to finish.
+        The lock of a process that died while holding it is taken over.
+        """
+        lock_path = f'{path}{LOCK_SUFFIX}'
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                pass
+            try:
+                with open(lock_path) as f:
+                    holder = int(f.read())
+            except (OSError, ValueError):
+                # released, or its holder hasn't written its pid yet
+                holder = None
+            if holder is not None and not running(holder):
+                print(f'Taking over {lock_path} from exited process {holder}')
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(lock_path)
+                continue
+            time.sleep(1)
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(os.getpid()))
+        try:
+            yield
+        finally:
+            os.remove(lock_path)
+
+    def download_db(self):
+        """
+        Makes sure there's a database to load, returns its version and path.
+        """
+        live_path = self.live_path()
+        self._remove_stale_versions(live_path)
+        if live_path != self.sqlite_file_path:
+            return snapshot.read_local_manifest(live_path)['version'], live_path
+
+        os.makedirs(os.path.dirname(self.sqlite_file_path) or '.', exist_ok=True)
+
+        # another process may be downloading it, and this one loads what it downloaded
+        with self._download_lock(self.sqlite_file_path):
+            local_manifest = snapshot.read_local_manifest(self.sqlite_file_path)
+            if local_manifest is not None:
+                return local_manifest['version'], self.sqlite_file_path
+            if os.path.exists(self.sqlite_file_path):
+                return LOCAL_VERSION, self.sqlite_file_path
+            print('SQLite database does not exist.')
+
+            try:
+                manifest = snapshot.download_snapshot(self.storage_url, self.sqlite_file_path)
+                return manifest['version'], self.sqlite_file_path
+            except requests.HTTPError as e:
+                if e.response is None or e.response.status_code != 404:
+                    raise
+                print('No published snapshot found, falling back to uncompressed database.')
+
+            print('Downloading...')
+            tmp_path = f'{self.sqlite_file_path}.download'
+            with requests.get(f'{self.storage_url}/nba_shots.db', stream=True) as r:
+                r.raise_for_status()
+                with open(tmp_path, 'wb') as f:
+                    for chunk in r.iter_content(chunk_size=1024 * 1024):
+                        f.write(chunk)
+            os.replace(tmp_path, self.sqlite_file_path)
+            print('Database downloaded.')
+            return LOCAL_VERSION, self.sqlite_file_path
+
+    def open_version(self, version, path):
+        if path != self.sqlite_file_path:
+            open(self._ref_path(path), 'w').close()
+        return DataVersion(
+            version=version,
+            path=path,
+            conn=sqlite3.connect(path, check_same_thread=False, isolation_level=None, factory=connection_factory()),
+        )
+
+    def swap_to(self, version, path):
+        """
+        Opens the database at path, prewarms caches against it, then makes it the live version.
+        """
+        start_time = time.time()
+        self._staged = self.open_version(version, path)
+        try:
+            for warmup in self._warmups:
+                warmup_start = time.time()
+                warmup(version)
+                print(f'{warmup.__name__} took {time.time() - warmup_start} sec')
+        except Exception:
+            self._close(self._staged)
+            self._staged = None
+            raise
+
+        with self._swap_lock:
+            previous = self.current
+            self.current = self._staged
+            self._staged = None
+        try:
+            self._record_live(path)
+        except OSError as e:
+            print(f'Could not record {path} as the live database, a restart will load {self.sqlite_file_path}: {e}')
+
+        if previous is not None and previous.version != version:
+            self._retiring[previous.version] = previous
+            timer = threading.Timer(RETIRE_GRACE_SECONDS, self._retire, args=(previous,))
+            timer.daemon = True
+            timer.start()
+        print(f'Data version {version} live in {time.time() - start_time} sec')
+
+    def _retire(self, data_version):
+        for hook in self._retire_hooks:
+            hook(data_version.version)
+        self._retiring.pop(data_version.version, None)
+        self._close(data_version)
+        # removed unless another process still has it open, then by the last one to retire it
+        self._remove_stale_versions(self.live_path())
+        print(f'Data version {data_version.version} retired')
+
+    def _close(self, data_version):
+        data_version.conn.close()
+        if data_version.path != self.sqlite_file_path:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._ref_path(data_version.path))
+
+    def load(self):
+        start_time = time.time()
+        try:
+            version, path = self.download_db()
+            self.swap_to(version, path)
+        except Exception as e:
+            self.error = e
+            print(f'Error loading data: {e}')
+            raise
+
+        self._ready.set()
+        print(f'Data ready in {time.time() - start_time} sec')
+
+    def load_in_background(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.load, name='data-loader', daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def refresh(self):
+        """
+        Installs the latest published snapshot if it is newer than the live version. Returns True if swapped.
+        """
+        manifest = snapshot.fetch_manifest(self.storage_url)
+        if manifest['version'] == self.version:
+            return False
+
+        path = self.versioned_path(manifest['version'])
+        with self._download_lock(path):
+            # each of the app's processes refreshes, and the first downloads it for all of them
+            if snapshot.read_local_manifest(path) is None:
+                snapshot.download_snapshot(self.storage_url, path, manifest=manifest)
+        self.swap_to(manifest['version'], path)
+        return True
+
+    def watch_for_updates(self, interval):
+        """
+        Starts a background thread that calls `refresh()` every interval seconds.
+        """
+        def watch():
+            self.wait_ready()
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f'Error refreshing data: {e}')
+
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=watch, name='data-watcher', daemon=True)
+            self._watcher.start()
+        return self._watcher
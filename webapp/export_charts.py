@@ -0,0 +1,214 @@
+"""
+Renders the dashboard's charts for every player/team/year row of player_profiles_by_team_and_year and
+writes them to files, e.g. for scouting packets. It uses the figure builders of components/plots.py
+directly, without Dash, on a process pool.
+
+Run from the webapp folder:
+    python export_charts.py --out exports                                  # plotly JSON
+    python export_charts.py --out exports --format png --workers 8         # images, needs kaleido
+    python export_charts.py --out exports --player "LeBron James" --charts shot_map,zone
+
+Charts are written to <out>/<player>/<team>_<year>_<chart>.<format>. A rerun skips the rows whose charts
+are all there already, so an interrupted export can simply be restarted (--overwrite redoes them). Charts
+the database has no data for (zone, without the zone_stats table) are skipped.
+"""
+import argparse
+import contextlib
+import io
+import os
+import re
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+CHARTS = ['scatter', 'shot_map', 'trend', 'zone']
+FORMATS = ['json', 'png', 'svg', 'pdf']
+# seconds between progress lines
+REPORT_INTERVAL = 5
+
+_worker = {}
+
+
+def file_name(value):
+    return re.sub(r'[^\w.-]+', '_', str(value)).strip('_') or '_'
+
+
+def chart_paths(out_dir, row, charts, fmt):
+    player, team, year = row
+    return {chart: os.path.join(out_dir, file_name(player), f'{file_name(team)}_{year}_{chart}.{fmt}') for chart in charts}
+
+
+def init_worker(db_path, metric):
+    """
+    opens the database and loads the league baselines once per worker process
+    """
+    import pandas as pd
+    from components import plots
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        baseline = plots.load_league_baseline(conn)
+    except pd.errors.DatabaseError:
+        baseline = None
+    _worker.update(conn=conn, baseline=baseline, metric=metric)
+
+
+def build_figures(row, charts):
+    """
+    returns {chart: figure} for a player/team/year row, built the way the dashboard builds them
+    """
+    import pandas as pd
+    from components import plots
+    conn, baseline = _worker['conn'], _worker['baseline']
+    player, team, year = row
+    figures = {}
+    dff = plots.load_shots(conn, player, team, year)
+    if 'scatter' in charts:
+        figures['scatter'] = plots.scatter_figure(dff)
+    if 'shot_map' in charts:
+        pyramid = None if dff.empty else plots.bin_selection(dff, baseline)
+        figures['shot_map'] = plots.shot_map_figure(pyramid, _worker['metric'])
+    if 'trend' in charts:
+        figures['trend'] = plots.trend_figure(plots.agg_ma_data(dff))
+    if 'zone' in charts:
+        try:
+            zones = plots.load_zone_stats(conn, player, team, year)
+            league = plots.load_zone_stats(conn, 'all_values', 'all_values', year)
+        except pd.errors.DatabaseError:
+            zones = None
+        if zones is not None and not zones.empty:
+            figures['zone'] = plots.zone_efficiency_figure(zones, league)
+    return figures
+
+
+def export_row(row, paths, fmt):
+    """
+    writes the charts of a row, returns (row, charts written, seconds, error)
+    """
+    start_time = time.perf_counter()
+    try:
+        # the figure builders log every step, which is noise at this scale
+        with contextlib.redirect_stdout(io.StringIO()):
+            figures = build_figures(row, list(paths))
+        for chart, fig in figures.items():
+            path = paths[chart]
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # written under another name first, so an interrupted export never leaves a partial file behind
+            tmp_path = f'{path}.tmp'
+            if fmt == 'json':
+                fig.write_json(tmp_path)
+            else:
+                fig.write_image(tmp_path, format=fmt)
+            os.replace(tmp_path, path)
+        return row, len(figures), time.perf_counter() - start_time, None
+    except Exception as e:
+        return row, 0, time.perf_counter() - start_time, f'{type(e).__name__}: {e}'
+
+
+def unavailable_charts(db_path):
+    """
+    returns {chart: reason} for the charts the database has no data for
+    """
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        has_zones = conn.execute('select 1 from zone_stats limit 1').fetchone() is not None
+    except sqlite3.OperationalError:
+        has_zones = False
+    finally:
+        conn.close()
+    return {} if has_zones else {'zone': 'no zone stats in the database (see data_processing/create_zone_stats.py)'}
+
+
+def list_rows(db_path, player=None, team=None, year=None):
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    rows = conn.execute("""
+        select player, team, year
+        from player_profiles_by_team_and_year
+        where ((?) is null or player = (?))
+        and ((?) is null or team = (?))
+        and ((?) is null or year = (?))
+        order by player, team, year
+    """, (player, player, team, team, year, year)).fetchall()
+    conn.close()
+    return rows
+
+
+def export_charts(db_path, out_dir, charts=CHARTS, fmt='json', workers=None, overwrite=False, metric=None, **filters):
+    # left out before checking what's already exported, as their files would never be written
+    for chart, reason in unavailable_charts(db_path).items():
+        if chart in charts:
+            print(f'Skipping the {chart} chart: {reason}')
+            charts = [c for c in charts if c != chart]
+    if not charts:
+        return 0
+
+    rows = list_rows(db_path, **filters)
+    todo = []
+    for row in rows:
+        paths = chart_paths(out_dir, row, charts, fmt)
+        if overwrite or not all(os.path.exists(path) for path in paths.values()):
+            todo.append((row, paths))
+    print(f'{len(rows):,} rows, {len(rows) - len(todo):,} already exported, {len(todo):,} to go')
+    if not todo:
+        return 0
+
+    workers = workers or os.cpu_count()
+    start_time = last_report = time.perf_counter()
+    done = written = 0
+    failures = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(db_path, metric)) as executor:
+        futures = [executor.submit(export_row, row, paths, fmt) for row, paths in todo]
+        for future in as_completed(futures):
+            row, count, _, error = future.result()
+            done += 1
+            written += count
+            if error:
+                failures.append((row, error))
+                print(f'  failed {row}: {error}')
+            now = time.perf_counter()
+            if now - last_report >= REPORT_INTERVAL or done == len(todo):
+                last_report = now
+                rate = done / (now - start_time)
+                print(f'  {done:,}/{len(todo):,} rows | {rate:.1f} rows/sec, {written / (now - start_time):.1f} charts/sec | '
+                      f'ETA {(len(todo) - done) / rate:.0f} sec')
+
+    elapsed = time.perf_counter() - start_time
+    print(f'Exported {written:,} charts for {done - len(failures):,} rows in {elapsed:.1f} sec on {workers} processes '
+          f'({(done - len(failures)) / elapsed:.1f} rows/sec)')
+    if failures:
+        print(f'{len(failures):,} rows failed and will be retried on the next run')
+    return len(failures)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default='data/nba_shots.db')
+    parser.add_argument('-o', '--out', default='exports')
+    parser.add_argument('-f', '--format', choices=FORMATS, default='json')
+    parser.add_argument('-c', '--charts', default=','.join(CHARTS),
+                        help=f'comma separated charts to export, from {",".join(CHARTS)}')
+    parser.add_argument('-w', '--workers', type=int, default=0, help='worker processes (default: every core)')
+    parser.add_argument('--metric', choices=['fg', 'vs-league'], default='fg', help='shot map metric')
+    parser.add_argument('--player')
+    parser.add_argument('--team')
+    parser.add_argument('--year', type=int)
+    parser.add_argument('--overwrite', action='store_true', help='export rows that were already exported again')
+    args = parser.parse_args()
+
+    charts = [chart.strip() for chart in args.charts.split(',') if chart.strip()]
+    unknown = set(charts) - set(CHARTS)
+    if unknown:
+        parser.error(f'unknown charts: {", ".join(sorted(unknown))}')
+    if args.format != 'json':
+        try:
+            import kaleido  # noqa: F401
+        except ImportError:
+            parser.error(f'--format {args.format} needs kaleido (pip install kaleido)')
+    if not os.path.exists(args.db):
+        parser.error(f'{args.db} does not exist, start the web app once to download it or pass --db')
+
+    import shot_binning
+    metric = shot_binning.VS_LEAGUE if args.metric == 'vs-league' else shot_binning.FG_PCT
+    failed = export_charts(args.db, args.out, charts, args.format, args.workers or None, args.overwrite, metric,
+                           player=args.player, team=args.team, year=args.year)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,91 @@
+import base64
+import datetime
+import numpy as np
+import pandas as pd
+
+# Plotly serializes numeric arrays as JSON lists of full precision floats and dates as ISO strings, which
+# makes the shot map (one point per shot) and the trend charts the bulk of every callback response.
+# plotly.js (2.28+) also accepts arrays as {'dtype': ..., 'bdata': <base64 little-endian bytes>}, so
+# compact_figure re-encodes the numeric trace arrays that way after rounding them to the precision they're
+# shown at. Date axes only take numbers as float64 milliseconds, which compress worse than the date strings,
+# so dates are sent as strings, cut down to the day when there's no time of day.
+
+COMPACT_FIGURES_ENV = 'BASKETRADAR_COMPACT_FIGURES'
+
+_INT_DTYPES = ['i1', 'u1', 'i2', 'u2', 'i4', 'u4']
+
+
+def encode_array(values, decimals=None):
+    """
+    returns values as a plotly typed array spec, with floats rounded to decimals
+    """
+    arr = np.asarray(values)
+    if arr.dtype.kind == 'b':
+        arr = arr.astype('u1')
+    if arr.dtype.kind == 'f':
+        if decimals is not None:
+            arr = np.round(arr, decimals)
+        finite = arr[np.isfinite(arr)]
+        if finite.size < arr.size or not np.array_equal(finite, np.trunc(finite)):
+            return _typed_array(arr, 'f4')
+    if arr.size == 0:
+        return _typed_array(arr, 'f4')
+
+    low, high = arr.min(), arr.max()
+    for dtype in _INT_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return _typed_array(arr, dtype)
+    return _typed_array(arr, 'f8')
+
+
+def encode_dates(values):
+    """
+    returns datetimes as a list of date strings, without the time when they're all at midnight
+    """
+    arr = pd.DatetimeIndex(values).values.astype('datetime64[s]')
+    unit = 'D' if (arr == arr.astype('datetime64[D]')).all() else 's'
+    return np.datetime_as_string(arr, unit=unit).tolist()
+
+
+def _typed_array(arr, dtype):
+    spec = {'dtype': dtype, 'bdata': base64.b64encode(arr.astype('<' + dtype).tobytes()).decode('ascii')}
+    if arr.ndim > 1:
+        # row major, so z[row][col] reads the same as a nested list
+        spec['shape'] = ','.join(str(n) for n in arr.shape)
+    return spec
+
+
+def _is_dates(value):
+    if value.dtype.kind == 'O':
+        # plotly keeps datetime indexes as object arrays of datetimes
+        return len(value) > 0 and isinstance(value[0], datetime.date)
+    return value.dtype.kind == 'M'
+
+
+def compact_trace(props, decimals=None, prefix=''):
+    """
+    returns a copy of the trace properties with their arrays encoded, see compact_figure
+    """
+    decimals = decimals or {}
+    compacted = {}
+    for key, value in props.items():
+        path = prefix + key
+        if isinstance(value, dict):
+            value = compact_trace(value, decimals, path + '.')
+        elif isinstance(value, np.ndarray) and value.ndim == 1 and _is_dates(value):
+            value = encode_dates(value)
+        elif isinstance(value, np.ndarray) and value.ndim in (1, 2) and value.dtype.kind in 'biuf':
+            value = encode_array(value, decimals.get(path))
+        compacted[key] = value
+    return compacted
+
+
+def compact_figure(fig, decimals=None):
+    """
+    returns the figure as a dict with its trace arrays encoded as typed arrays.
+    decimals maps trace attributes (e.g. 'y', 'marker.size') to the number of decimals they're shown at
+    """
+    fig_dict = fig.to_dict()
+    fig_dict['data'] = [compact_trace(trace, decimals) for trace in fig_dict['data']]
+    return fig_dict
@@ -0,0 +1,62 @@
+import hashlib
+import os
+import pickle
+
+# A background callback's job runs in a forked process (see app.py), so what it adds to the app's cache is lost
+# when it exits. A job forward()s a result it computed to a file in BASKETRADAR_JOB_RESULTS_DIR, and the app's
+# process claim()s it from there the next time it needs it, instead of computing it again.
+RESULTS_DIR = os.environ.get('BASKETRADAR_JOB_RESULTS_DIR', './data/job_results')
+
+# claim() found nothing, as None can be a result
+MISSING = object()
+
+
+def _path(key):
+    return os.path.join(RESULTS_DIR, f'{hashlib.sha1(repr(key).encode()).hexdigest()}.pkl')
+
+
+def forward(key, value):
+    """
+    saves a forked job's result under key for the app's process
+    """
+    path = _path(key)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # a job cancelled mid-write never leaves a partial result behind
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f'Could not forward {key[0]}: {e}')
+
+
+def pending(key):
+    """
+    returns whether a job forwarded a result under key that wasn't claimed yet
+    """
+    return os.path.exists(_path(key))
+
+
+def claim(key):
+    """
+    returns the result a job forwarded under key, or MISSING. it's removed, as the caller caches it
+    """
+    path = _path(key)
+    try:
+        with open(path, 'rb') as f:
+            value = pickle.load(f)
+    except FileNotFoundError:
+        return MISSING
+    except (OSError, pickle.UnpicklingError, EOFError) as e:
+        print(f'Could not read the forwarded {key[0]}: {e}')
+        return MISSING
+    discard(key)
+    return value
+
+
+def discard(key):
+    try:
+        os.remove(_path(key))
+    except OSError:
+        pass
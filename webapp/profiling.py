@@ -0,0 +1,133 @@
+import contextvars
+import cProfile
+import functools
+import glob
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from admin import is_admin
+
+# Callbacks wrapped with @profiled can run under cProfile, to see where a slow selection spends its time.
+# A profile is saved as a pstats file (open it with `python -m pstats` or snakeviz) named after the
+# callback, next to a .json file with the callback's inputs and duration. Two ways to turn it on:
+#  - BASKETRADAR_PROFILE=1 profiles a random BASKETRADAR_PROFILE_SAMPLE_RATE of the calls, and at most one
+#    per callback every BASKETRADAR_PROFILE_INTERVAL seconds, so it can stay on in production
+#  - an admin request (see admin.py) with an X-Profile: 1 header profiles the callbacks it runs, including
+#    a background callback's job, which is forked from the request's thread and so inherits the flag
+# Only one call is profiled at a time per process, and the oldest files beyond BASKETRADAR_PROFILE_KEEP are removed.
+PROFILE_ENV = 'BASKETRADAR_PROFILE'
+PROFILE_DIR = os.environ.get('BASKETRADAR_PROFILE_DIR', './data/profiles')
+SAMPLE_RATE = float(os.environ.get('BASKETRADAR_PROFILE_SAMPLE_RATE', '0.05'))
+MIN_INTERVAL = float(os.environ.get('BASKETRADAR_PROFILE_INTERVAL', '60'))
+KEEP = int(os.environ.get('BASKETRADAR_PROFILE_KEEP', '50'))
+PROFILE_HEADER = 'X-Profile'
+
+sampling = os.environ.get(PROFILE_ENV) == '1'
+_requested = contextvars.ContextVar('profile_requested', default=False)
+_lock = threading.Lock()
+
+
+def read_request_header():
+    """
+    before_request hook flagging the callbacks of an admin request with the X-Profile header for profiling
+    """
+    from flask import request
+    # set on every request, as a server thread can go on to serve other requests
+    _requested.set(request.headers.get(PROFILE_HEADER) == '1' and is_admin())
+
+
+def _last_profiled(name):
+    # read from the saved files rather than kept in memory, so it holds across processes and background jobs
+    paths = glob.glob(os.path.join(PROFILE_DIR, f'{name}_*.prof'))
+    return max((os.path.getmtime(path) for path in paths), default=0)
+
+
+def _reason(name):
+    if _requested.get():
+        return 'requested'
+    if sampling and random.random() < SAMPLE_RATE and time.time() - _last_profiled(name) >= MIN_INTERVAL:
+        return 'sampled'
+    return None
+
+
+def _prune():
+    paths = sorted(glob.glob(os.path.join(PROFILE_DIR, '*.prof')), key=os.path.getmtime, reverse=True)
+    for path in paths[KEEP:]:
+        for old in (path, path[:-len('.prof')] + '.json'):
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+
+def save(profiler, name, args, kwargs, seconds, reason):
+    """
+    writes the profile and its inputs, returns the profile's path
+    """
+    # callables (a background callback's set_progress) aren't inputs
+    inputs = json.dumps({
+        'args': [arg for arg in args if not callable(arg)],
+        'kwargs': {key: value for key, value in kwargs.items() if not callable(value)},
+    }, default=repr, sort_keys=True)
+    now = time.time()
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(now)) + f'.{int(now * 1000) % 1000:03d}'
+    base = os.path.join(PROFILE_DIR, f'{name}_{stamp}_{os.getpid()}_{hashlib.sha1(inputs.encode()).hexdigest()[:8]}')
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(base + '.prof')
+    with open(base + '.json', 'w') as f:
+        json.dump({
+            'callback': name,
+            'inputs': json.loads(inputs),
+            'seconds': round(seconds, 4),
+            'reason': reason,
+            'pid': os.getpid(),
+            'time': now,
+            'profile': os.path.basename(base + '.prof'),
+        }, f, indent=1)
+    _prune()
+    return base + '.prof'
+
+
+def profiled(func):
+    """
+    runs the callback under cProfile when profiling is requested or sampled (see above)
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        reason = _reason(name)
+        if reason is None or not _lock.acquire(blocking=False):
+            return func(*args, **kwargs)
+        try:
+            profiler = cProfile.Profile()
+            start_time = time.perf_counter()
+            try:
+                return profiler.runcall(func, *args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start_time
+                try:
+                    path = save(profiler, name, args, kwargs, seconds, reason)
+                    print(f'Profiled {name} ({reason}) in {seconds:.3f} sec: {path}')
+                except OSError as e:
+                    print(f'Could not save the profile of {name}: {e}')
+        finally:
+            _lock.release()
+    return wrapper
+
+
+def list_profiles():
+    """
+    returns the saved profiles' details, newest first
+    """
+    profiles = []
+    for path in glob.glob(os.path.join(PROFILE_DIR, '*.json')):
+        try:
+            with open(path) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return sorted(profiles, key=lambda profile: profile['time'], reverse=True)
@@ -0,0 +1,179 @@
+# SQL used by the webapp's callbacks. This module only uses the standard library so the data pipeline
+# can import it to check the query plans of a freshly built database (data_processing/finalize_db.py).
+
+ALL_VALUES = 'all_values'
+
+def shots_query(player_name, team, year):
+    """
+    returns (sql, params) selecting the shots for a player/team/year filter
+    """
+    sql_query = f"""
+        select
+            shot_type,
+            distance,
+            made,
+            shotX_tenths / 10.0 as shotX,
+            shotY_tenths / 10.0 as shotY,
+            day,
+            year,
+            zone
+        from shots
+        where
+            1 = 1
+            {'and player_id = (select player_id from players where player = (?))' if player_name != ALL_VALUES else ''}
+            {'and team_id = (select team_id from teams where team = (?))' if team != ALL_VALUES else ''}
+            {'and year = (?)' if year != ALL_VALUES else ''}
+    """
+
+    params = []
+    if player_name and player_name != ALL_VALUES:
+        params = params + [player_name]
+    if team and team != ALL_VALUES:
+        params = params + [team]
+    if year and year != ALL_VALUES:
+        params = params + [int(year)]
+    return sql_query, params
+
+def filter_options_query(column, player_name=ALL_VALUES, team=ALL_VALUES, year=ALL_VALUES):
+    """
+    returns (sql, params) selecting the distinct players, teams or years available under the other filters
+    """
+    sql_query = f"""
+        select distinct {column}
+        from player_profiles_by_team_and_year
+        where
+            1 = 1
+            {'and player = (?)' if player_name != ALL_VALUES else ''}
+            {'and team = (?)' if team != ALL_VALUES else ''}
+            {'and year = (?)' if year != ALL_VALUES else ''}
+        order by {column} {'desc' if column == 'year' else ''}
+    """
+    params = []
+    if player_name != ALL_VALUES:
+        params = params + [player_name]
+    if team != ALL_VALUES:
+        params = params + [team]
+    if year != ALL_VALUES:
+        params = params + [year]
+    return sql_query, params
+
+def profile_query(player_name, team, year):
+    """
+    returns (sql, params) selecting a player's profile row at the aggregation level of the filters
+    """
+    if team == ALL_VALUES and year == ALL_VALUES:
+        return 'select * from player_profiles where player = (?)', (player_name,)
+    elif year == ALL_VALUES:
+        return 'select * from player_profiles_by_team where player = (?) and team = (?)', (player_name, team,)
+    elif team == ALL_VALUES:
+        return 'select * from player_profiles_by_year where player = (?) and year = (?)', (player_name, year,)
+    else:
+        return 'select * from player_profiles_by_team_and_year where player = (?) and team = (?) and year = (?)', (player_name, team, year,)
+
+def player_images_query():
+    """
+    returns (sql, params) selecting every player's headshot link and the etag of its mirrored thumbnail, if any
+    """
+    sql_query = """
+        select players.player, players.player_image_link, images.etag
+        from players
+        left join images on images.url = players.player_image_link
+    """
+    return sql_query, ()
+
+def team_logos_query():
+    """
+    returns (sql, params) selecting every team's logo link and the etag of its mirrored thumbnail, if any
+    """
+    sql_query = """
+        select teams.team, teams.logo_link, images.etag
+        from teams
+        left join images on images.url = teams.logo_link
+    """
+    return sql_query, ()
+
+def image_query(etag):
+    """
+    returns (sql, params) selecting a mirrored thumbnail by etag
+    """
+    return 'select content_type, data from images where etag = (?) limit 1', (etag,)
+
+def league_baseline_cells_query():
+    """
+    returns (sql, params) selecting the league's attempts and makes per season and shot map cell
+    """
+    sql_query = """
+        select year, cell_x, cell_y, attempts, makes
+        from league_baseline_cells
+    """
+    return sql_query, ()
+
+def league_baseline_zones_query():
+    """
+    returns (sql, params) selecting the league's attempts and makes per season and zone
+    """
+    sql_query = """
+        select year, zone, attempts, makes
+        from league_baseline_zones
+    """
+    return sql_query, ()
+
+def zone_stats_query(player_name, team, year):
+    """
+    returns (sql, params) selecting the attempts, makes and points per zone for a player/team/year filter
+    """
+    sql_query = """
+        select zone, attempts, makes, points
+        from zone_stats
+        where player is (?) and team is (?) and year is (?)
+        order by zone
+    """
+    # zone_stats stores "all" as NULL
+    params = (
+        None if player_name == ALL_VALUES else player_name,
+        None if team == ALL_VALUES else team,
+        None if year == ALL_VALUES else int(year),
+    )
+    return sql_query, params
+
+def similarity_index_query(level):
+    """
+    returns (sql, params) selecting the shot diet index of a profile level (see similarity_index.py)
+    """
+    return 'select data from similarity_index where level = (?)', (level,)
+
+def shots_export_query(player_name, team, year):
+    """
+    returns (sql, params) selecting the shots for a player/team/year filter with their player, team and date,
+    in no particular order so they can be streamed without sorting them first
+    """
+    sql_query = f"""
+        select
+            players.player,
+            teams.team,
+            shots.year,
+            date(shots.day * 86400, 'unixepoch') as date,
+            shots.shot_type,
+            shots.distance,
+            shots.made,
+            shots.shotX_tenths / 10.0 as shotX,
+            shots.shotY_tenths / 10.0 as shotY,
+            shots.zone
+        from shots
+        -- cross join keeps shots as the outer loop, searched by the filters, with names looked up by key
+        cross join players on players.player_id = shots.player_id
+        cross join teams on teams.team_id = shots.team_id
+        where
+            1 = 1
+            {'and shots.player_id = (select player_id from players where player = (?))' if player_name != ALL_VALUES else ''}
+            {'and shots.team_id = (select team_id from teams where team = (?))' if team != ALL_VALUES else ''}
+            {'and shots.year = (?)' if year != ALL_VALUES else ''}
+    """
+    params = []
+    if player_name != ALL_VALUES:
+        params = params + [player_name]
+    if team != ALL_VALUES:
+        params = params + [team]
+    if year != ALL_VALUES:
+        params = params + [int(year)]
+    return sql_query, params
@@ -0,0 +1,343 @@
+import functools
+import glob
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+# Every statement run on the web app's SQLite connections goes through TracingConnection/TracingCursor,
+# which add it to per-statement totals when it's executed, and the rows fetched or iterated for it and the time
+# they took as they're read (pd.read_sql fetches them all at once). Statements slower than
+# BASKETRADAR_SLOW_QUERY_MS from execute until their last row are printed and kept in a short log with their
+# EXPLAIN QUERY PLAN, run on a connection of its own. GET /admin/queries shows both. A background callback's job runs in a
+# forked process, which appends its statements to a file in BASKETRADAR_QUERY_STATS_DIR for the app's process
+# to merge in. BASKETRADAR_QUERY_STATS=0 turns it off.
+QUERY_STATS_ENV = 'BASKETRADAR_QUERY_STATS'
+SLOW_QUERY_MS_ENV = 'BASKETRADAR_SLOW_QUERY_MS'
+SHARED_DIR = os.environ.get('BASKETRADAR_QUERY_STATS_DIR', './data/query_stats')
+SLOW_QUERY_MS = 250
+# slow queries kept for /admin/queries
+SLOW_LOG_SIZE = 100
+# rows a cursor is iterated over before they're added to its statement's totals
+ITERATED_ROWS_BATCH = 1000
+
+
+@functools.lru_cache(maxsize=1024)
+def template(sql):
+    """
+    returns the statement without comments, with its whitespace collapsed and "?, ?, ?" lists shortened
+    to "?, ...", so every call of a query builder adds to the same totals
+    """
+    sql = re.sub(r'\s+', ' ', re.sub(r'--[^\n]*', '', sql)).strip()
+    return re.sub(r'\?(\s*,\s*\?)+', '?, ...', sql)
+
+
+def param_count(parameters):
+    return len(parameters) if parameters is not None else 0
+
+
+def running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class QueryStats:
+    def __init__(self, slow_ms=SLOW_QUERY_MS, slow_log_size=SLOW_LOG_SIZE, shared_dir=None):
+        self.slow_ms = slow_ms
+        self.shared_dir = shared_dir
+        # a forked process inherits this, and forwards its statements to this pid's files
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        self._templates = {}
+        self._plans = {}
+        self._slow = deque(maxlen=slow_log_size)
+        # path: bytes of a forked process's file already merged
+        self._offsets = {}
+
+    def executed(self, sql, parameters, seconds):
+        """
+        adds a call of the statement and the time it took to execute
+        """
+        self._update(template(sql), calls=1, ms=seconds * 1000, count=param_count(parameters))
+
+    def fetched(self, sql, seconds, rows):
+        """
+        adds rows fetched for a call of the statement and the time they took
+        """
+        self._update(template(sql), ms=seconds * 1000, rows=rows)
+
+    def finished(self, conn, sql, parameters, seconds, rows):
+        """
+        a call of the statement is done, after seconds from execute until its last row was fetched. it goes in
+        the slow query log if it took at least slow_ms
+        """
+        key = template(sql)
+        ms = seconds * 1000
+        if ms < self.slow_ms:
+            self._update(key, max_ms=ms)
+            return
+        with self._lock:
+            plan = self._plans.get(key)
+        if plan is None:
+            plan = explain(conn, sql, parameters)
+        count = param_count(parameters)
+        print(f'Slow query ({ms:.0f} ms, {rows} rows, {count} params): {key}')
+        for line in plan:
+            print(f'    {line}')
+        self._update(key, max_ms=ms, slow={
+            'time': time.time(),
+            'ms': round(ms, 1),
+            'rows': rows,
+            'sql': key,
+            'params': [repr(value)[:100] for value in (parameters or [])] if not isinstance(parameters, dict) else
+                      {name: repr(value)[:100] for name, value in parameters.items()},
+            'plan': plan,
+        })
+
+    def _update(self, key, calls=0, ms=0.0, rows=0, count=None, max_ms=0.0, slow=None):
+        """
+        adds to the statement's totals, and to the slow query log if slow is given
+        """
+        with self._lock:
+            stats = self._templates.get(key)
+            if stats is None:
+                stats = self._templates[key] = {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0, 'slow': 0, 'param_counts': set()}
+            stats['calls'] += calls
+            stats['total_ms'] += ms
+            stats['max_ms'] = max(stats['max_ms'], max_ms)
+            stats['rows'] += rows
+            if count is not None:
+                stats['param_counts'].add(count)
+            if slow is not None:
+                stats['slow'] += 1
+                self._plans.setdefault(key, slow['plan'])
+                self._slow.append(slow)
+        self._forward({'sql': key, 'calls': calls, 'ms': ms, 'rows': rows, 'param_count': count, 'max_ms': max_ms,
+                       'slow': slow})
+
+    def _forward(self, update):
+        # a forked process's own totals are lost when it exits
+        if self.shared_dir is None or os.getpid() == self._pid:
+            return
+        line = json.dumps(update, default=repr)
+        try:
+            os.makedirs(self.shared_dir, exist_ok=True)
+            with open(os.path.join(self.shared_dir, f'{self._pid}-{os.getpid()}.jsonl'), 'a') as f:
+                f.write(line + '\n')
+        except OSError as e:
+            print(f'Could not forward query stats: {e}')
+
+    def _merge_forwarded(self):
+        """
+        adds the statements forked processes forwarded since the last merge, and removes the files of those
+        that exited, and of other app processes that did
+        """
+        if self.shared_dir is None:
+            return
+        with self._merge_lock:
+            for path in glob.glob(os.path.join(self.shared_dir, '*-*.jsonl')):
+                try:
+                    parent, child = (int(pid) for pid in os.path.basename(path)[:-len('.jsonl')].split('-'))
+                except ValueError:
+                    continue
+                if parent != self._pid:
+                    if not running(parent):
+                        self._remove(path)
+                    continue
+                # checked first, so a file is only removed once everything its process wrote has been read
+                done = not running(child)
+                offset = self._offsets.get(path, 0)
+                try:
+                    with open(path, 'rb') as f:
+                        f.seek(offset)
+                        chunk = f.read()
+                except OSError:
+                    continue
+                # a line still being written is left for the next merge
+                chunk = chunk[:chunk.rfind(b'\n') + 1]
+                for line in chunk.splitlines():
+                    try:
+                        forwarded = json.loads(line)
+                    except ValueError:
+                        continue
+                    self._update(forwarded['sql'], forwarded['calls'], forwarded['ms'], forwarded['rows'],
+                                 forwarded['param_count'], forwarded['max_ms'], forwarded['slow'])
+                if done:
+                    self._remove(path)
+                else:
+                    self._offsets[path] = offset + len(chunk)
+
+    def _remove(self, path):
+        self._offsets.pop(path, None)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def snapshot(self):
+        """
+        returns the per-statement totals, slowest in total first, and the slow query log, newest first
+        """
+        self._merge_forwarded()
+        with self._lock:
+            templates = [
+                {
+                    'sql': key,
+                    'calls': stats['calls'],
+                    'total_ms': round(stats['total_ms'], 1),
+                    'mean_ms': round(stats['total_ms'] / stats['calls'], 2),
+                    'max_ms': round(stats['max_ms'], 1),
+                    'rows': stats['rows'],
+                    'mean_rows': round(stats['rows'] / stats['calls'], 1),
+                    'slow': stats['slow'],
+                    'param_counts': sorted(stats['param_counts']),
+                    'plan': self._plans.get(key),
+                }
+                for key, stats in self._templates.items()
+            ]
+            # forwarded slow queries are added when they're merged, so the log isn't in order
+            slow = sorted(self._slow, key=lambda entry: entry['time'], reverse=True)
+        templates.sort(key=lambda stats: stats['total_ms'], reverse=True)
+        return {'slow_query_ms': self.slow_ms, 'pid': os.getpid(), 'queries': templates, 'slow': slow}
+
+    def reset(self):
+        with self._merge_lock:
+            if self.shared_dir is not None:
+                for path in glob.glob(os.path.join(self.shared_dir, f'{self._pid}-*.jsonl')):
+                    self._remove(path)
+            with self._lock:
+                self._templates.clear()
+                self._plans.clear()
+                self._slow.clear()
+
+
+def explain(conn, sql, parameters):
+    """
+    returns the EXPLAIN QUERY PLAN of the statement as indented lines, or the error it raised. it's run on a
+    connection of its own to conn's database, as conn may be in the middle of another statement on another thread
+    """
+    try:
+        plan_conn = sqlite3.connect(conn.database, uri=conn.uri, check_same_thread=False)
+        try:
+            rows = plan_conn.execute(f'EXPLAIN QUERY PLAN {sql}', parameters or ()).fetchall()
+        finally:
+            plan_conn.close()
+    except sqlite3.Error as e:
+        return [f'no plan: {e}']
+    depth = {0: -1}
+    lines = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node] + detail)
+    return lines
+
+
+query_stats = QueryStats(float(os.environ.get(SLOW_QUERY_MS_ENV, SLOW_QUERY_MS)), shared_dir=SHARED_DIR)
+
+
+class TracingCursor(sqlite3.Cursor):
+    # [sql, parameters, seconds, rows] of the statement whose rows are being fetched, and the [seconds, rows]
+    # iterated since they were last added to its totals
+    _trace = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        start_time = time.perf_counter()
+        super().execute(sql, parameters)
+        seconds = time.perf_counter() - start_time
+        query_stats.executed(sql, parameters, seconds)
+        self._trace = [sql, parameters, seconds, 0, [0.0, 0]]
+        if self.description is None:
+            # not a query, so there's nothing to fetch
+            self._finish()
+        return self
+
+    def fetchone(self):
+        start_time = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(time.perf_counter() - start_time, 0 if row is None else 1, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start_time = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(time.perf_counter() - start_time, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        start_time = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(time.perf_counter() - start_time, len(rows), True)
+        return rows
+
+    def __next__(self):
+        start_time = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(time.perf_counter() - start_time, 0, True)
+            raise
+        self._fetched(time.perf_counter() - start_time, 1, False, iterated=True)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def _fetched(self, seconds, rows, done, iterated=False):
+        trace = self._trace
+        if trace is None:
+            return
+        trace[2] += seconds
+        trace[3] += rows
+        trace[4][0] += seconds
+        trace[4][1] += rows
+        # rows iterated one at a time are added in batches. a statement whose rows weren't all fetched, e.g.
+        # execute(...).fetchone(), is finished by the cursor's next execute or close, or never
+        if done or not iterated or trace[4][1] >= ITERATED_ROWS_BATCH:
+            self._record_fetched(trace)
+        if done:
+            self._finish()
+
+    def _record_fetched(self, trace):
+        seconds, rows = trace[4]
+        if rows or seconds:
+            query_stats.fetched(trace[0], seconds, rows)
+            trace[4] = [0.0, 0]
+
+    def _finish(self):
+        trace, self._trace = self._trace, None
+        if trace is not None:
+            self._record_fetched(trace)
+            query_stats.finished(self.connection, *trace[:4])
+
+
+class TracingConnection(sqlite3.Connection):
+    def __init__(self, database, *args, uri=False, **kwargs):
+        super().__init__(database, *args, uri=uri, **kwargs)
+        # to open a connection of its own for EXPLAIN QUERY PLAN
+        self.database = database
+        self.uri = uri
+
+    def cursor(self, factory=TracingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+
+def connection_factory():
+    """
+    returns the connection class to pass to sqlite3.connect
+    """
+    return TracingConnection if os.environ.get(QUERY_STATS_ENV, '1') != '0' else sqlite3.Connection
@@ -0,0 +1,153 @@
+import numpy as np
+
+# The shot map used to send every shot to the browser and let Plotly bin them. Instead the shots are binned
+# here into a pyramid of grids, and the shot map gets the grid matching how far it is zoomed in.
+# Court coordinates are in tenths of a foot (see filter_db_data in components/plots.py).
+X_RANGE = (-250, 250)
+Y_RANGE = (-52.5, 417.5)
+BIN_SIZES = [5, 10, 15, 30]
+# a zoom level gets the finest grid with at most this many cells across the visible width
+MAX_CELLS_ACROSS = 36
+# ...unless that would leave fewer shots than this per visible cell, then it gets coarser
+MIN_SHOTS_PER_CELL = 0.25
+# league cells with fewer shots than this fall back to the league's FG% for the shot's zone
+MIN_BASELINE_ATTEMPTS = 25
+
+FG_PCT = 'Field Goal Percentage'
+VS_LEAGUE = 'Vs. League Average'
+ATTEMPTS = 'Shot Attempts'
+
+
+def _bin_count(span, size):
+    return int(np.ceil(span / size))
+
+
+def base_cells(x, y, base=BIN_SIZES[0]):
+    """
+    returns (in court mask, column, row) of the shots on the finest grid, which is also the grid
+    data_processing/create_league_baselines.py counts the league's shots on
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    in_court = (x >= X_RANGE[0]) & (x <= X_RANGE[1]) & (y >= Y_RANGE[0]) & (y <= Y_RANGE[1])
+    ix = np.minimum(((x[in_court] - X_RANGE[0]) // base).astype(np.intp), _bin_count(X_RANGE[1] - X_RANGE[0], base) - 1)
+    iy = np.minimum(((y[in_court] - Y_RANGE[0]) // base).astype(np.intp), _bin_count(Y_RANGE[1] - Y_RANGE[0], base) - 1)
+    return in_court, ix, iy
+
+
+def bin_shots(x, y, made, expected=None, sizes=BIN_SIZES):
+    """
+    returns {size: {'x': bin centers, 'y': bin centers, 'attempts': 2d counts, 'makes': 2d counts}} for each bin size,
+    plus 'expected' makes when each shot's expected FG% is given.
+    the shots are counted once on the finest grid, which is summed in blocks for the coarser ones
+    """
+    base = sizes[0]
+    # pad the finest grid so each coarser size covers a whole number of its cells
+    factor = int(np.lcm.reduce([size // base for size in sizes]))
+    nx = _bin_count(_bin_count(X_RANGE[1] - X_RANGE[0], base), factor) * factor
+    ny = _bin_count(_bin_count(Y_RANGE[1] - Y_RANGE[0], base), factor) * factor
+
+    in_court, ix, iy = base_cells(x, y, base)
+    cells = iy * nx + ix
+    grids = {
+        'attempts': np.bincount(cells, minlength=nx * ny).reshape(ny, nx),
+        'makes': np.bincount(cells, weights=np.asarray(made)[in_court], minlength=nx * ny).astype(np.intp).reshape(ny, nx),
+    }
+    if expected is not None:
+        grids['expected'] = np.bincount(cells, weights=np.asarray(expected)[in_court], minlength=nx * ny).reshape(ny, nx)
+
+    pyramid = {}
+    for size in sizes:
+        f = size // base
+        bins_x = _bin_count(X_RANGE[1] - X_RANGE[0], size)
+        bins_y = _bin_count(Y_RANGE[1] - Y_RANGE[0], size)
+        pyramid[size] = {
+            'x': X_RANGE[0] + size * (np.arange(bins_x) + 0.5),
+            'y': Y_RANGE[0] + size * (np.arange(bins_y) + 0.5),
+        }
+        for name, grid in grids.items():
+            pyramid[size][name] = grid.reshape(ny // f, f, nx // f, f).sum(axis=(1, 3))[:bins_y, :bins_x]
+    return pyramid
+
+
+def pick_bin_size(pyramid, x_range=X_RANGE, y_range=Y_RANGE):
+    """
+    returns the bin size to show for the visible x and y ranges
+    """
+    sizes = sorted(pyramid)
+    span = x_range[1] - x_range[0]
+    fitting = [size for size in sizes if span / size <= MAX_CELLS_ACROSS]
+    start = sizes.index(fitting[0]) if fitting else len(sizes) - 1
+    for size in sizes[start:]:
+        level = pyramid[size]
+        visible_x = (level['x'] >= x_range[0]) & (level['x'] <= x_range[1])
+        visible_y = (level['y'] >= y_range[0]) & (level['y'] <= y_range[1])
+        cells = visible_x.sum() * visible_y.sum()
+        if cells and level['attempts'][np.ix_(visible_y, visible_x)].sum() / cells >= MIN_SHOTS_PER_CELL:
+            return size
+    return sizes[-1]
+
+
+def bin_values(level, metric):
+    """
+    returns the 2d values to plot for a pyramid level: FG%, FG% minus the league's for the same shots
+    (both NaN where there were no attempts) or attempts
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if metric == FG_PCT:
+            return np.where(level['attempts'] > 0, level['makes'] / level['attempts'], np.nan)
+        if metric == VS_LEAGUE:
+            return np.where(level['attempts'] > 0, (level['makes'] - level['expected']) / level['attempts'], np.nan)
+    return level['attempts']
+
+
+def league_baseline(cells_df, zones_df, base=BIN_SIZES[0]):
+    """
+    returns the league's attempts and makes per season as arrays, from the league_baseline_* tables
+    """
+    years = np.union1d(cells_df['year'].unique(), zones_df['year'].unique())
+    nx = _bin_count(X_RANGE[1] - X_RANGE[0], base)
+    ny = _bin_count(Y_RANGE[1] - Y_RANGE[0], base)
+    cell_attempts = np.zeros((len(years), ny, nx), dtype=np.int64)
+    cell_makes = np.zeros_like(cell_attempts)
+    year_index = np.searchsorted(years, cells_df['year'])
+    cell_attempts[year_index, cells_df['cell_y'], cells_df['cell_x']] = cells_df['attempts']
+    cell_makes[year_index, cells_df['cell_y'], cells_df['cell_x']] = cells_df['makes']
+
+    zones = np.sort(zones_df['zone'].unique())
+    zone_attempts = np.zeros((len(years), len(zones)), dtype=np.int64)
+    zone_makes = np.zeros_like(zone_attempts)
+    year_index = np.searchsorted(years, zones_df['year'])
+    zone_index = np.searchsorted(zones, zones_df['zone'])
+    zone_attempts[year_index, zone_index] = zones_df['attempts']
+    zone_makes[year_index, zone_index] = zones_df['makes']
+
+    return {
+        'years': years, 'zones': zones,
+        'cell_attempts': cell_attempts, 'cell_makes': cell_makes,
+        'zone_attempts': zone_attempts, 'zone_makes': zone_makes,
+    }
+
+
+def league_fg_pct(baseline, x, y, year, zone):
+    """
+    returns the league's FG% for each shot: in its season and cell, or in its season and zone where
+    the cell has too few league shots. NaN for shots outside the court or in seasons without a baseline
+    """
+    year, zone = np.asarray(year), np.asarray(zone)
+    rates = np.full(len(year), np.nan)
+    in_court, ix, iy = base_cells(x, y)
+    year_index = np.clip(np.searchsorted(baseline['years'], year), 0, len(baseline['years']) - 1)
+    zone_index = np.clip(np.searchsorted(baseline['zones'], zone), 0, len(baseline['zones']) - 1)
+    known = (baseline['years'][year_index] == year) & (baseline['zones'][zone_index] == zone)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        zone_attempts = baseline['zone_attempts'][year_index, zone_index]
+        rates[known] = (baseline['zone_makes'][year_index, zone_index] / zone_attempts)[known]
+        year_index, known = year_index[in_court], known[in_court]
+        cell_attempts = baseline['cell_attempts'][year_index, iy, ix]
+        cell_rates = baseline['cell_makes'][year_index, iy, ix] / cell_attempts
+    use_cell = known & (cell_attempts >= MIN_BASELINE_ATTEMPTS)
+    court_rates = rates[in_court]
+    court_rates[use_cell] = cell_rates[use_cell]
+    rates[in_court] = court_rates
+    return rates
@@ -0,0 +1,70 @@
+import csv
+import io
+import json
+import zlib
+
+# The /export/shots route streams the shots of a filter straight from a SQLite cursor: rows are fetched,
+# formatted and (optionally) compressed a batch at a time, so an export of every shot in the database holds
+# no more in memory than one selection of a single player.
+BATCH_ROWS = 5000
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+def csv_chunks(cursor, batch_rows=BATCH_ROWS):
+    """
+    yields the cursor's rows as CSV text, a header line then a chunk per batch
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow([column[0] for column in cursor.description])
+    while True:
+        rows = cursor.fetchmany(batch_rows)
+        writer.writerows(rows)
+        if buffer.tell():
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if not rows:
+            return
+
+
+def ndjson_chunks(cursor, batch_rows=BATCH_ROWS):
+    """
+    yields the cursor's rows as newline-delimited JSON objects, a chunk per batch
+    """
+    columns = [column[0] for column in cursor.description]
+    while True:
+        rows = cursor.fetchmany(batch_rows)
+        if not rows:
+            return
+        yield ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in rows)
+
+
+def gzip_chunks(chunks, level=6):
+    """
+    yields the gzip stream of the text chunks
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode())
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def stream_query(connect, sql_query, params, fmt, gzip=False):
+    """
+    yields the query's rows in fmt ('csv' or 'ndjson'), as bytes. connect opens the connection to read from,
+    which is closed once the rows are written or the client goes away
+    """
+    conn = connect()
+    try:
+        cursor = conn.execute(sql_query, params)
+        chunks = csv_chunks(cursor) if fmt == 'csv' else ndjson_chunks(cursor)
+        if gzip:
+            yield from gzip_chunks(chunks)
+        else:
+            for chunk in chunks:
+                yield chunk.encode()
+    finally:
+        conn.close()
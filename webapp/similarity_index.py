@@ -0,0 +1,131 @@
+import io
+import numpy as np
+
+# Shot diet similarity: each profile row as the share of its attempts in each zone and in each distance
+# bucket (zone_attempts and distance_attempts, from data_processing/create_player_profiles.py), optionally
+# reduced with PCA. Rows are found through an inverted file index: the vectors are clustered with k-means,
+# and a lookup only compares the query with the rows of the clusters whose centroids are nearest to it.
+# data_processing/create_similarity_index.py builds an index per profile table and stores it in the
+# database, so the web app only loads them. This module only uses numpy so the pipeline can import it.
+
+# index level: (profile table, key columns)
+LEVELS = {
+    'player': ('player_profiles', ['player']),
+    'player_team': ('player_profiles_by_team', ['player', 'team']),
+    'player_year': ('player_profiles_by_year', ['player', 'year']),
+    'player_team_year': ('player_profiles_by_team_and_year', ['player', 'team', 'year']),
+}
+# clusters compared per lookup, at least
+N_PROBE = 8
+
+
+def shot_diet_vectors(zone_attempts, distance_attempts):
+    """
+    returns each row's attempts as shares of its attempts, per zone then per distance bucket
+    """
+    blocks = []
+    for counts in (zone_attempts, distance_attempts):
+        counts = np.asarray(counts, dtype=np.float64)
+        totals = counts.sum(axis=1, keepdims=True)
+        blocks.append(np.divide(counts, totals, out=np.zeros_like(counts), where=totals > 0))
+    return np.hstack(blocks)
+
+
+def fit_pca(X, n_components):
+    """
+    returns (mean, components) projecting X onto its first n_components principal components
+    """
+    mean = X.mean(axis=0)
+    _, _, vt = np.linalg.svd(X - mean, full_matrices=False)
+    return mean, vt[:n_components]
+
+
+def _squared_distances(X, Y):
+    distances = (X ** 2).sum(axis=1)[:, None] - 2 * X @ Y.T + (Y ** 2).sum(axis=1)[None, :]
+    return np.maximum(distances, 0)
+
+
+def kmeans(X, n_clusters, iterations=20, seed=0):
+    """
+    returns (centroids, cluster of each row). clusters that end up empty keep their last centroid
+    """
+    rng = np.random.default_rng(seed)
+    centroids = X[rng.choice(len(X), n_clusters, replace=False)]
+    for _ in range(iterations):
+        clusters = _squared_distances(X, centroids).argmin(axis=1)
+        counts = np.bincount(clusters, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, clusters, X)
+        moved = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centroids)
+        if np.allclose(moved, centroids):
+            break
+        centroids = moved
+    return centroids, _squared_distances(X, centroids).argmin(axis=1)
+
+
+def build_index(keys, X, n_components=None, n_lists=None):
+    """
+    returns the index for the rows of X: their keys ({column: array}) and vectors grouped by cluster,
+    the clusters' centroids and where each cluster's rows start
+    """
+    X = np.asarray(X, dtype=np.float64)
+    index = {}
+    if n_components:
+        mean, components = fit_pca(X, n_components)
+        X = (X - mean) @ components.T
+        index['pca_mean'], index['pca_components'] = mean.astype(np.float32), components.astype(np.float32)
+    n_lists = min(n_lists or max(1, int(np.sqrt(len(X)))), len(X))
+    centroids, clusters = kmeans(X, n_lists)
+    order = np.argsort(clusters, kind='stable')
+    index.update({f'key_{column}': np.asarray(values)[order] for column, values in keys.items()})
+    index['vectors'] = X[order].astype(np.float32)
+    index['centroids'] = centroids.astype(np.float32)
+    index['offsets'] = np.concatenate([[0], np.cumsum(np.bincount(clusters, minlength=n_lists))])
+    return index
+
+
+def to_bytes(index):
+    buffer = io.BytesIO()
+    np.savez(buffer, **index)
+    return buffer.getvalue()
+
+
+def from_bytes(data):
+    with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+        return {name: arrays[name] for name in arrays.files}
+
+
+def find_row(index, **key):
+    """
+    returns the row of the index with the given key values, or None
+    """
+    matches = np.ones(len(index['vectors']), dtype=bool)
+    for column, value in key.items():
+        matches &= index[f'key_{column}'] == value
+    rows = np.flatnonzero(matches)
+    return rows[0] if len(rows) else None
+
+
+def search(index, row, k, farthest=False, candidates=None, n_probe=N_PROBE):
+    """
+    returns (rows, distances) of the k rows nearest to (or farthest from) the given row, other than itself,
+    in order of distance. candidates, a mask over the rows, limits the search to those rows and compares
+    all of them, as they're a small slice of the index (e.g. a single team or season)
+    """
+    query = index['vectors'][row]
+    if candidates is not None:
+        rows = np.flatnonzero(candidates)
+    else:
+        offsets = index['offsets']
+        order = np.argsort(((index['centroids'] - query) ** 2).sum(axis=1))
+        if farthest:
+            order = order[::-1]
+        sizes = (offsets[1:] - offsets[:-1])[order]
+        # the n_probe clusters nearest (or farthest), plus more if they don't hold enough rows
+        probed = max(n_probe, np.searchsorted(np.cumsum(sizes), k + 1) + 1)
+        rows = np.concatenate([np.arange(offsets[c], offsets[c + 1]) for c in order[:probed]])
+    rows = rows[rows != row]
+    distances = np.sqrt(((index['vectors'][rows] - query) ** 2).sum(axis=1))
+    picked = np.argsort(distances, kind='stable')
+    picked = picked[-k:] if farthest else picked[:k]
+    return rows[picked], distances[picked]
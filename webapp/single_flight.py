@@ -0,0 +1,82 @@
+import functools
+import threading
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Lets concurrent calls with the same key share one computation.
+
+    The first caller runs the function; callers that arrive while it is still running wait for
+    its result (or exception) instead of running it again. Nothing is kept once the call finishes,
+    so this sits in front of `cache.memoize`, which covers the calls that come after.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stats = {}
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Calls func(*args, **kwargs), or waits for the call already running under key.
+        key is a tuple whose first item names the computation in `stats()`.
+        """
+        with self._lock:
+            stats = self._stats.setdefault(key[0], {'calls': 0, 'executions': 0, 'coalesced': 0})
+            stats['calls'] += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                stats['executions'] += 1
+            else:
+                flight.waiters += 1
+                stats['coalesced'] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func(*args, **kwargs)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+            if flight.waiters:
+                print(f'{key[0]}: {flight.waiters} concurrent requests coalesced')
+        return flight.result
+
+    def wrap(self, func):
+        """
+        Decorator keying calls on the function name and the repr of its arguments.
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (func.__name__, repr(args), repr(sorted(kwargs.items())))
+            return self.do(key, func, *args, **kwargs)
+        return wrapper
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._flights),
+                'functions': {name: dict(stats) for name, stats in self._stats.items()}
+            }
+
+
+# Shared by every callback module, so the stats cover the whole app
+single_flight = SingleFlight()
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+# Snapshots are published by data_processing/publish_snapshot.py as
+#   snapshots/latest.json                  manifest of the newest version
+#   snapshots/<version>/manifest.json
+#   snapshots/<version>/<file>.gz
+
+PART_SIZE = 8 * 1024 * 1024
+
+class SnapshotError(Exception):
+    pass
+
+def fetch_manifest(base_url, version='latest', session=None):
+    session = session or requests
+    url = f'{base_url}/snapshots/latest.json' if version == 'latest' else f'{base_url}/snapshots/{version}/manifest.json'
+    r = session.get(url, timeout=30)
+    r.raise_for_status()
+    return r.json()
+
+def read_local_manifest(dest_path):
+    manifest_path = f'{dest_path}.manifest.json'
+    if not os.path.exists(manifest_path) or not os.path.exists(dest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def supports_ranges(url, session):
+    r = session.head(url, timeout=30)
+    r.raise_for_status()
+    return r.headers.get('Accept-Ranges') == 'bytes'
+
+def download_part(url, part_path, start, end, session):
+    """
+    downloads bytes [start, end] of url into part_path, resuming from whatever is already on disk
+    """
+    expected = end - start + 1
+    have = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if have == expected:
+        return
+    if have > expected:
+        os.remove(part_path)
+        have = 0
+
+    headers = {'Range': f'bytes={start + have}-{end}'}
+    with session.get(url, headers=headers, stream=True, timeout=60) as r:
+        r.raise_for_status()
+        if r.status_code != 206:
+            raise SnapshotError(f'Server ignored range request for {url}')
+        with open(part_path, 'ab') as f:
+            for chunk in r.iter_content(chunk_size=1024 * 1024):
+                f.write(chunk)
+
+    if os.path.getsize(part_path) != expected:
+        raise SnapshotError(f'Incomplete download of {part_path}')
+
+def download_parts(url, size, parts_dir, session, workers=4, part_size=PART_SIZE):
+    """
+    downloads url as a list of part files, fetched in parallel with ranged requests.
+    parts already on disk from an earlier, interrupted download are reused.
+    """
+    os.makedirs(parts_dir, exist_ok=True)
+    ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+    part_paths = [os.path.join(parts_dir, f'part-{i:05d}') for i in range(len(ranges))]
+
+    if len(ranges) > 1 and supports_ranges(url, session):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(download_part, url, part_path, start, end, session)
+                for part_path, (start, end) in zip(part_paths, ranges)
+            ]
+            for future in futures:
+                future.result()
+        return part_paths
+
+    # Single request fallback for small files or servers without range support
+    part_paths = [os.path.join(parts_dir, 'part-full')]
+    with session.get(url, stream=True, timeout=60) as r:
+        r.raise_for_status()
+        with open(part_paths[0], 'wb') as f:
+            for chunk in r.iter_content(chunk_size=1024 * 1024):
+                f.write(chunk)
+    return part_paths
+
+def assemble(file_info, part_paths, dest_path):
+    """
+    streams the downloaded parts through the decompressor into dest_path, verifying both checksums
+    """
+    compressed_sha = hashlib.sha256()
+    uncompressed_sha = hashlib.sha256()
+    compressed_size = 0
+    uncompressed_size = 0
+    decompressor = zlib.decompressobj(wbits=31) if file_info['compression'] == 'gzip' else None
+
+    tmp_path = f'{dest_path}.tmp'
+    with open(tmp_path, 'wb') as out:
+        for part_path in part_paths:
+            with open(part_path, 'rb') as f:
+                while chunk := f.read(1024 * 1024):
+                    compressed_sha.update(chunk)
+                    compressed_size += len(chunk)
+                    data = decompressor.decompress(chunk) if decompressor else chunk
+                    uncompressed_sha.update(data)
+                    uncompressed_size += len(data)
+                    out.write(data)
+        if decompressor:
+            data = decompressor.flush()
+            uncompressed_sha.update(data)
+            uncompressed_size += len(data)
+            out.write(data)
+
+    checks = [
+        (compressed_size, file_info['size']),
+        (compressed_sha.hexdigest(), file_info['sha256']),
+        (uncompressed_size, file_info['uncompressed_size']),
+        (uncompressed_sha.hexdigest(), file_info['uncompressed_sha256']),
+    ]
+    if any(actual != expected for actual, expected in checks):
+        os.remove(tmp_path)
+        raise SnapshotError(f'Checksum mismatch for {file_info["name"]}')
+
+    os.replace(tmp_path, dest_path)
+
+def download_snapshot(base_url, dest_path, manifest=None, file_name='nba_shots.db', workers=4, session=None):
+    """
+    downloads, verifies and decompresses file_name from a published snapshot into dest_path.
+    returns the snapshot's manifest, which is also saved next to dest_path.
+    """
+    session = session or requests.Session()
+    manifest = manifest or fetch_manifest(base_url, session=session)
+    file_info = next(f for f in manifest['files'] if f['name'] == file_name)
+
+    start_time = time.time()
+    dest_dir = os.path.dirname(dest_path) or '.'
+    os.makedirs(dest_dir, exist_ok=True)
+    parts_dir = os.path.join(dest_dir, '.parts', manifest['version'], file_info['name'])
+
+    url = f'{base_url}/snapshots/{file_info["path"]}'
+    part_paths = download_parts(url, file_info['size'], parts_dir, session, workers=workers)
+    print(f'Downloaded snapshot {manifest["version"]} ({file_info["size"]:,} bytes) in {time.time() - start_time:.1f} sec')
+
+    try:
+        assemble(file_info, part_paths, dest_path)
+    finally:
+        # Corrupt parts can't be resumed from, so they're discarded along with good ones
+        shutil.rmtree(os.path.join(dest_dir, '.parts', manifest['version']), ignore_errors=True)
+        if not os.listdir(os.path.join(dest_dir, '.parts')):
+            os.rmdir(os.path.join(dest_dir, '.parts'))
+
+    # written last, and whole, as other processes take a database with a manifest to be complete
+    manifest_path = f'{dest_path}.manifest.json'
+    with open(f'{manifest_path}.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(f'{manifest_path}.tmp', manifest_path)
+    print(f'Snapshot {manifest["version"]} ready in {time.time() - start_time:.1f} sec')
+    return manifest